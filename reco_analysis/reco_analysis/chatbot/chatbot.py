@@ -18,6 +18,15 @@ Usage:
     response = agent.generate_response()
     print(response)
 
+    # or, to receive the response chunk by chunk as it is generated
+    for chunk in agent.stream_response():
+        print(chunk, end="")
+
+    # or, from a coroutine (e.g. to drive many conversations on one event loop)
+    agent = DialogueAgent(role="Doctor", async_mode=True)
+    await agent.areceive("I've been feeling tired.")
+    response = await agent.agenerate_response()
+
 Components:
 ------------
 - DialogueAgent:
@@ -49,11 +58,14 @@ Notes:
 - This code is typically copied from `notebooks/chatbot.ipynb` to `reco_analysis/reco_analysis/chatbot.py`.
 """
 
-import json
+import asyncio
+import concurrent.futures
+import threading
 import typing
+import weakref
 
 from dotenv import load_dotenv
-from langchain.prompts import ChatPromptTemplate
+from langchain.prompts import ChatPromptTemplate, PromptTemplate
 from langchain.schema import (
     AIMessage,
     BaseChatMessageHistory,
@@ -73,12 +85,13 @@ from langchain_openai import ChatOpenAI
 from reco_analysis.chatbot.prompts import (
     ai_guidance_doctor,
     ai_guidance_patient,
+    closing_message_doctor,
+    summarize_history_prompt,
     system_message_doctor,
 )
 from reco_analysis.data_model import data_models
-from reco_analysis.end_detector.end_detector import detect_end
-
-session = data_models.get_session()
+from reco_analysis.end_detector.end_detector import adetect_end, detect_end
+from reco_analysis.summarizer_app.incremental_extractor import IncrementalExtractor
 
 # Load environment variables
 load_dotenv("../.env")
@@ -92,38 +105,230 @@ class CustomMessageConverter(DefaultMessageConverter):
         self.model_class = data_models.Message
 
     def to_sql_model(self, message: BaseMessage, session_id: str) -> data_models.Message:
-        return self.model_class(
-            session_id=session_id, message=json.dumps(message_to_dict(message))
-        )
+        return self.model_class.from_message_dict(session_id, message_to_dict(message))
 
     def get_sql_model_class(self):
         return data_models.Message
 
 
+class CachedChatMessageHistory(BaseChatMessageHistory):
+    """
+    Read-through cache around another chat history (e.g. `SQLChatMessageHistory`).
+
+    The session's messages are loaded from the wrapped history on first access only. New
+    messages are written through to the wrapped history and appended to the cache, so each
+    turn reads the database at most once. `clear()` clears the wrapped history and invalidates
+    the cache. Writes made to the same session by another process are not seen until
+    `invalidate()` is called.
+    """
+
+    def __init__(self, history: BaseChatMessageHistory) -> None:
+        self.history = history
+        self._messages: typing.List[BaseMessage] | None = None
+
+    @property
+    def messages(self) -> typing.List[BaseMessage]:  # type: ignore[override]
+        if self._messages is None:
+            self._messages = self.history.messages
+        # a copy, so that callers mutating the list do not desync the cache from the database
+        return list(self._messages)
+
+    async def aget_messages(self) -> typing.List[BaseMessage]:
+        if self._messages is None:
+            self._messages = await self.history.aget_messages()
+        return list(self._messages)
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    def add_messages(self, messages: typing.Sequence[BaseMessage]) -> None:
+        self.history.add_messages(messages)
+        if self._messages is not None:
+            self._messages.extend(messages)
+
+    async def aadd_messages(self, messages: typing.Sequence[BaseMessage]) -> None:
+        await self.history.aadd_messages(messages)
+        if self._messages is not None:
+            self._messages.extend(messages)
+
+    def clear(self) -> None:
+        self.history.clear()
+        self.invalidate()
+
+    async def aclear(self) -> None:
+        await self.history.aclear()
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """
+        Drops the cached messages, so that the next access reloads them from the wrapped history.
+        """
+        self._messages = None
+
+
+class BufferedChatMessageHistory(CachedChatMessageHistory):
+    """
+    Write-behind variant of `CachedChatMessageHistory`.
+
+    New messages are appended to the cache straight away, but are only written to the wrapped
+    history on `flush()`, in a single transaction. `DialogueAgent` flushes at the end of each turn,
+    and if `flush_interval` is set, a timer also flushes that many seconds after the first
+    unflushed message. Buffered messages are always flushed before the conversation session is
+    marked as completed (see `data_models.PRE_COMPLETION_HOOKS`). Async histories are neither
+    flushed by the timer nor by the completion hook, and must be flushed with `aflush()`.
+    """
+
+    def __init__(
+        self, history: BaseChatMessageHistory, flush_interval: float | None = None
+    ) -> None:
+        super().__init__(history)
+        self.flush_interval = flush_interval
+        self._pending: typing.List[BaseMessage] = []
+        self._lock = threading.RLock()
+        self._timer: threading.Timer | None = None
+
+    @property
+    def messages(self) -> typing.List[BaseMessage]:  # type: ignore[override]
+        with self._lock:
+            if self._messages is None:
+                self._messages = self.history.messages + self._pending
+            return list(self._messages)
+
+    async def aget_messages(self) -> typing.List[BaseMessage]:
+        if self._messages is None:
+            loaded = await self.history.aget_messages()
+            with self._lock:
+                self._messages = loaded + self._pending
+        return list(self._messages)
+
+    def add_messages(self, messages: typing.Sequence[BaseMessage]) -> None:
+        with self._lock:
+            self._pending.extend(messages)
+            if self._messages is not None:
+                self._messages.extend(messages)
+            if (
+                self.flush_interval is not None
+                and self._timer is None
+                and not getattr(self.history, "async_mode", False)
+            ):
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    async def aadd_messages(self, messages: typing.Sequence[BaseMessage]) -> None:
+        self.add_messages(messages)
+
+    def _take_pending(self) -> typing.List[BaseMessage]:
+        pending, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return pending
+
+    def flush(self) -> None:
+        """
+        Writes the buffered messages to the wrapped history in a single transaction.
+        """
+        with self._lock:
+            pending = self._take_pending()
+            if not pending:
+                return
+            try:
+                self.history.add_messages(pending)
+            except Exception:
+                self._pending = pending + self._pending
+                raise
+
+    async def aflush(self) -> None:
+        """
+        Async version of `flush`.
+        """
+        with self._lock:
+            pending = self._take_pending()
+        if not pending:
+            return
+        try:
+            await self.history.aadd_messages(pending)
+        except Exception:
+            with self._lock:
+                self._pending = pending + self._pending
+            raise
+
+    def clear(self) -> None:
+        with self._lock:
+            self._take_pending()
+            super().clear()
+
+    async def aclear(self) -> None:
+        with self._lock:
+            self._take_pending()
+        await super().aclear()
+
+
+# Buffered histories by session ID, so that they can be flushed before the session is completed
+BUFFERED_HISTORIES: typing.Dict[str, "weakref.WeakSet[BufferedChatMessageHistory]"] = {}
+
+
+def flush_session_history(session_id: str) -> None:
+    """
+    Flushes all buffered chat histories of a session (a no-op if there are none).
+
+    Args:
+        session_id (str): The session ID to flush the chat histories for.
+    """
+    for history in list(BUFFERED_HISTORIES.get(str(session_id), ())):
+        if not getattr(history.history, "async_mode", False):
+            history.flush()
+
+
+data_models.PRE_COMPLETION_HOOKS.append(flush_session_history)
+
+
 # For local dev - define the session store (a dictionary to store chat histories in memory)
 SESSION_STORE: typing.Dict[str, BaseChatMessageHistory] = {}
 
-postgres_engine = data_models.get_engine()
+postgres_engine = data_models.get_engine() if use_postgres else None
 
 
-def get_session_history(session_id: str) -> BaseChatMessageHistory:
+def get_session_history(
+    session_id: str,
+    async_mode: bool = False,
+    buffered: bool = False,
+    flush_interval: float | None = None,
+) -> BaseChatMessageHistory:
     """
     Store the chat history for a given session ID.
 
+    With postgres, the history is wrapped in a `CachedChatMessageHistory`, so that the session is
+    loaded from the database once and then served from memory.
+
     Args:
         session_id (str): The session ID to retrieve the chat history for.
+        async_mode (bool, optional): Whether the history will be used through its coroutine API
+            (`aget_messages`, `aadd_messages`, `aclear`). With postgres, this backs the history
+            with the async engine, and the sync API is then unavailable. Defaults to False.
+        buffered (bool, optional): With postgres, whether to buffer new messages and write them
+            in one transaction per turn (see `BufferedChatMessageHistory`). Defaults to False.
+        flush_interval (float, optional): With `buffered`, also flush buffered messages this many
+            seconds after the first unflushed one. Defaults to None (flush per turn only).
 
     Returns:
         BaseChatMessageHistory: The chat history for the session.
     """
 
     if use_postgres:
-        return SQLChatMessageHistory(
+        sql_history = SQLChatMessageHistory(
             session_id=session_id,
-            connection=postgres_engine,
+            connection=data_models.get_async_engine() if async_mode else postgres_engine,
             session_id_field_name="session_id",
             custom_message_converter=CustomMessageConverter(),
         )
+        if not buffered:
+            return CachedChatMessageHistory(sql_history)
+
+        history = BufferedChatMessageHistory(sql_history, flush_interval=flush_interval)
+        BUFFERED_HISTORIES.setdefault(str(session_id), weakref.WeakSet()).add(history)
+        return history
     else:
         if session_id not in SESSION_STORE:
             SESSION_STORE[session_id] = ChatMessageHistory()
@@ -131,6 +336,16 @@ def get_session_history(session_id: str) -> BaseChatMessageHistory:
 
 
 model = ChatOpenAI(temperature=0.7, model_name="gpt-4o-mini")
+summary_model = ChatOpenAI(temperature=0.0, model_name="gpt-4o-mini")
+
+# Thread pool running end detection alongside response generation (speculative end detection)
+END_DETECTION_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=8, thread_name_prefix="end-detection"
+)
+
+# Memory strategies: "full" sends the whole history on every turn, "summary" keeps the latest
+# turns verbatim and folds older turns into a running summary
+MEMORY_STRATEGIES = ["full", "summary"]
 
 
 class DialogueAgent:
@@ -141,7 +356,16 @@ class DialogueAgent:
         system_message: typing.Optional[str] = system_message_doctor,
         model: typing.Optional[ChatOpenAI] = model,
         session_id: typing.Optional[str] = None,
-        end_detection: typing.Optional[bool] = False
+        end_detection: typing.Optional[bool] = False,
+        async_mode: typing.Optional[bool] = False,
+        memory_strategy: typing.Optional[str] = "full",
+        max_recent_turns: typing.Optional[int] = 6,
+        max_context_tokens: typing.Optional[int] = 2000,
+        buffered_history: typing.Optional[bool] = False,
+        flush_interval: typing.Optional[float] = None,
+        speculative_end_detection: typing.Optional[bool] = False,
+        closing_message: typing.Optional[str] = closing_message_doctor,
+        incremental_extraction: typing.Optional[bool] = False,
     ) -> None:
         """
         Initialize the DialogueAgent with a name, system message, guidance after each run of the chat,
@@ -154,13 +378,33 @@ class DialogueAgent:
             patient_id (str, optional): The unique patient ID for the conversation. Defaults to None.
             session_id (str, optional): The unique session ID for the conversation. Defaults to None. If None, a new session ID will be generated. If a session ID is provided, the conversation history will be loaded from the session store (if available)
             end_detection (bool, optional): Whether to detect the end of the conversation based on the last doctor and patient messages. Defaults to False.
+            async_mode (bool, optional): Whether the agent will be driven through its coroutine API (`areceive`, `agenerate_response`, ...). The chat history is then backed by the async engine, so one event loop can drive many conversations concurrently. Defaults to False.
+            memory_strategy (str, optional): How the conversation history is sent to the model, either "full" (the whole history on every turn) or "summary" (the latest turns verbatim, older turns folded into an incrementally updated running summary). Defaults to "full".
+            max_recent_turns (int, optional): With the "summary" strategy, the maximum number of doctor/patient turns kept verbatim. Defaults to 6.
+            max_context_tokens (int, optional): With the "summary" strategy, the token budget for the verbatim turns; older turns beyond the budget are folded into the summary even if fewer than `max_recent_turns` are kept. Defaults to 2000.
+            buffered_history (bool, optional): Whether to buffer new messages and write them to the database in one transaction per turn, instead of one per message. Buffered messages are always flushed before the session is marked as completed. Defaults to False.
+            flush_interval (float, optional): With `buffered_history`, also flush buffered messages this many seconds after the first unflushed one. Defaults to None.
+            speculative_end_detection (bool, optional): With `end_detection`, whether `receive` starts the end detection in the background instead of waiting for it, so that it runs concurrently with the next response generation. If the conversation turns out to be over, the speculative response is discarded and replaced with `closing_message`. Reading `end_conversation` waits for the pending detection. Defaults to False.
+            closing_message (str, optional): The response used in place of a discarded speculative response. Defaults to `closing_message_doctor`.
+            incremental_extraction (bool, optional): Whether the Doctor agent extracts the symptoms, vital signs and medications after each patient message, in the background, so that only the narrative part of the summary is left to generate when the session ends (see `summarizer_app/incremental_extractor.py`). Defaults to False.
         """
         self.system_message = system_message
         self.model = model
         self.end_detection = end_detection
 
-        # Set the patient ID
-        self.patient: data_models.Patient = data_models.Patient.get_by_id(patient_id, session)
+        # Set the memory strategy
+        if memory_strategy not in MEMORY_STRATEGIES:
+            raise ValueError(f"Memory strategy must be one of {MEMORY_STRATEGIES}")
+        self.memory_strategy = memory_strategy
+        self.max_recent_turns = max_recent_turns
+        self.max_context_tokens = max_context_tokens
+        self.summary_chain = (
+            PromptTemplate.from_template(summarize_history_prompt)
+            | summary_model
+            | StrOutputParser()
+        )
+        self.running_summary = ""
+        self.summarized_message_count = 0
 
         # Set the role of the agent and the human
         role = role.capitalize()
@@ -169,21 +413,37 @@ class DialogueAgent:
         self.role = role
         self.human_role = "Doctor" if self.role == "Patient" else "Patient"
 
-        # Generate a unique conversation ID if one is not provided
-        if session_id is None:
-            # create session
-            self.conversation_session = data_models.ConversationSession.new_session(
-                patient_id=self.patient.id, session=session
-            )
-            self.session_id = self.conversation_session.id
-        else:
-            self.session_id = session_id
-            self.conversation_session = data_models.ConversationSession.get_by_id(
-                session_id, session
-            )
+        # The patient and the conversation session are kept detached, as the agent outlives the
+        # database session (e.g. across Streamlit reruns)
+        with data_models.session_scope() as session:
+            # Set the patient ID
+            self.patient: data_models.Patient = data_models.Patient.get_by_id(patient_id, session)
+
+            # Generate a unique conversation ID if one is not provided
+            if session_id is None:
+                # create session
+                self.conversation_session = data_models.ConversationSession.new_session(
+                    patient_id=self.patient.id, session=session
+                )
+                self.session_id = self.conversation_session.id
+            else:
+                self.session_id = session_id
+                self.conversation_session = data_models.ConversationSession.get_by_id(
+                    session_id, session
+                )
+
+        # Extract the summary sections turn by turn
+        self.extractor: IncrementalExtractor | None = None
+        if incremental_extraction and self.role == "Doctor":
+            self.extractor = IncrementalExtractor.for_session(self.conversation_session)
 
         # Initialize chat message history to keep track of the entire conversation
-        self.memory: BaseChatMessageHistory = get_session_history(self.session_id)
+        self.memory: BaseChatMessageHistory = get_session_history(
+            self.session_id,
+            async_mode=async_mode,
+            buffered=buffered_history,
+            flush_interval=flush_interval,
+        )
 
         # Define the prompt template with placeholders for the chat history and human input
         self.prompt = ChatPromptTemplate.from_messages(
@@ -205,7 +465,53 @@ class DialogueAgent:
         self.ai_instruct = ai_guidance_doctor if self.role == "Doctor" else ai_guidance_patient
 
         # Initialize end of conversation flag
-        self.end_conversation = False
+        self.speculative_end_detection = speculative_end_detection
+        self.closing_message = closing_message
+        self._pending_end_detection: concurrent.futures.Future | asyncio.Future | None = None
+        self._end_conversation = False
+
+    @property
+    def end_conversation(self) -> bool:
+        """
+        Whether the conversation has ended. Waits for a pending speculative end detection started
+        by `receive`; one started by `areceive` must be awaited with `aresolve_end_detection`.
+        """
+        self._resolve_end_detection()
+        return self._end_conversation
+
+    @end_conversation.setter
+    def end_conversation(self, value: bool) -> None:
+        self._pending_end_detection = None
+        self._end_conversation = value
+
+    def _resolve_end_detection(self) -> None:
+        """
+        Applies the result of the pending speculative end detection, waiting for it if needed
+        (except for asyncio tasks, which cannot be waited for synchronously).
+        """
+        pending = self._pending_end_detection
+        if pending is None or (isinstance(pending, asyncio.Future) and not pending.done()):
+            return
+        self._pending_end_detection = None
+        self._end_conversation = pending.result()
+
+    async def aresolve_end_detection(self) -> bool:
+        """
+        Awaits the pending speculative end detection, if any.
+
+        Returns:
+            bool: Whether the conversation has ended.
+        """
+        pending = self._pending_end_detection
+        if isinstance(pending, asyncio.Future):
+            await asyncio.wait([pending])
+        elif isinstance(pending, concurrent.futures.Future):
+            await asyncio.wrap_future(pending)
+        self._resolve_end_detection()
+        return self._end_conversation
+
+    def _end_detection_done(self) -> bool:
+        return self._pending_end_detection is None or self._pending_end_detection.done()
 
     def reset(self) -> None:
         """
@@ -213,30 +519,132 @@ class DialogueAgent:
         """
         self.memory.clear()
         self.end_conversation = False
+        self.running_summary = ""
+        self.summarized_message_count = 0
+        if self.extractor is not None:
+            self.extractor.reset()
+
+    @staticmethod
+    def _last_doctor_patient_messages(
+        messages: typing.List[BaseMessage],
+    ) -> typing.Tuple[str, str]:
+        """
+        Extracts the last doctor and patient messages from a list of messages, if the list ends
+        with a doctor message followed by a patient message.
+        """
+        if len(messages) >= 2 and messages[-1].name == "Patient" and messages[-2].name == "Doctor":
+            return messages[-2].content, messages[-1].content
+        return None, None
 
     def get_last_doctor_patient_messages(self) -> typing.Tuple[str, str]:
         """
         Retrieves the last doctor and patient messages from the conversation history.
-        
+
         Returns:
             Tuple[str, str]: A tuple containing the last doctor and patient messages.
         """
-        last_doctor_message = None
-        last_patient_message = None
+        return self._last_doctor_patient_messages(self.memory.messages)
 
-        if len(self.memory.messages) >= 2 and self.memory.messages[-1].name == 'Patient' and self.memory.messages[-2].name == 'Doctor':
-            last_doctor_message = self.memory.messages[-2].content
-            last_patient_message = self.memory.messages[-1].content
+    async def aget_last_doctor_patient_messages(self) -> typing.Tuple[str, str]:
+        """
+        Async version of `get_last_doctor_patient_messages`.
+
+        Returns:
+            Tuple[str, str]: A tuple containing the last doctor and patient messages.
+        """
+        return self._last_doctor_patient_messages(await self.memory.aget_messages())
 
-        return last_doctor_message, last_patient_message
-    
     def detect_and_handle_end(self) -> None:
         """
         Detects the end of the conversation based on the last doctor and patient messages.
         """
         last_doctor_message, last_patient_message = self.get_last_doctor_patient_messages()
         if last_doctor_message and last_patient_message:
-            self.end_conversation = detect_end(doctor_input=last_doctor_message, patient_input=last_patient_message)
+            self.end_conversation = detect_end(
+                doctor_input=last_doctor_message, patient_input=last_patient_message
+            )
+
+    async def adetect_and_handle_end(self) -> None:
+        """
+        Async version of `detect_and_handle_end`.
+        """
+        last_doctor_message, last_patient_message = await self.aget_last_doctor_patient_messages()
+        if last_doctor_message and last_patient_message:
+            self.end_conversation = await adetect_end(
+                doctor_input=last_doctor_message, patient_input=last_patient_message
+            )
+
+    def _split_for_summary(
+        self, messages: typing.List[BaseMessage]
+    ) -> typing.Tuple[typing.List[BaseMessage], typing.List[BaseMessage]]:
+        """
+        Splits the messages into those not yet folded into the running summary, and the latest
+        messages to keep verbatim (at most `max_recent_turns` turns, within `max_context_tokens`).
+        """
+        recent_start = max(
+            len(messages) - 2 * self.max_recent_turns, self.summarized_message_count
+        )
+        while (
+            len(messages) - recent_start > 2
+            and self.model.get_num_tokens_from_messages(messages[recent_start:])
+            > self.max_context_tokens
+        ):
+            recent_start += 2  # fold one more doctor/patient turn into the summary
+        return messages[self.summarized_message_count : recent_start], messages[recent_start:]
+
+    def _with_summary(self, recent: typing.List[BaseMessage]) -> typing.List[BaseMessage]:
+        """
+        Prepends the running summary (if any) to the verbatim messages.
+        """
+        if not self.running_summary:
+            return recent
+        return [
+            SystemMessage(content=f"Summary of the earlier conversation:\n{self.running_summary}")
+        ] + recent
+
+    def _summary_input(self, to_summarize: typing.List[BaseMessage]) -> typing.Dict[str, str]:
+        return {
+            "summary": self.running_summary,
+            "new_lines": "\n".join(f"{msg.name}: {msg.content}" for msg in to_summarize),
+        }
+
+    def get_chat_history(self) -> typing.List[BaseMessage]:
+        """
+        Builds the conversation history to send to the language model, according to the memory
+        strategy. With the "summary" strategy, messages that fall out of the verbatim window are
+        folded into the running summary first.
+
+        Returns:
+            List[BaseMessage]: The messages to use as the chat history.
+        """
+        messages = self.memory.messages
+        if self.memory_strategy == "full":
+            return messages
+
+        to_summarize, recent = self._split_for_summary(messages)
+        if to_summarize:
+            self.running_summary = self.summary_chain.invoke(self._summary_input(to_summarize))
+            self.summarized_message_count += len(to_summarize)
+        return self._with_summary(recent)
+
+    async def aget_chat_history(self) -> typing.List[BaseMessage]:
+        """
+        Async version of `get_chat_history`.
+
+        Returns:
+            List[BaseMessage]: The messages to use as the chat history.
+        """
+        messages = await self.memory.aget_messages()
+        if self.memory_strategy == "full":
+            return messages
+
+        to_summarize, recent = self._split_for_summary(messages)
+        if to_summarize:
+            self.running_summary = await self.summary_chain.ainvoke(
+                self._summary_input(to_summarize)
+            )
+            self.summarized_message_count += len(to_summarize)
+        return self._with_summary(recent)
 
     def generate_response(self) -> str:
         """
@@ -247,18 +655,123 @@ class DialogueAgent:
         """
         # Prepare the input for the model
         input_data = {
-            "chat_history": self.memory.messages,
+            "chat_history": self.get_chat_history(),
             "human_input": self.ai_instruct,
         }
 
-        # Run the chain to generate a response
+        # Run the chain to generate a response (concurrently with a pending end detection)
+        speculative = self._pending_end_detection is not None
         response = self.chain.invoke(input_data)
+        if speculative and self.end_conversation:
+            response = self.closing_message  # discard the speculative response
 
-        # Save the AI's response to the memory
+        # Save the AI's response to the memory, and write the turn to the database
         self.send(response)
+        self.flush_memory()
 
         return response
 
+    def stream_response(self) -> typing.Iterator[str]:
+        """
+        Streams a response based on the conversation history stored in memory, yielding chunks of
+        text as they arrive from the language model. The complete response is saved to memory once
+        the stream is exhausted.
+
+        Yields:
+            str: The next chunk of the response generated by the language model.
+        """
+        # Prepare the input for the model
+        input_data = {
+            "chat_history": self.get_chat_history(),
+            "human_input": self.ai_instruct,
+        }
+
+        # Run the chain, forwarding each chunk as soon as it is generated
+        stream = self.chain.stream(input_data)
+        chunks = []
+        if self._pending_end_detection is not None:
+            # Hold the speculative response back until the pending end detection resolves, so
+            # that a discarded response is never shown
+            for chunk in stream:
+                chunks.append(chunk)
+                if self._end_detection_done():
+                    break
+            if self.end_conversation:
+                stream.close()
+                chunks = [self.closing_message]
+            yield from chunks
+
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+
+        # Save the AI's full response to the memory, and write the turn to the database
+        self.send("".join(chunks))
+        self.flush_memory()
+
+    async def agenerate_response(self) -> str:
+        """
+        Async version of `generate_response`.
+
+        Returns:
+            str: The response generated by the language model.
+        """
+        input_data = {
+            "chat_history": await self.aget_chat_history(),
+            "human_input": self.ai_instruct,
+        }
+        speculative = self._pending_end_detection is not None
+        response = await self.chain.ainvoke(input_data)
+        if speculative and await self.aresolve_end_detection():
+            response = self.closing_message  # discard the speculative response
+        await self.asend(response)
+        await self.aflush_memory()
+        return response
+
+    async def astream_response(self) -> typing.AsyncIterator[str]:
+        """
+        Async version of `stream_response`.
+
+        Yields:
+            str: The next chunk of the response generated by the language model.
+        """
+        input_data = {
+            "chat_history": await self.aget_chat_history(),
+            "human_input": self.ai_instruct,
+        }
+        stream = self.chain.astream(input_data)
+        chunks = []
+        if self._pending_end_detection is not None:
+            async for chunk in stream:
+                chunks.append(chunk)
+                if self._end_detection_done():
+                    break
+            if await self.aresolve_end_detection():
+                await stream.aclose()
+                chunks = [self.closing_message]
+            for chunk in chunks:
+                yield chunk
+
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        await self.asend("".join(chunks))
+        await self.aflush_memory()
+
+    def flush_memory(self) -> None:
+        """
+        Writes any buffered messages to the database (a no-op unless `buffered_history` is set).
+        """
+        if isinstance(self.memory, BufferedChatMessageHistory):
+            self.memory.flush()
+
+    async def aflush_memory(self) -> None:
+        """
+        Async version of `flush_memory`.
+        """
+        if isinstance(self.memory, BufferedChatMessageHistory):
+            await self.memory.aflush()
+
     def send(self, message: str) -> None:
         """
         Adds a new message to the conversation history in memory for the AI role.
@@ -279,9 +792,70 @@ class DialogueAgent:
         # Save the user input to the conversation memory
         self.memory.add_message(HumanMessage(content=message, name=self.human_role))
 
+        if self.extractor is not None:
+            last_doctor_message, last_patient_message = self.get_last_doctor_patient_messages()
+            if last_doctor_message and last_patient_message:
+                self.extractor.submit(last_doctor_message, last_patient_message)
+
+        # Detect end of conversation if the role is Doctor
+        if self.end_detection and self.role == "Doctor":
+            if self.speculative_end_detection:
+                last_doctor_message, last_patient_message = self.get_last_doctor_patient_messages()
+                if last_doctor_message and last_patient_message:
+                    self._pending_end_detection = END_DETECTION_EXECUTOR.submit(
+                        detect_end, last_doctor_message, last_patient_message
+                    )
+            else:
+                self.detect_and_handle_end()
+
+    async def asend(self, message: str) -> None:
+        """
+        Async version of `send`.
+
+        Args:
+            message (str): The content of the message.
+        """
+        await self.memory.aadd_messages([AIMessage(content=message, name=self.role)])
+
+    async def areceive(self, message: str) -> None:
+        """
+        Async version of `receive`.
+
+        Args:
+            message (str): The content of the message.
+        """
+        await self.memory.aadd_messages([HumanMessage(content=message, name=self.human_role)])
+
+        if self.extractor is not None:
+            last_doctor_message, last_patient_message = (
+                await self.aget_last_doctor_patient_messages()
+            )
+            if last_doctor_message and last_patient_message:
+                self.extractor.submit(last_doctor_message, last_patient_message)
+
         # Detect end of conversation if the role is Doctor
-        if self.end_detection:
-            self.detect_and_handle_end() if self.role == 'Doctor' else None
+        if self.end_detection and self.role == "Doctor":
+            if self.speculative_end_detection:
+                last_doctor_message, last_patient_message = (
+                    await self.aget_last_doctor_patient_messages()
+                )
+                if last_doctor_message and last_patient_message:
+                    self._pending_end_detection = asyncio.ensure_future(
+                        adetect_end(last_doctor_message, last_patient_message)
+                    )
+            else:
+                await self.adetect_and_handle_end()
+
+    async def areset(self) -> None:
+        """
+        Async version of `reset`.
+        """
+        await self.memory.aclear()
+        self.end_conversation = False
+        self.running_summary = ""
+        self.summarized_message_count = 0
+        if self.extractor is not None:
+            self.extractor.reset()
 
     def get_history(self) -> typing.List[str]:
         """
@@ -307,12 +881,13 @@ class DialogueAgent:
         Returns:
             str: The role of the speaker of the latest message.
         """
-        if self.memory.messages:
-            latest_message = self.memory.messages[-1]
+        messages = self.memory.messages
+        if messages:
+            latest_message = messages[-1]
             if isinstance(latest_message, HumanMessage):
                 return self.human_role
             elif isinstance(latest_message, AIMessage):
                 return self.role
 
         # If no messages are present
-        return None
\ No newline at end of file
+        return None
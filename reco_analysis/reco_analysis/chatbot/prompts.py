@@ -9,6 +9,8 @@ Attributes:
 - system_message_doctor (str): The initial system message and guidelines for the virtual doctor interacting with heart failure patients.
 - ai_guidance_doctor (str): Instructions for the AI acting as a doctor, ensuring structured and empathetic inquiries.
 - ai_guidance_patient (str): Instructions for the AI acting as a patient, guiding the responses in a realistic and coherent manner.
+- closing_message_doctor (str): The doctor's closing message, used when the conversation ends while a response was being generated.
+- summarize_history_prompt (str): Instructions for folding older turns into the running summary used by the "summary" memory strategy.
 
 Usage:
 ------
@@ -170,4 +172,23 @@ Only ask one simple question at a time. If you have gathered all the required in
 
 ai_guidance_patient = """
 Continue the role play in your role as a heart failure patient. Only answer the last question the doctor asked you. Feel free to embelish a little, but give simple, 1-2 sentence answers. Continue until the doctor ends the conversation.
-"""
\ No newline at end of file
+"""
+closing_message_doctor = (
+    "Thank you for your time today. Keep monitoring your symptoms and adhere to your medication "
+    "regimen, and contact your healthcare provider if you notice any significant changes or "
+    "worsening symptoms. Take care, and goodbye."
+)
+
+summarize_history_prompt = """
+Progressively summarize the lines of a conversation between a virtual doctor and a heart failure patient, adding onto the previous summary and returning a new summary.
+Keep every fact the patient reported (symptoms confirmed or denied, vital sign readings, medications) and note which topics and sub-topics the doctor has already covered, so they are not asked again.
+Be brief and do not add any information that is not present in the conversation.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:
+"""
@@ -1,4 +1,3 @@
-import time
 import typing
 from pathlib import Path
 from typing import TypedDict
@@ -10,9 +9,6 @@ from yaml.loader import SafeLoader
 
 from reco_analysis.chatbot.chatbot import DialogueAgent
 from reco_analysis.data_model import data_models
-from reco_analysis.summarizer_app import summarizer_job
-
-session = data_models.get_session()
 
 
 class CredentialsType(TypedDict):
@@ -51,7 +47,8 @@ def setup_authenticator() -> (
 
     # load the credentials from postgresql db
     usernames = {}
-    all_patients = data_models.Patient.get_all_patients(session)
+    with data_models.session_scope() as session:
+        all_patients = data_models.Patient.get_all_patients(session)
     for patient in all_patients:
         usernames[patient.username] = {
             "email": patient.email,
@@ -83,12 +80,13 @@ def setup_authenticator() -> (
         },
     )
 
-    # from patient_username, get the Patient object
-    patient = (
-        session.query(data_models.Patient)
-        .filter(data_models.Patient.username == patient_username)
-        .first()
-    )
+    # from patient_username, get the Patient object (detached, as it is kept across reruns)
+    with data_models.session_scope() as session:
+        patient = (
+            session.query(data_models.Patient)
+            .filter(data_models.Patient.username == patient_username)
+            .first()
+        )
 
     return authenticator, name, authentication_status, patient_username, patient
 
@@ -123,14 +121,15 @@ def sign_up_new_patient():
             error_placeholder.error("Please fill out all fields")
         else:
             try:
-                new_patient = data_models.Patient.new_patient(
-                    username=username,
-                    first_name=first_name,
-                    last_name=last_name,
-                    email=email,
-                    password=password,
-                    session=session,
-                )
+                with data_models.session_scope() as session:
+                    new_patient = data_models.Patient.new_patient(
+                        username=username,
+                        first_name=first_name,
+                        last_name=last_name,
+                        email=email,
+                        password=password,
+                        session=session,
+                    )
                 error_placeholder.success(
                     f"New patient account created for {new_patient.first_name} with username {new_patient.username}!"
                 )
@@ -149,16 +148,16 @@ def initialize_agent(patient: data_models.Patient) -> DialogueAgent:
     Returns:
         DialogueAgent: The initialized DialogueAgent object.
     """
-    latest_conversation = patient.get_latest_conversation_session()
-    session_id = (
-        None
-        if latest_conversation is None or latest_conversation.completed
-        else latest_conversation.id
-    )
+    with data_models.session_scope() as session:
+        latest_conversation = patient.get_latest_conversation_session(
+            session, incomplete_only=True
+        )
+    session_id = None if latest_conversation is None else latest_conversation.id
     agent = DialogueAgent(
         role="Doctor",
         patient_id=patient.id,
         session_id=session_id,
+        incremental_extraction=True,
     )
     latest_message_role = agent.get_latest_message_role()
     st.session_state.turn = (
@@ -181,33 +180,20 @@ def get_icon(role: str) -> str:
     return "ai" if role == "Doctor" else "user"
 
 
-def stream_response(role: str, response_text: str):
+def stream_response(role: str, response_stream: typing.Iterable[str]) -> str:
     """
-    Stream the response text line by line with a delay, respecting newlines in the text.
+    Stream the response into the chat as chunks arrive from the language model.
 
     Args:
         role (str): The role of the speaker ("Doctor" or "Patient").
-        response_text (str): The full response text to stream.
+        response_stream (Iterable[str]): The chunks of the response, e.g. from
+            `DialogueAgent.stream_response`.
+
+    Returns:
+        str: The full response text.
     """
     with st.chat_message(role, avatar=get_icon(role)):
-        response_placeholder = st.empty()
-        full_response = ""
-        
-        for line in response_text.splitlines():  # Split the text by lines first
-            if line.strip():  # Process non-empty lines
-                words = line.split()
-                for word in words:
-                    full_response += word + " "
-                    response_placeholder.markdown(full_response)
-                    time.sleep(0.05)
-                full_response += "\n"  # Add newline after each processed line
-            else:
-                full_response += "\n"  # Preserve blank lines
-                response_placeholder.markdown(full_response)
-                time.sleep(0.05)
-        
-        # Ensure the final output respects the original formatting
-        response_placeholder.markdown(full_response)
+        return st.write_stream(response_stream)
 
 
 def display_chat_history(agent: DialogueAgent):
@@ -238,9 +224,8 @@ def handle_user_input(agent: DialogueAgent, prompt: str | None):
             st.markdown(prompt)
         st.session_state.turn = "Doctor"  # Next turn is for the doctor
 
-        # Generate and display doctor's response (including adding to memory)
-        response = agent.generate_response()  # Generate the response
-        stream_response("Doctor", response)
+        # Stream and display doctor's response (including adding to memory)
+        stream_response("Doctor", agent.stream_response())
         st.session_state.turn = "Patient"  # Next turn is for the patient
 
 
@@ -259,8 +244,8 @@ def end_conversation(agent: DialogueAgent, session):
     )
     convo_session.mark_as_completed(session)
 
-    # also generate a summary email
-    summarizer_job.summarize_conversation(conversation_session_id=convo_session.id)
+    # also generate a summary email, in the background (see `summarizer_worker`)
+    data_models.SummaryJob.enqueue(convo_session.id, session)
 
 
 def reset_chat():
@@ -290,6 +275,7 @@ def export_conversation_history(agent):
         for message in agent.get_history():
             file.write(message + "\n")
 
+
 def main():
     """
     Main function to set up and run the Streamlit interface for the chatbot,
@@ -339,15 +325,15 @@ def main():
             key="end_conversation",
             disabled=st.session_state.conversation_ended,
         ):
-            end_conversation(agent, session)
+            with data_models.session_scope() as session:
+                end_conversation(agent, session)
 
         # Display initial doctor's message if not already shown
         if st.session_state.turn == "Doctor":
-            initial_response = agent.generate_response()
+            stream_response("Doctor", agent.stream_response())
             # Remove the initial message from the memory to avoid duplication
             agent.memory.messages.pop()
             st.session_state.turn = "Patient"  # After the doctor speaks, it's the patient's turn
-            stream_response("Doctor", initial_response)
 
         # Accept user input and process the conversation flow
         if not st.session_state.conversation_ended:
@@ -375,4 +361,9 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # the script runs once per user interaction: release the thread's database session, so
+        # that loaded objects do not outlive the run (the requests use `session_scope`)
+        data_models.remove_session()
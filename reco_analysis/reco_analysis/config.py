@@ -19,4 +19,6 @@ TRANSCRIPTS_EVALUATION_DIR = EVALUATION_DIR / "transcripts"
 SUMMARIES_EVALUATION_DIR = EVALUATION_DIR / "summaries"
 RAW_DATA_DIR = DATA_DIR / "raw"
 INTERIM_DATA_DIR = DATA_DIR / "interim"
-PROCESSED_DATA_DIR = DATA_DIR / "processed"
\ No newline at end of file
+PROCESSED_DATA_DIR = DATA_DIR / "processed"
+
+MODELS_DIR = PROJ_ROOT / "models"
\ No newline at end of file
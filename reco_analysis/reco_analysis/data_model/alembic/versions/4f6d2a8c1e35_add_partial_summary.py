@@ -0,0 +1,26 @@
+"""add partial summary
+
+Revision ID: 4f6d2a8c1e35
+Revises: 9b1e4c2d7a10
+Create Date: 2026-10-18 14:02:47.193520
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4f6d2a8c1e35"
+down_revision: Union[str, None] = "9b1e4c2d7a10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("conversation_sessions", sa.Column("partial_summary", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("conversation_sessions", "partial_summary")
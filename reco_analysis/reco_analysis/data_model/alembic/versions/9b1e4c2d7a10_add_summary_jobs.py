@@ -0,0 +1,46 @@
+"""add summary jobs
+
+Revision ID: 9b1e4c2d7a10
+Revises: 357f7dfd6ee4
+Create Date: 2026-10-18 10:12:31.418262
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9b1e4c2d7a10"
+down_revision: Union[str, None] = "357f7dfd6ee4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "summary_jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("conversation_session_id", sa.UUID(), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("max_attempts", sa.Integer(), nullable=False),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("run_after", sa.DateTime(), server_default=sa.text("now()"), nullable=True),
+        sa.Column("locked_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["conversation_session_id"],
+            ["conversation_sessions.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # workers look up due jobs by status and time
+    op.create_index("ix_summary_jobs_status_run_after", "summary_jobs", ["status", "run_after"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_summary_jobs_status_run_after", table_name="summary_jobs")
+    op.drop_table("summary_jobs")
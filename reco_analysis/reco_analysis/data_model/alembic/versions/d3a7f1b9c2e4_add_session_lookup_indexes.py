@@ -0,0 +1,50 @@
+"""add session lookup indexes
+
+Revision ID: d3a7f1b9c2e4
+Revises: 4f6d2a8c1e35
+Create Date: 2026-10-18 15:21:09.562871
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d3a7f1b9c2e4"
+down_revision: Union[str, None] = "4f6d2a8c1e35"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # built concurrently (outside of the migration transaction) so that the chatbot can keep
+    # writing messages while the indexes are built on large tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_message_store_session_id_id",
+            "message_store",
+            ["session_id", "id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_conversation_sessions_patient_id_created_at",
+            "conversation_sessions",
+            ["patient_id", sa.text("created_at DESC")],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_conversation_sessions_patient_id_created_at",
+            table_name="conversation_sessions",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_message_store_session_id_id",
+            table_name="message_store",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,73 @@
+"""add message role, content and turn index
+
+Revision ID: e5b8c3d1f7a2
+Revises: d3a7f1b9c2e4
+Create Date: 2026-10-18 16:08:31.417206
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e5b8c3d1f7a2"
+down_revision: Union[str, None] = "d3a7f1b9c2e4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# sessions backfilled per transaction, so that large tables are not locked for long
+BACKFILL_BATCH_SIZE = 1000
+
+# the role mapping of `data_models.MESSAGE_ROLES`
+BACKFILL_MESSAGES = sa.text(
+    """
+    UPDATE message_store m
+    SET role = CASE m.message::json->>'type'
+            WHEN 'ai' THEN 'Doctor' WHEN 'human' THEN 'Patient' ELSE 'Unknown' END,
+        content = CASE json_typeof(m.message::json->'data'->'content')
+            WHEN 'string' THEN m.message::json->'data'->>'content' END,
+        turn_index = t.turn_index
+    FROM (
+        SELECT id, row_number() OVER (PARTITION BY session_id ORDER BY id) - 1 AS turn_index
+        FROM message_store
+        WHERE session_id = ANY(:session_ids)
+    ) t
+    WHERE m.id = t.id
+    """
+)
+
+
+def upgrade() -> None:
+    op.add_column("message_store", sa.Column("role", sa.String(length=20), nullable=True))
+    op.add_column("message_store", sa.Column("content", sa.Text(), nullable=True))
+    op.add_column("message_store", sa.Column("turn_index", sa.Integer(), nullable=True))
+
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        last_session_id = None
+        while True:
+            session_ids = (
+                connection.execute(
+                    sa.text(
+                        "SELECT id FROM conversation_sessions "
+                        "WHERE :last_session_id IS NULL OR id > :last_session_id "
+                        "ORDER BY id LIMIT :batch_size"
+                    ).bindparams(sa.bindparam("last_session_id", type_=sa.UUID)),
+                    {"last_session_id": last_session_id, "batch_size": BACKFILL_BATCH_SIZE},
+                )
+                .scalars()
+                .all()
+            )
+            if not session_ids:
+                break
+            # each statement is committed on its own
+            connection.execute(BACKFILL_MESSAGES, {"session_ids": session_ids})
+            last_session_id = session_ids[-1]
+
+
+def downgrade() -> None:
+    op.drop_column("message_store", "turn_index")
+    op.drop_column("message_store", "content")
+    op.drop_column("message_store", "role")
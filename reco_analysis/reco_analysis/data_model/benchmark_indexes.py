@@ -0,0 +1,173 @@
+"""
+Benchmark the per-turn history query and the latest-session query, before and after the
+`(session_id, id)` and `(patient_id, created_at DESC)` indexes (migration d3a7f1b9c2e4).
+
+For each size, `conversation_sessions` and `message_store` tables are created in a scratch schema
+(`index_benchmark` by default, dropped at the end unless `--keep`) and seeded server-side with
+`generate_series`. Messages of concurrent sessions are interleaved, as in production, so a
+session's messages are spread across the table. Each query is run for random sessions and
+patients, first without and then with the indexes, and the median and p95 latencies are reported.
+
+Usage:
+    python -m reco_analysis.data_model.benchmark_indexes --messages 1000000 --messages 10000000
+"""
+
+import random
+import statistics
+import time
+import typing
+
+import typer
+from loguru import logger
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection
+
+from reco_analysis.data_model.data_models import DB_URL
+
+app = typer.Typer()
+
+# the queries run by SQLChatMessageHistory and by the patient's latest session lookup
+HISTORY_QUERY = "SELECT message FROM message_store WHERE session_id = :session_id ORDER BY id"
+LATEST_SESSION_QUERY = (
+    "SELECT id FROM conversation_sessions WHERE patient_id = :patient_id "
+    "ORDER BY created_at DESC LIMIT 1"
+)
+
+MESSAGE = (
+    '{"type": "human", "data": {"content": "I have been feeling a bit more tired than usual, '
+    'and my ankles are a little swollen.", "name": "Patient", "type": "human"}}'
+)
+
+
+def seed(
+    connection: Connection,
+    schema: str,
+    messages: int,
+    messages_per_session: int,
+    sessions_per_patient: int,
+) -> typing.Tuple[int, int]:
+    """Create and seed the benchmark tables, without the indexes. Returns the session and patient
+    counts."""
+    sessions = max(1, messages // messages_per_session)
+    patients = max(1, sessions // sessions_per_patient)
+    connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+    connection.execute(text(f"CREATE SCHEMA {schema}"))
+    connection.execute(text(f"SET search_path TO {schema}"))
+    connection.execute(
+        text(
+            "CREATE TABLE conversation_sessions (id UUID PRIMARY KEY, seq INTEGER NOT NULL, "
+            "patient_id INTEGER NOT NULL, created_at TIMESTAMP NOT NULL, completed BOOLEAN)"
+        )
+    )
+    connection.execute(
+        text(
+            "INSERT INTO conversation_sessions "
+            "SELECT gen_random_uuid(), g, g % :patients, "
+            "now() - (:sessions - g) * interval '1 minute', true "
+            "FROM generate_series(0, :sessions - 1) g"
+        ),
+        {"sessions": sessions, "patients": patients},
+    )
+    # only used to seed the messages
+    connection.execute(text("CREATE UNIQUE INDEX seed_seq ON conversation_sessions (seq)"))
+    connection.execute(
+        text(
+            "CREATE TABLE message_store (id SERIAL PRIMARY KEY, "
+            "session_id UUID NOT NULL REFERENCES conversation_sessions (id), "
+            "message TEXT NOT NULL, timestamp TIMESTAMP DEFAULT now())"
+        )
+    )
+    connection.execute(
+        text(
+            "INSERT INTO message_store (session_id, message) "
+            "SELECT s.id, :message FROM generate_series(0, :messages - 1) g "
+            "JOIN conversation_sessions s ON s.seq = g % :sessions ORDER BY g"
+        ),
+        {"messages": messages, "sessions": sessions, "message": MESSAGE},
+    )
+    connection.execute(text("DROP INDEX seed_seq"))
+    connection.execute(text("VACUUM ANALYZE conversation_sessions"))
+    connection.execute(text("VACUUM ANALYZE message_store"))
+    return sessions, patients
+
+
+def create_indexes(connection: Connection) -> None:
+    """Create the indexes of migration d3a7f1b9c2e4."""
+    connection.execute(
+        text("CREATE INDEX ix_message_store_session_id_id ON message_store (session_id, id)")
+    )
+    connection.execute(
+        text(
+            "CREATE INDEX ix_conversation_sessions_patient_id_created_at "
+            "ON conversation_sessions (patient_id, created_at DESC)"
+        )
+    )
+    connection.execute(text("ANALYZE conversation_sessions"))
+    connection.execute(text("ANALYZE message_store"))
+
+
+def time_query(
+    connection: Connection, query: str, params: typing.List[dict]
+) -> typing.Tuple[float, float]:
+    """Run a query once per parameter set. Returns the median and p95 latencies in ms."""
+    latencies = []
+    for each in params:
+        start = time.perf_counter()
+        connection.execute(text(query), each).fetchall()
+        latencies.append(1000 * (time.perf_counter() - start))
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(0.95 * (len(latencies) - 1))]
+
+
+@app.command()
+def main(
+    messages: typing.List[int] = typer.Option([1_000_000, 10_000_000]),
+    messages_per_session: int = 40,
+    sessions_per_patient: int = 10,
+    queries: int = 50,
+    database_url: str = DB_URL,
+    schema: str = "index_benchmark",
+    keep: bool = False,
+):
+    engine = create_engine(database_url, isolation_level="AUTOCOMMIT")
+    with engine.connect() as connection:
+        try:
+            for count in messages:
+                start = time.perf_counter()
+                sessions, patients = seed(
+                    connection, schema, count, messages_per_session, sessions_per_patient
+                )
+                logger.info(
+                    f"Seeded {count} messages, {sessions} sessions, {patients} patients "
+                    f"in {time.perf_counter() - start:.0f}s"
+                )
+                session_ids = [
+                    {"session_id": row[0]}
+                    for row in connection.execute(
+                        text("SELECT id FROM conversation_sessions ORDER BY random() LIMIT :n"),
+                        {"n": queries},
+                    )
+                ]
+                patient_ids = [{"patient_id": random.randrange(patients)} for _ in range(queries)]
+
+                for label in ["before", "after"]:
+                    if label == "after":
+                        start = time.perf_counter()
+                        create_indexes(connection)
+                        logger.info(f"Created the indexes in {time.perf_counter() - start:.0f}s")
+                    for name, query, params in [
+                        ("history", HISTORY_QUERY, session_ids),
+                        ("latest session", LATEST_SESSION_QUERY, patient_ids),
+                    ]:
+                        median, p95 = time_query(connection, query, params)
+                        logger.info(
+                            f"{count:>10} messages, {name:<14} {label:<6}: "
+                            f"median {median:.2f} ms, p95 {p95:.2f} ms"
+                        )
+        finally:
+            if not keep:
+                connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,114 @@
+"""
+Size the connection pool for N concurrent patients.
+
+Each simulated patient runs a conversation in a thread of its own: every turn, it loads the
+session's history and stores the doctor and patient messages in one short transaction (as the
+chatbot does), then "thinks" for a while without holding a connection (the LLM call and the
+patient typing). The pool checkout waits are reported for each number of patients, with the given
+pool settings: the pool is large enough while the p95 wait stays near zero and no checkout times
+out.
+
+The tables are created in a scratch schema (`pool_benchmark` by default), dropped at the end.
+
+Usage:
+    python -m reco_analysis.data_model.benchmark_pool --patients 10 --patients 50 --pool-size 5
+"""
+
+import concurrent.futures
+import time
+import typing
+import uuid
+
+import typer
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+from loguru import logger
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from reco_analysis.data_model import data_models
+from reco_analysis.data_model.pool_metrics import MeteredQueuePool
+
+app = typer.Typer()
+
+
+def simulate_patient(engine: Engine, turns: int, think_time: float) -> None:
+    """Runs one conversation of `turns` doctor/patient exchanges."""
+    with Session(engine) as session, session.begin():
+        session.execute(
+            text("INSERT INTO patients (id, username) VALUES (:id, :username)"),
+            {"id": (patient_id := uuid.uuid4().int % 2**31), "username": str(patient_id)},
+        )
+        session_id = uuid.uuid4()
+        session.add(data_models.ConversationSession(id=session_id, patient_id=patient_id))
+
+    for turn in range(turns):
+        with Session(engine) as session, session.begin():
+            session.query(data_models.Message.role, data_models.Message.content).filter(
+                data_models.Message.session_id == session_id
+            ).order_by(data_models.Message.id).all()
+            session.add_all(
+                data_models.Message.from_message_dict(session_id, message_to_dict(message))
+                for message in [
+                    AIMessage(content=f"How are you feeling today? ({turn})"),
+                    HumanMessage(content="A bit tired, and my ankles are swollen."),
+                ]
+            )
+        time.sleep(think_time)
+
+
+@app.command()
+def main(
+    patients: typing.List[int] = typer.Option([10, 50, 100]),
+    turns: int = 20,
+    think_time: float = 0.5,
+    pool_size: int = data_models.POOL_SIZE,
+    max_overflow: int = data_models.MAX_OVERFLOW,
+    pool_timeout: float = data_models.POOL_TIMEOUT,
+    database_url: str = data_models.DB_URL,
+    schema: str = "pool_benchmark",
+):
+    # the patients table without its constraints, so that patients can be inserted directly
+    with create_engine(database_url, isolation_level="AUTOCOMMIT").connect() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+        connection.execute(text(f"SET search_path TO {schema}"))
+        connection.execute(text("CREATE TABLE patients (id INTEGER PRIMARY KEY, username TEXT)"))
+        for table in [data_models.ConversationSession, data_models.Message]:
+            table.__table__.create(connection)
+
+    engine = create_engine(
+        database_url,
+        poolclass=MeteredQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_pre_ping=data_models.POOL_PRE_PING,
+        connect_args={"options": f"-csearch_path={schema}"},
+    )
+    try:
+        for count in patients:
+            MeteredQueuePool.metrics.reset()
+            start = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=count) as executor:
+                futures = [
+                    executor.submit(simulate_patient, engine, turns, think_time)
+                    for _ in range(count)
+                ]
+                failed = sum(1 for future in futures if future.exception() is not None)
+            metrics = MeteredQueuePool.metrics.snapshot()
+            logger.info(
+                f"{count:>4} patients, pool {pool_size}+{max_overflow}: "
+                f"{metrics['checkouts']} checkouts, {metrics['timeouts']} timeouts, "
+                f"wait p50 {metrics['p50_wait_ms']:.1f} ms, p95 {metrics['p95_wait_ms']:.1f} ms, "
+                f"max {metrics['max_wait_ms']:.1f} ms, {failed} failed conversations, "
+                f"{time.perf_counter() - start:.1f}s"
+            )
+    finally:
+        engine.dispose()
+        with create_engine(database_url, isolation_level="AUTOCOMMIT").connect() as connection:
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+
+
+if __name__ == "__main__":
+    app()
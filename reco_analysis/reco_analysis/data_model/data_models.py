@@ -1,3 +1,5 @@
+import contextlib
+import datetime
 import json
 import os
 import typing
@@ -11,16 +13,31 @@ from sqlalchemy import (
     DateTime,
     Engine,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
     create_engine,
     func,
+    select,
 )
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session, relationship, sessionmaker
+from sqlalchemy.orm import (
+    Session,
+    load_only,
+    object_session,
+    raiseload,
+    relationship,
+    scoped_session,
+    sessionmaker,
+)
 
+from reco_analysis.data_model.pool_metrics import (
+    MeteredAsyncAdaptedQueuePool,
+    MeteredQueuePool,
+)
 from reco_analysis.summarizer_app import data_type as summarizer_data_type
 
 env_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.env"))
@@ -45,27 +62,129 @@ def connection_env_vars_available() -> bool:
 DB_URL = (
     f"postgresql://{USER}:{PASSWORD}@{HOST}:{PORT}/{DB}" if connection_env_vars_available() else ""
 )
+ASYNC_DB_URL = (
+    f"postgresql+asyncpg://{USER}:{PASSWORD}@{HOST}:{PORT}/{DB}"
+    if connection_env_vars_available()
+    else ""
+)
+
+# Connection pool of each engine. Size it with the pool metrics (see `get_pool_metrics` and
+# `benchmark_pool.py`): each request holds a connection while it runs a query or a transaction.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # connections kept open
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # extra connections opened under load
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a connection
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds, -1 to never recycle
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ["1", "true", "yes"]
 
 ENGINE: Engine | None = None
-SESSION: Session | None = None
+ASYNC_ENGINE: AsyncEngine | None = None
+SESSION_FACTORY: sessionmaker | None = None
+SCOPED_SESSION: scoped_session | None = None
+
+
+def pool_options() -> dict:
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
 
 
 def get_engine(db_url: str = DB_URL) -> "Engine":
     global ENGINE
     if ENGINE is None:
-        ENGINE = create_engine(db_url)
+        ENGINE = create_engine(db_url, poolclass=MeteredQueuePool, **pool_options())
     return ENGINE
 
 
+def get_async_engine(db_url: str = ASYNC_DB_URL) -> AsyncEngine:
+    """Get the engine used by coroutine code paths (e.g. the async chat history), so that a
+    single event loop can drive many conversations without blocking on the database."""
+    global ASYNC_ENGINE
+    if ASYNC_ENGINE is None:
+        ASYNC_ENGINE = create_async_engine(
+            db_url, poolclass=MeteredAsyncAdaptedQueuePool, **pool_options()
+        )
+    return ASYNC_ENGINE
+
+
+def get_pool_metrics() -> dict:
+    """Get the checkout wait metrics and the current state of the connection pools.
+
+    Returns:
+        dict: For the "sync" and "async" pools, the number of checkouts and timeouts, the
+            mean, p50, p95, p99 and max checkout waits in ms, and the size, number of checked
+            out connections and overflow of the pool (if the engine was created).
+    """
+    metrics = {}
+    for name, engine, poolclass in [
+        ("sync", ENGINE, MeteredQueuePool),
+        ("async", ASYNC_ENGINE and ASYNC_ENGINE.sync_engine, MeteredAsyncAdaptedQueuePool),
+    ]:
+        metrics[name] = poolclass.metrics.snapshot()
+        if engine is not None and isinstance(engine.pool, poolclass):
+            metrics[name].update(
+                size=engine.pool.size(),
+                checked_out=engine.pool.checkedout(),
+                overflow=engine.pool.overflow(),
+            )
+    return metrics
+
+
+def get_session_factory() -> sessionmaker:
+    global SESSION_FACTORY
+    if SESSION_FACTORY is None:
+        SESSION_FACTORY = sessionmaker(bind=get_engine())
+    return SESSION_FACTORY
+
+
 def get_session() -> Session:
-    global SESSION
-    if SESSION is None:
-        SESSION = sessionmaker(bind=get_engine())()
-    return SESSION
+    """Get the current thread's session. Prefer `session_scope`, which gives each request a
+    session of its own; otherwise, call `remove_session` at the end of each request, so that the
+    objects loaded in the session are released."""
+    global SCOPED_SESSION
+    if SCOPED_SESSION is None:
+        SCOPED_SESSION = scoped_session(get_session_factory())
+    return SCOPED_SESSION()
+
+
+def remove_session() -> None:
+    """Close the current thread's session (see `get_session`), if any."""
+    if SCOPED_SESSION is not None:
+        SCOPED_SESSION.remove()
+
+
+@contextlib.contextmanager
+def session_scope() -> typing.Iterator[Session]:
+    """A session for one request or unit of work: committed at the end of the block, rolled back
+    on error, and always closed, which returns its connection to the pool.
+
+    Objects loaded in the session are not expired on commit, so that their loaded attributes can
+    still be read after the block (detached from the session).
+
+    Usage:
+        with data_models.session_scope() as session:
+            patient = data_models.Patient.get_by_id(patient_id, session)
+    """
+    session = get_session_factory()(expire_on_commit=False)
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
 
 Base = declarative_base()
 
+# Callbacks run with the session id right before a conversation session is marked as completed,
+# e.g. to flush buffered chat messages so that the stored transcript is complete
+PRE_COMPLETION_HOOKS: list[typing.Callable[[uuid.UUID], None]] = []
+
 default_hcp_email = "mike.khor@berkeley.edu"  # for now
 
 
@@ -93,7 +212,8 @@ class Patient(Base):
         # after init, also set healthcare_provider_id to default_hcp, if not set
         if not self.healthcare_provider_id:
             try:
-                hcp = HealthcareProvider.get_by_email(default_hcp_email, get_session())
+                with session_scope() as session:
+                    hcp = HealthcareProvider.get_by_email(default_hcp_email, session)
                 self.healthcare_provider_id = hcp.id
             except ValueError:
                 pass
@@ -147,12 +267,28 @@ class Patient(Base):
     def get_all_patients(session: Session) -> list["Patient"]:
         return session.query(Patient).all()
 
-    def get_latest_conversation_session(self) -> "ConversationSession | None":
+    def get_latest_conversation_session(
+        self, session: Session | None = None, incomplete_only: bool = False
+    ) -> "ConversationSession | None":
         """Get the latest conversation session for the patient. If no session
-        exists, returns None."""
-        if not self.conversation_sessions:
-            return None
-        return self.conversation_sessions[-1]
+        exists, returns None.
+
+        Args:
+            session (Session, optional): The database session. Defaults to the patient's session.
+            incomplete_only (bool, optional): Only consider the sessions not completed yet.
+        """
+        return ConversationSession.get_latest(
+            self.id, session or object_session(self) or get_session(), incomplete_only
+        )
+
+    def get_recent_conversation_sessions(
+        self, limit: int = 10, session: Session | None = None
+    ) -> list["ConversationSession"]:
+        """Get the headers of the patient's most recent conversation sessions, newest first,
+        without their messages or summaries. See `ConversationSession.get_recent_headers`."""
+        return ConversationSession.get_recent_headers(
+            self.id, session or object_session(self) or get_session(), limit
+        )
 
 
 class HealthcareProvider(Base):
@@ -218,11 +354,19 @@ class ConversationSession(Base):
     summary = Column(
         Text, nullable=True
     )  # Summary of the session created by the summarization engine
+    partial_summary = Column(
+        Text, nullable=True
+    )  # Sections extracted turn by turn during the session, see `incremental_extractor`
 
     patient = relationship("Patient", back_populates="conversation_sessions", uselist=False)
-    messages = relationship("Message", back_populates="session")
+    messages = relationship("Message", back_populates="session", order_by="Message.id")
     completed = Column(Boolean, default=False)
 
+    # a patient's latest session is looked up on every login
+    __table_args__ = (
+        Index("ix_conversation_sessions_patient_id_created_at", patient_id, created_at.desc()),
+    )
+
     def __repr__(self):
         return (
             f"ConversationSession(patient_id='{self.patient_id}', created_at='{self.created_at}', "
@@ -238,6 +382,44 @@ class ConversationSession(Base):
             raise ValueError(f"Session with id {session_id} not found")
         return ret
 
+    @staticmethod
+    def get_latest(
+        patient_id: int, session: Session, incomplete_only: bool = False
+    ) -> "ConversationSession | None":
+        """Get a patient's latest conversation session, or None if there is none. A single row
+        is read, using the (patient_id, created_at DESC) index."""
+        query = session.query(ConversationSession).filter(
+            ConversationSession.patient_id == patient_id
+        )
+        if incomplete_only:
+            query = query.filter(ConversationSession.completed.isnot(True))
+        return query.order_by(ConversationSession.created_at.desc()).first()
+
+    @staticmethod
+    def get_recent_headers(
+        patient_id: int, session: Session, limit: int = 10
+    ) -> list["ConversationSession"]:
+        """Get a patient's most recent conversation sessions, newest first, with only their
+        header columns loaded. The summaries are loaded if accessed; the messages are not
+        loaded and raise if accessed."""
+        return (
+            session.query(ConversationSession)
+            .filter(ConversationSession.patient_id == patient_id)
+            .options(
+                load_only(
+                    ConversationSession.id,
+                    ConversationSession.patient_id,
+                    ConversationSession.created_at,
+                    ConversationSession.updated_at,
+                    ConversationSession.completed,
+                ),
+                raiseload(ConversationSession.messages),
+            )
+            .order_by(ConversationSession.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+
     @staticmethod
     def new_session(patient_id: int, session: Session) -> "ConversationSession":
         new_session = ConversationSession(patient_id=patient_id)
@@ -247,16 +429,42 @@ class ConversationSession(Base):
 
     def mark_as_completed(self, session: Session) -> None:
         """Mark the session as completed once the conversation is done."""
+        for hook in PRE_COMPLETION_HOOKS:
+            hook(self.id)
         self.completed = True
         session.commit()
 
     def get_transcript(self) -> list[str]:
+        """Get the transcript lines of the session. Unless the messages are already loaded, only
+        their role and content columns are read."""
+        session = object_session(self)
+        if "messages" in self.__dict__ or session is None:
+            messages = self.messages
+        else:
+            messages = (
+                session.query(Message)
+                .options(load_only(Message.id, Message.role, Message.content))
+                .filter(Message.session_id == self.id)
+                .order_by(Message.id)
+                .all()
+            )
         ret = []
-        for message in self.messages:
+        for message in messages:
             message = typing.cast(Message, message)
             ret.append(message.as_transcript_line())
         return ret
 
+    def get_end_time(self) -> datetime.datetime | None:
+        """Get the timestamp of the last message of the session, without loading the messages."""
+        session = object_session(self)
+        if "messages" in self.__dict__ or session is None:
+            return max((message.timestamp for message in self.messages), default=None)
+        return (
+            session.query(func.max(Message.timestamp))
+            .filter(Message.session_id == self.id)
+            .scalar()
+        )
+
     def save_summary(
         self,
         summary: summarizer_data_type.TranscriptSummary,
@@ -271,6 +479,17 @@ class ConversationSession(Base):
         self.summary = json.dumps(to_save)
         session.commit()
 
+    @staticmethod
+    def save_partial_summary(
+        session_id: uuid.UUID, partial_summary: dict, session: Session
+    ) -> None:
+        """Save the sections extracted so far, without loading the session."""
+        session.query(ConversationSession).filter(ConversationSession.id == session_id).update(
+            {ConversationSession.partial_summary: json.dumps(partial_summary)},
+            synchronize_session=False,
+        )
+        session.commit()
+
     @property
     def transcript_summary(self) -> summarizer_data_type.TranscriptSummary:
         """Get the transcript summary from the session."""
@@ -293,6 +512,10 @@ class ConversationSession(Base):
             raise ValueError("Response metadata not available")
 
 
+# Transcript roles by langchain message type
+MESSAGE_ROLES = {"ai": "Doctor", "human": "Patient"}
+
+
 class Message(Base):
     __tablename__ = "message_store"
 
@@ -301,16 +524,46 @@ class Message(Base):
     # typical message is quite long, and we have to account for worst case
     message = Column(Text, nullable=False)
     timestamp = Column(DateTime, server_default=func.now())
+    # denormalized from `message`, so that transcripts are read without parsing JSON
+    role = Column(String(20), nullable=True)
+    content = Column(Text, nullable=True)
+    turn_index = Column(Integer, nullable=True)  # position of the message in its session
 
     # Relationship to link back to the ConversationSession
     session = relationship("ConversationSession", back_populates="messages")
 
+    # a session's history is loaded in order several times per turn
+    __table_args__ = (Index("ix_message_store_session_id_id", session_id, id),)
+
     def __repr__(self):
         return f"Message(session_id='{self.session_id}', message='{self.message}', timestamp='{self.timestamp}')"
 
+    @staticmethod
+    def from_message_dict(session_id: uuid.UUID | str, message_dict: dict) -> "Message":
+        """Create a message from a langchain message dict (see `message_to_dict`), with its role,
+        content and turn index set. The turn index is computed by the database on insert."""
+        content = message_dict.get("data", {}).get("content", None)
+        return Message(
+            session_id=session_id,
+            message=json.dumps(message_dict),
+            role=MESSAGE_ROLES.get(message_dict.get("type", None), "Unknown"),
+            content=content if isinstance(content, str) else None,
+            turn_index=(
+                select(func.count())
+                .select_from(Message)
+                .where(Message.session_id == session_id)
+                .scalar_subquery()
+            ),
+        )
+
     def as_transcript_line(self) -> str:
         """Convert a message to a line in a transcript."""
+        if self.role is not None and self.content is not None:
+            if not self.content:
+                raise ValueError("Invalid message format")
+            return f"{self.role}: {self.content}"
 
+        # not backfilled (see migration e5b8c3d1f7a2)
         message_dict = json.loads(self.message)
         message_type = message_dict.get("type", None)
         message_data = message_dict.get("data", None)
@@ -318,12 +571,7 @@ class Message(Base):
         if not message_type or not message_data:
             raise ValueError("Invalid message format")
 
-        if message_type == "ai":
-            role = "Doctor"
-        elif message_type == "human":
-            role = "Patient"
-        else:
-            role = "Unknown"
+        role = MESSAGE_ROLES.get(message_type, "Unknown")
 
         if content := message_data.get("content", None):
             return f"{role}: {content}"
@@ -331,5 +579,115 @@ class Message(Base):
         raise ValueError("Invalid message format")
 
 
+class SummaryJob(Base):
+    """A job to summarize a completed conversation session and email the report, processed by
+    `summarizer_app.summarizer_worker`. Jobs are claimed with `SELECT ... FOR UPDATE SKIP LOCKED`,
+    so that any number of workers can share the queue, and are retried with exponential backoff
+    until `max_attempts`, after which they are left in the "dead" state for inspection."""
+
+    __tablename__ = "summary_jobs"
+    __table_args__ = (Index("ix_summary_jobs_status_run_after", "status", "run_after"),)
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_DEAD = "dead"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversation_session_id = Column(
+        UUID(as_uuid=True), ForeignKey("conversation_sessions.id"), nullable=False
+    )
+    status = Column(String(20), nullable=False, default=STATUS_PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    last_error = Column(Text, nullable=True)
+    run_after = Column(DateTime, server_default=func.now())
+    locked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    conversation_session = relationship("ConversationSession", uselist=False)
+
+    def __repr__(self):
+        return (
+            f"SummaryJob(id='{self.id}', conversation_session_id='{self.conversation_session_id}', "
+            f"status='{self.status}', attempts='{self.attempts}', run_after='{self.run_after}')"
+        )
+
+    @staticmethod
+    def enqueue(conversation_session_id: uuid.UUID, session: Session) -> "SummaryJob":
+        """Add a job to summarize the conversation session."""
+        job = SummaryJob(conversation_session_id=conversation_session_id)
+        session.add(job)
+        session.commit()
+        return job
+
+    @staticmethod
+    def claim_next(
+        session: Session, stale_after: datetime.timedelta = datetime.timedelta(minutes=15)
+    ) -> "SummaryJob | None":
+        """Claim the next due job, skipping jobs locked by other workers. Running jobs that were
+        claimed more than `stale_after` ago (e.g. by a worker that crashed) can be claimed again,
+        unless that was their last attempt: they are then moved to the "dead" state, so that a job
+        that crashes its worker is not retried forever. Returns None if no job is due."""
+        while True:
+            job = (
+                session.query(SummaryJob)
+                .filter(
+                    (
+                        (SummaryJob.status == SummaryJob.STATUS_PENDING)
+                        & (SummaryJob.run_after <= func.now())
+                    )
+                    | (
+                        (SummaryJob.status == SummaryJob.STATUS_RUNNING)
+                        & (SummaryJob.locked_at <= func.now() - stale_after)
+                    )
+                )
+                .order_by(SummaryJob.id)
+                .with_for_update(skip_locked=True)
+                .limit(1)
+                .first()
+            )
+            if job is None:
+                session.commit()  # end the transaction
+                return None
+            if job.status == SummaryJob.STATUS_PENDING or job.attempts < job.max_attempts:
+                break
+
+            job.status = SummaryJob.STATUS_DEAD
+            job.last_error = (
+                f"Attempt {job.attempts} of {job.max_attempts} did not finish within "
+                f"{stale_after}, e.g. because its worker crashed"
+            )
+            session.commit()
+
+        job.status = SummaryJob.STATUS_RUNNING
+        job.attempts += 1
+        job.locked_at = func.now()
+        session.commit()
+        return job
+
+    def mark_as_done(self, session: Session) -> None:
+        self.status = SummaryJob.STATUS_DONE
+        self.last_error = None
+        session.commit()
+
+    def mark_as_failed(
+        self,
+        error: str,
+        session: Session,
+        backoff: datetime.timedelta = datetime.timedelta(seconds=30),
+    ) -> None:
+        """Schedule a retry after `backoff * 2 ** (attempts - 1)`, or move the job to the "dead"
+        state once `max_attempts` is reached."""
+        self.last_error = error
+        if self.attempts >= self.max_attempts:
+            self.status = SummaryJob.STATUS_DEAD
+        else:
+            self.status = SummaryJob.STATUS_PENDING
+            self.run_after = func.now() + backoff * 2 ** (self.attempts - 1)
+        session.commit()
+
+
 def create_tables(engine: Engine) -> None:
     Base.metadata.create_all(engine)
@@ -0,0 +1,92 @@
+"""
+Connection pool checkout metrics.
+
+`MeteredQueuePool` (and its asyncio counterpart) is a `QueuePool` that records how long each
+checkout waits for a connection, including the time to open a new one. Waits stay near zero while
+the pool is large enough for the load; when they grow, or checkouts time out, requests are queuing
+for connections and `DB_POOL_SIZE` / `DB_MAX_OVERFLOW` should be raised (see
+`data_models.get_pool_metrics` and `benchmark_pool.py`).
+"""
+
+import collections
+import threading
+import time
+import typing
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolMetrics:
+    """Checkout counts and wait times of a connection pool. Thread-safe."""
+
+    def __init__(self, window: int = 1000) -> None:
+        """
+        Args:
+            window (int, optional): The number of latest checkouts the percentiles are computed
+                over.
+        """
+        self._lock = threading.Lock()
+        self._waits: typing.Deque[float] = collections.deque(maxlen=window)
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self._waits.clear()
+
+    def record(self, wait: float, timed_out: bool = False) -> None:
+        """Records a checkout that waited `wait` seconds."""
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._waits.append(wait)
+
+    def snapshot(self) -> typing.Dict[str, float]:
+        """Gets the metrics, with the wait times in ms."""
+        with self._lock:
+            waits = sorted(self._waits)
+            attempts = self.checkouts + self.timeouts
+
+        def percentile(p: float) -> float:
+            return 1000 * waits[int(p * (len(waits) - 1))] if waits else 0.0
+
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "mean_wait_ms": 1000 * self.total_wait / attempts if attempts else 0.0,
+            "p50_wait_ms": percentile(0.5),
+            "p95_wait_ms": percentile(0.95),
+            "p99_wait_ms": percentile(0.99),
+            "max_wait_ms": 1000 * self.max_wait,
+        }
+
+
+class MeteredPoolMixin:
+    # a class attribute, so that the metrics survive `Pool.recreate` (e.g. on `Engine.dispose`)
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return connection
+
+
+class MeteredQueuePool(MeteredPoolMixin, QueuePool):
+    metrics = PoolMetrics()
+
+
+class MeteredAsyncAdaptedQueuePool(MeteredPoolMixin, AsyncAdaptedQueuePool):
+    metrics = PoolMetrics()
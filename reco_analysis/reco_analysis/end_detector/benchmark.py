@@ -0,0 +1,79 @@
+"""
+Benchmark the end detection paths: the local classifier, the language model, and the hybrid
+(classifier first, language model for uncertain pairs) used by `EndDetector`.
+
+Pairs with closing terms are excluded, since they never reach either model. Reports accuracy,
+mean latency per pair, and how many pairs the hybrid sent to the language model.
+
+Usage:
+    python -m reco_analysis.end_detector.benchmark data/transcripts/transcripts_full_*.json
+"""
+
+import time
+import typing
+from pathlib import Path
+
+import typer
+from loguru import logger
+
+from reco_analysis.end_detector.classifier import DEFAULT_CLASSIFIER_PATH, EndClassifier
+from reco_analysis.end_detector.end_detector import (
+    END_TERMS,
+    EndDetector,
+    contains_closing_terms,
+)
+from reco_analysis.end_detector.train_classifier import load_examples
+
+app = typer.Typer()
+
+
+def evaluate(
+    name: str,
+    predict: typing.Callable[[str, str], bool],
+    pairs: typing.List[typing.Tuple[str, str]],
+    labels: typing.List[bool],
+) -> None:
+    start = time.perf_counter()
+    predictions = [predict(doctor, patient) for doctor, patient in pairs]
+    elapsed = time.perf_counter() - start
+    accuracy = sum(p == label for p, label in zip(predictions, labels)) / len(labels)
+    logger.info(
+        f"{name:<12} accuracy: {accuracy:.3f}, mean latency: {1000 * elapsed / len(pairs):.2f} ms"
+    )
+
+
+@app.command()
+def main(
+    transcript_files: typing.List[Path] = typer.Argument(
+        None, help="JSON files with both full and extracted transcripts per patient."
+    ),
+    classifier_path: Path = DEFAULT_CLASSIFIER_PATH,
+    classifier_confidence: float = 0.9,
+    max_pairs: int = 200,
+):
+    pairs, labels = load_examples(transcript_files or [])
+    examples = [
+        (pair, label)
+        for pair, label in zip(pairs, labels)
+        if not contains_closing_terms(pair[0], END_TERMS)
+        and not contains_closing_terms(pair[1], END_TERMS)
+    ][:max_pairs]
+    pairs, labels = [pair for pair, _ in examples], [label for _, label in examples]
+    logger.info(f"Benchmarking on {len(pairs)} pairs ({sum(labels)} closings)")
+
+    classifier = EndClassifier.load(classifier_path)
+    llm_only = EndDetector(classifier_path=None, cache_size=0)
+    hybrid = EndDetector(
+        classifier_path=classifier_path, classifier_confidence=classifier_confidence, cache_size=0
+    )
+
+    evaluate("classifier", lambda d, p: classifier.predict_proba(d, p) >= 0.5, pairs, labels)
+    evaluate("llm", llm_only.detect, pairs, labels)
+    evaluate("hybrid", hybrid.detect, pairs, labels)
+
+    uncertain = sum(hybrid.classify_locally(doctor, patient) is None for doctor, patient in pairs)
+    logger.info(f"hybrid sent {uncertain}/{len(pairs)} pairs to the LLM")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,139 @@
+"""
+A small local end-of-conversation classifier, used as a fast path before the language model.
+
+The classifier is a TF-IDF + logistic regression pipeline over the (doctor, patient) pair. It
+returns the probability that the conversation is coming to a close, so that `EndDetector` only
+sends the uncertain pairs to the language model. Train it with `train_classifier.py`, and compare
+it against the language model with `benchmark.py`.
+
+Functions:
+    - pair_to_text: Turns a (doctor, patient) pair into the text the classifier is trained on.
+    - transcript_examples: Builds labelled (doctor, patient) pairs from full and extracted transcripts.
+    - load_classifier: Loads a serialized classifier, once per path.
+
+Classes:
+    - EndClassifier: Trains, applies and serializes the classifier.
+"""
+
+import functools
+import typing
+from pathlib import Path
+
+import joblib
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+from reco_analysis.config import MODELS_DIR
+
+DEFAULT_CLASSIFIER_PATH = MODELS_DIR / "end_classifier.joblib"
+
+Pair = typing.Tuple[str, str]
+
+
+def pair_to_text(doctor_input: str, patient_input: str) -> str:
+    """
+    Turn a (doctor, patient) pair into a single text, prefixing each word with its speaker so
+    that the same word counts as a different feature for the doctor and the patient.
+    """
+    doctor_words = " ".join(f"doctor_{word}" for word in (doctor_input or "").lower().split())
+    patient_words = " ".join(f"patient_{word}" for word in (patient_input or "").lower().split())
+    return f"{doctor_words} {patient_words}"
+
+
+def transcript_examples(
+    patients_dict: dict,
+    full_transcript_field: str = "chat_transcript_full",
+    short_transcript_field: str = "chat_transcript",
+) -> typing.Tuple[typing.List[Pair], typing.List[bool]]:
+    """
+    Build labelled (doctor, patient) pairs from transcripts processed by `extractor.py`.
+
+    When the extracted (short) transcript is shorter than the full one, the first conversation
+    ended on its last line: its last doctor/patient pair is labelled as a closing and every
+    earlier pair as a continuation. Transcripts without a detected end are skipped.
+
+    Args:
+        patients_dict (dict): Dictionary of patients, each with both transcript fields.
+        full_transcript_field (str): The key containing the full chat transcript.
+        short_transcript_field (str): The key containing the extracted chat transcript.
+
+    Returns:
+        Tuple[List[Tuple[str, str]], List[bool]]: The pairs and their labels.
+    """
+    pairs, labels = [], []
+    for value in patients_dict.values():
+        full = value.get(full_transcript_field)
+        short = value.get(short_transcript_field)
+        if not full or not short or len(short) >= len(full):
+            continue
+
+        transcript_pairs = [
+            (doctor_line.split(":", 1)[-1].strip(), patient_line.split(":", 1)[-1].strip())
+            for doctor_line, patient_line in zip(short, short[1:])
+            if doctor_line.startswith("Doctor") and patient_line.startswith("Patient")
+        ]
+        for i, pair in enumerate(transcript_pairs):
+            pairs.append(pair)
+            labels.append(i == len(transcript_pairs) - 1)
+
+    return pairs, labels
+
+
+class EndClassifier:
+    """
+    TF-IDF + logistic regression classifier over (doctor, patient) pairs.
+    """
+
+    def __init__(self, pipeline: Pipeline | None = None) -> None:
+        self.pipeline = pipeline or Pipeline(
+            [
+                ("tfidf", TfidfVectorizer(ngram_range=(1, 2), min_df=1, sublinear_tf=True)),
+                ("logreg", LogisticRegression(class_weight="balanced", max_iter=1000)),
+            ]
+        )
+
+    def fit(self, pairs: typing.Sequence[Pair], labels: typing.Sequence[bool]) -> "EndClassifier":
+        """
+        Train the classifier on labelled (doctor, patient) pairs.
+        """
+        self.pipeline.fit([pair_to_text(*pair) for pair in pairs], list(labels))
+        return self
+
+    def predict_proba(self, doctor_input: str, patient_input: str) -> float:
+        """
+        Get the probability that the conversation is coming to a close.
+        """
+        return self.predict_proba_batch([(doctor_input, patient_input)])[0]
+
+    def predict_proba_batch(self, pairs: typing.Sequence[Pair]) -> typing.List[float]:
+        """
+        Get the probability that the conversation is coming to a close, for each pair.
+        """
+        probas = self.pipeline.predict_proba([pair_to_text(*pair) for pair in pairs])
+        true_index = list(self.pipeline.classes_).index(True)
+        return [float(proba[true_index]) for proba in probas]
+
+    def save(self, path: Path = DEFAULT_CLASSIFIER_PATH) -> None:
+        """
+        Serialize the classifier to a file.
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(self.pipeline, path)
+
+    @staticmethod
+    def load(path: Path = DEFAULT_CLASSIFIER_PATH) -> "EndClassifier":
+        """
+        Load a serialized classifier from a file.
+        """
+        return EndClassifier(joblib.load(path))
+
+
+@functools.lru_cache(maxsize=None)
+def load_classifier(path: Path = DEFAULT_CLASSIFIER_PATH) -> EndClassifier | None:
+    """
+    Load a serialized classifier once per path. Returns None if there is no trained classifier.
+    """
+    if not Path(path).exists():
+        return None
+    return EndClassifier.load(path)
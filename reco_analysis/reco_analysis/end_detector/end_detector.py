@@ -1,10 +1,22 @@
+import collections
+import functools
 import re
+import threading
+import typing
+from pathlib import Path
 
 from dotenv import load_dotenv
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnableSerializable
 from langchain_openai import ChatOpenAI
+from loguru import logger
+
+from reco_analysis.end_detector.classifier import (
+    DEFAULT_CLASSIFIER_PATH,
+    EndClassifier,
+    load_classifier,
+)
 
 # Load environment variables
 load_dotenv("../.env")
@@ -99,10 +111,13 @@ def create_prompt_template() -> PromptTemplate:
     )
 
 
-def create_chain() -> RunnableSerializable:
+def create_chain(model: ChatOpenAI = model) -> RunnableSerializable:
     """
     Create a LangChain chain for the end terminator.
 
+    Args:
+        model (ChatOpenAI, optional): The language model to use. Defaults to the module's model.
+
     Returns:
         RunnableSerializable: A LangChain chain for the end terminator.
     """
@@ -111,7 +126,24 @@ def create_chain() -> RunnableSerializable:
     return chain
 
 
-def contains_closing_terms(text: str, closing_terms: list[str]) -> bool:
+@functools.lru_cache(maxsize=32)
+def compile_closing_terms(closing_terms: typing.FrozenSet[str]) -> re.Pattern:
+    """
+    Compile the closing terms into a single case-insensitive alternation pattern.
+
+    Args:
+        closing_terms (frozenset[str]): The closing terms to match as whole words.
+
+    Returns:
+        re.Pattern: The compiled pattern.
+    """
+    alternation = "|".join(
+        re.escape(term) for term in sorted(closing_terms, key=len, reverse=True)
+    )
+    return re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE)
+
+
+def contains_closing_terms(text: str, closing_terms: typing.Iterable[str]) -> bool:
     """
     Check if the text contains any of the closing terms.
 
@@ -124,11 +156,154 @@ def contains_closing_terms(text: str, closing_terms: list[str]) -> bool:
     """
     if text is None:
         return False
-    else:
-        for term in closing_terms:
-            if re.search(rf"\b{term}\b", text, re.IGNORECASE):
-                return True
-        return False
+    return compile_closing_terms(frozenset(closing_terms)).search(text) is not None
+
+
+def normalize_text(text: str | None) -> str:
+    """
+    Normalize a message for use as a cache key: lowercase, with collapsed whitespace.
+    """
+    return " ".join((text or "").lower().split())
+
+
+class EndDetector:
+    """
+    A long-lived end-of-conversation detector.
+
+    Holds a precompiled pattern for the closing terms, a single chain (and so a single
+    `ChatOpenAI` client with its connection pool), and an LRU cache of verdicts keyed by the
+    normalized (doctor, patient) pair, so repeated checks do not call the language model again.
+
+    If a trained local classifier is available (see `classifier.py`), it is tried before the
+    language model, and only pairs it is uncertain about are sent to the language model.
+    """
+
+    def __init__(
+        self,
+        closing_terms: typing.Iterable[str] = END_TERMS,
+        model: ChatOpenAI = model,
+        cache_size: int = 1024,
+        classifier_path: Path | None = DEFAULT_CLASSIFIER_PATH,
+        classifier_confidence: float = 0.9,
+    ) -> None:
+        """
+        Args:
+            closing_terms (Iterable[str], optional): Terms that mark a closing on their own.
+                Defaults to END_TERMS.
+            model (ChatOpenAI, optional): The language model used when no closing term is found.
+            cache_size (int, optional): The maximum number of cached verdicts. Defaults to 1024.
+            classifier_path (Path, optional): The serialized local classifier, loaded on first use.
+                If None or if the file does not exist, every uncertain pair goes to the language
+                model.
+            classifier_confidence (float, optional): The classifier's verdict is used when its
+                probability is at least this, or at most one minus this. Defaults to 0.9.
+        """
+        self.closing_pattern = compile_closing_terms(frozenset(closing_terms))
+        self.chain = create_chain(model)
+        self.cache_size = cache_size
+        self.cache: collections.OrderedDict[typing.Tuple[str, str], bool] = (
+            collections.OrderedDict()
+        )
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+
+        self.classifier_path = classifier_path
+        self.classifier_confidence = classifier_confidence
+        self._classifier: EndClassifier | None = None
+        self._classifier_loaded = False
+
+    @property
+    def classifier(self) -> EndClassifier | None:
+        """
+        The local classifier, loaded lazily. None if no trained classifier is available.
+        """
+        if not self._classifier_loaded:
+            if self.classifier_path is not None:
+                self._classifier = load_classifier(self.classifier_path)
+                if self._classifier is None:
+                    logger.info(f"No end classifier at {self.classifier_path}, using the LLM only")
+            self._classifier_loaded = True
+        return self._classifier
+
+    def classify_locally(self, doctor_input: str, patient_input: str) -> bool | None:
+        """
+        Get the local classifier's verdict, or None if there is no classifier or it is uncertain.
+        """
+        if self.classifier is None:
+            return None
+        proba = self.classifier.predict_proba(doctor_input, patient_input)
+        if proba >= self.classifier_confidence:
+            return True
+        if proba <= 1 - self.classifier_confidence:
+            return False
+        return None
+
+    def contains_closing_terms(self, text: str | None) -> bool:
+        """
+        Check if the text contains any of the closing terms.
+        """
+        return text is not None and self.closing_pattern.search(text) is not None
+
+    def _get_cached(self, key: typing.Tuple[str, str]) -> bool | None:
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                return self.cache[key]
+            self.cache_misses += 1
+            return None
+
+    def _set_cached(self, key: typing.Tuple[str, str], verdict: bool) -> None:
+        with self._lock:
+            self.cache[key] = verdict
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def detect(self, doctor_input: str, patient_input: str) -> bool:
+        """
+        Check if the conversation is coming to a close, see `detect_end`.
+        """
+        if self.contains_closing_terms(doctor_input) or self.contains_closing_terms(patient_input):
+            return True
+
+        key = (normalize_text(doctor_input), normalize_text(patient_input))
+        if (verdict := self._get_cached(key)) is not None:
+            return verdict
+
+        if (verdict := self.classify_locally(doctor_input, patient_input)) is not None:
+            self._set_cached(key, verdict)
+            return verdict
+
+        result = self.chain.invoke({"doctor": doctor_input, "patient": patient_input})
+        verdict = result.strip().lower() == "true"
+        self._set_cached(key, verdict)
+        return verdict
+
+    async def adetect(self, doctor_input: str, patient_input: str) -> bool:
+        """
+        Async version of `detect`.
+        """
+        if self.contains_closing_terms(doctor_input) or self.contains_closing_terms(patient_input):
+            return True
+
+        key = (normalize_text(doctor_input), normalize_text(patient_input))
+        if (verdict := self._get_cached(key)) is not None:
+            return verdict
+
+        if (verdict := self.classify_locally(doctor_input, patient_input)) is not None:
+            self._set_cached(key, verdict)
+            return verdict
+
+        result = await self.chain.ainvoke({"doctor": doctor_input, "patient": patient_input})
+        verdict = result.strip().lower() == "true"
+        self._set_cached(key, verdict)
+        return verdict
+
+
+# Shared detector used by `detect_end` and `adetect_end`
+end_detector = EndDetector()
 
 
 def detect_end(doctor_input: str, patient_input: str) -> bool:
@@ -137,23 +312,27 @@ def detect_end(doctor_input: str, patient_input: str) -> bool:
     Note that the sequence within the conversation has to be doctor input followed by patient input.
 
     Args:
-        chain (LLMChain): The LangChain chain to process the input.
         doctor_input (str): The last doctor input.
         patient_input (str): The last patient input.
 
     Returns:
         bool: True if the conversation is coming to a close, False otherwise.
     """
-    # Check for closing terms
-    if contains_closing_terms(doctor_input, END_TERMS) or contains_closing_terms(
-        patient_input, END_TERMS
-    ):
-        return True
+    return end_detector.detect(doctor_input, patient_input)
 
-    # If no closing terms are found, use the language model to detect the end
-    chain = create_chain()
-    result = chain.invoke({"doctor": doctor_input, "patient": patient_input})
-    return result.strip().lower() == "true"
+
+async def adetect_end(doctor_input: str, patient_input: str) -> bool:
+    """
+    Async version of `detect_end`, awaiting the language model instead of blocking on it.
+
+    Args:
+        doctor_input (str): The last doctor input.
+        patient_input (str): The last patient input.
+
+    Returns:
+        bool: True if the conversation is coming to a close, False otherwise.
+    """
+    return await end_detector.adetect(doctor_input, patient_input)
 
 
 # Example usage
@@ -8,19 +8,27 @@ Functions:
     - create_chain: Constructs a LangChain chain for the transcript extractor.
     - detect_first_conversation_end: Identifies the line number where the first conversation ends.
     - enumerate_transcript: Enumerates transcript lines for easier processing.
+    - find_candidate_end_lines: Finds the lines around which the first conversation may end.
+    - enumerate_transcript_window: Enumerates only the lines around the candidate end lines.
     - process_transcript: Processes a single transcript to extract the first round of conversation.
     - process_transcripts: Processes multiple transcripts to extract the first conversation for each.
+    - process_transcripts_batch: Same as process_transcripts, with bounded concurrency and a resumable JSONL checkpoint.
+    - load_checkpoint: Loads the transcripts already processed from a JSONL checkpoint.
     - load_transcripts: Loads transcripts from a JSON file.
     - save_transcripts: Saves processed transcripts to a JSON file.
 """
 import json
 import argparse
+import os
+import re
 from dotenv import load_dotenv
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnableSerializable
 from langchain_openai import ChatOpenAI
 
+from reco_analysis.end_detector.end_detector import END_TERMS, compile_closing_terms
+
 # Load environment variables
 load_dotenv("../.env")
 
@@ -48,6 +56,11 @@ Follow these steps:
    - Confirm that the end of the first conversation appears immediately before the start of the second conversation and output the line number of the last line of the first conversation.
    - Otherwise, output 999.
 </steps>
+
+Long transcripts may be shortened to excerpts around the lines where the first conversation could end:
+- A line containing only "..." stands for one or more omitted lines, none of which can be the end of the first conversation.
+- Every line keeps its line number from the full transcript, so the numbers jump across a "..." line. Always output the line number as it is written in front of the line, never a position counted in the excerpt.
+- Two lines are only consecutive if their line numbers are consecutive, e.g. a Patient line 21 is immediately followed by a Doctor line 22, but not by a Doctor line 30 shown after a "...".
     
 The transcript is provided below, surrounded by triple quotes:
 '''
@@ -157,19 +170,17 @@ def enumerate_transcript(transcript_lines):
     transcript_text = "\n".join(enumerated_lines)
     return transcript_text
 
-def process_transcript(transcript, debug=False):
+def extract_first_conversation(transcript, end_line_number, debug=False):
     """
-    Process a single transcript to extract the first round of conversation.
+    Cut the transcript after the line where the first conversation ends.
 
     Args:
-        transcript (str): The transcript to process.
+        transcript (list[str]): The transcript lines.
+        end_line_number (int): The line number where the first conversation ends, 999 if it does not end.
 
     Returns:
-        str: The processed transcript.
+        list[str]: The first conversation.
     """
-    chain = create_chain()
-    enumerated_text = enumerate_transcript(transcript)
-    end_line_number = detect_first_conversation_end(chain, enumerated_text)
     if debug:
         print(f"DEBUG INFO: End of first conversation at line {end_line_number}")
         print("-" * 150)
@@ -181,7 +192,105 @@ def process_transcript(transcript, debug=False):
     else:
         return transcript[:end_line_number + 1]
 
-def process_transcripts(patients_dict, transcript_field='chat_transcript', debug=False):
+# A doctor greeting after the first line usually starts the second conversation
+GREETING_PATTERN = re.compile(r"\b(?:hello|hi|good (?:morning|afternoon|evening))\b", re.IGNORECASE)
+
+# Number of lines kept on each side of a candidate end line
+DEFAULT_WINDOW = 6
+
+def find_candidate_end_lines(transcript_lines):
+    """
+    Find the lines where the first conversation may end: patient lines that contain, or follow a
+    doctor line that contains, a closing term, and the lines right before a doctor greeting.
+
+    Args:
+        transcript_lines (list[str]): The transcript lines.
+
+    Returns:
+        list[int]: The sorted candidate line numbers.
+    """
+    closing_pattern = compile_closing_terms(frozenset(END_TERMS))
+    candidates = set()
+    for i, line in enumerate(transcript_lines):
+        if line.startswith("Patient") and i > 0 and (
+            closing_pattern.search(line) or closing_pattern.search(transcript_lines[i - 1])
+        ):
+            candidates.add(i)
+        if line.startswith("Doctor") and i > 1 and GREETING_PATTERN.search(line):
+            candidates.add(i - 1)
+    return sorted(candidates)
+
+def enumerate_transcript_window(transcript_lines, window=DEFAULT_WINDOW):
+    """
+    Enumerates only the lines within `window` lines of a candidate end line, keeping the original
+    line numbers and marking skipped lines with "...". Falls back to the full transcript when
+    there are no candidates, or when the windows would not make the transcript shorter.
+
+    Args:
+        transcript_lines (list[str]): The transcript lines.
+        window (int): Number of lines kept on each side of a candidate end line.
+
+    Returns:
+        str: The enumerated transcript text.
+    """
+    candidates = find_candidate_end_lines(transcript_lines)
+    kept = sorted(
+        {
+            i
+            for candidate in candidates
+            for i in range(max(candidate - window, 0), min(candidate + window + 1, len(transcript_lines)))
+        }
+    )
+    if not kept or len(kept) == len(transcript_lines):
+        return enumerate_transcript(transcript_lines)
+
+    enumerated_lines = []
+    for previous, i in zip([-1] + kept, kept):
+        if i != previous + 1:
+            enumerated_lines.append("...")
+        enumerated_lines.append(f"{i}: {transcript_lines[i]}")
+    if kept[-1] != len(transcript_lines) - 1:
+        enumerated_lines.append("...")
+    return "\n".join(enumerated_lines)
+
+def enumerate_for_extraction(transcript_lines, window):
+    """
+    Enumerates the transcript for the extractor: the candidate windows if `window` is set,
+    the full transcript otherwise.
+    """
+    if window is None:
+        return enumerate_transcript(transcript_lines)
+    return enumerate_transcript_window(transcript_lines, window)
+
+def process_transcript(transcript, debug=False, chain=None, window=DEFAULT_WINDOW):
+    """
+    Process a single transcript to extract the first round of conversation.
+
+    Args:
+        transcript (str): The transcript to process.
+        chain (RunnableSerializable, optional): The chain to use, to reuse one across transcripts. A new chain is created if not provided.
+        window (int, optional): Only send the lines within this many lines of a candidate end line to the model (see `enumerate_transcript_window`). If None, send the full transcript.
+
+    Returns:
+        str: The processed transcript.
+    """
+    chain = chain or create_chain()
+    enumerated_text = enumerate_for_extraction(transcript, window)
+    end_line_number = detect_first_conversation_end(chain, enumerated_text)
+    return extract_first_conversation(transcript, end_line_number, debug=debug)
+
+def make_record(value, first_conversation):
+    """
+    Build the processed record for a patient.
+    """
+    return {
+        "id": value['id'],
+        "name": value['name'],
+        "prompt": value['prompt'],
+        "chat_transcript": first_conversation
+    }
+
+def process_transcripts(patients_dict, transcript_field='chat_transcript', debug=False, window=DEFAULT_WINDOW):
     """
     Process the dictionary of patients to extract the first round of conversation for each.
 
@@ -192,11 +301,13 @@ def process_transcripts(patients_dict, transcript_field='chat_transcript', debug
             - prompt: The prompt for the patient.
             - chat_transcript: The chat transcript for the patient.
         transcript_field (str): The key in the patients_dict containing the chat transcript.
+        window (int, optional): See `process_transcript`.
 
     Returns:
         dict: Dictionary with shortened conversations.
     """
     processed_transcripts = {}
+    chain = create_chain()
 
     for key, value in patients_dict.items():
         transcript_lines = value[transcript_field]
@@ -207,16 +318,90 @@ def process_transcripts(patients_dict, transcript_field='chat_transcript', debug
             for i, line in enumerate(transcript_lines):
                 print(f"{i}: {line}")
             print("\n")
-        first_conversation = process_transcript(transcript_lines, debug=debug)
-        processed_transcripts[key] = {
-            "id": value['id'],
-            "name": value['name'],
-            "prompt": value['prompt'],
-            "chat_transcript": first_conversation
-        }
+        first_conversation = process_transcript(transcript_lines, debug=debug, chain=chain, window=window)
+        processed_transcripts[key] = make_record(value, first_conversation)
+
+    return processed_transcripts
+
+def load_checkpoint(checkpoint_path: str) -> dict:
+    """
+    Load the transcripts already processed from a JSONL checkpoint, one {"key": ..., "result": ...}
+    object per line. A truncated last line (e.g. from a crash mid-write) is ignored.
 
+    Args:
+        checkpoint_path (str): Path to the JSONL checkpoint file.
+
+    Returns:
+        dict: Dictionary of processed transcripts, by patient key.
+    """
+    processed_transcripts = {}
+    if not os.path.exists(checkpoint_path):
+        return processed_transcripts
+    with open(checkpoint_path, "r") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            processed_transcripts[entry["key"]] = entry["result"]
     return processed_transcripts
 
+def process_transcripts_batch(patients_dict, checkpoint_path, transcript_field='chat_transcript', max_concurrency=8, debug=False, window=DEFAULT_WINDOW):
+    """
+    Process the dictionary of patients like `process_transcripts`, running up to `max_concurrency`
+    transcripts at a time through a single chain. Each result is appended to a JSONL checkpoint as
+    soon as it finishes, and patients already in the checkpoint are skipped, so an interrupted run
+    can be restarted where it left off. Transcripts that fail are logged and retried on the next run.
+
+    Args:
+        patients_dict (dict): Dictionary of patients, see `process_transcripts`.
+        checkpoint_path (str): Path to the JSONL checkpoint file.
+        transcript_field (str): The key in the patients_dict containing the chat transcript.
+        max_concurrency (int): The maximum number of transcripts processed at a time.
+        window (int, optional): See `process_transcript`.
+
+    Returns:
+        dict: Dictionary with shortened conversations, for the patients processed successfully.
+    """
+    processed_transcripts = load_checkpoint(checkpoint_path)
+    keys = [key for key in patients_dict if key not in processed_transcripts]
+    print(f"{len(processed_transcripts)} transcripts already processed, {len(keys)} to go.")
+
+    chain = create_chain()
+    inputs = [
+        {"transcript": enumerate_for_extraction(patients_dict[key][transcript_field], window)}
+        for key in keys
+    ]
+
+    with open(checkpoint_path, "a+") as checkpoint_file:
+        # start on a new line after a truncated last line (e.g. from a crash mid-write)
+        checkpoint_file.seek(0, os.SEEK_END)
+        if checkpoint_file.tell() > 0:
+            checkpoint_file.seek(checkpoint_file.tell() - 1)
+            if checkpoint_file.read(1) != "\n":
+                checkpoint_file.write("\n")
+
+        for i, result in chain.batch_as_completed(
+            inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True
+        ):
+            key, value = keys[i], patients_dict[keys[i]]
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                end_line_number = int(result.strip())
+            except Exception as e:
+                print(f"Failed to process transcript for {value['name']}: {e}")
+                continue
+
+            first_conversation = extract_first_conversation(
+                value[transcript_field], end_line_number, debug=debug
+            )
+            processed_transcripts[key] = make_record(value, first_conversation)
+            checkpoint_file.write(json.dumps({"key": key, "result": processed_transcripts[key]}) + "\n")
+            checkpoint_file.flush()
+
+    return {key: processed_transcripts[key] for key in patients_dict if key in processed_transcripts}
+
 def load_transcripts(file_path: str) -> dict:
     """
     Load the transcripts from the JSON file.
@@ -244,18 +429,24 @@ if __name__ == "__main__":
     parser.add_argument("input_file", type=str, help="Path to the input JSON file containing patients and associated transcripts.")
     parser.add_argument("transcript_field", type=str, default="chat_transcript_full", help="The key in the JSON file containing the chat transcript.")
     parser.add_argument("output_file", type=str, help="Path to the output JSON file to save processed transcripts.")
+    parser.add_argument("--checkpoint_file", type=str, default=None, help="Path to the JSONL checkpoint file. Defaults to the output file with a .checkpoint.jsonl suffix.")
+    parser.add_argument("--max_concurrency", type=int, default=8, help="The maximum number of transcripts processed at a time.")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="Only send the lines within this many lines of a candidate end line to the model. Use a negative value to send the full transcript.")
     args = parser.parse_args()
 
     # Load the transcripts from the input file
     transcripts = load_transcripts(args.input_file)
 
     # Process the transcripts to extract the first round of conversation
-    processed_transcripts = process_transcripts(
-        patients_dict = args.input_file,
-        transcript_field = args.transcript_field
+    processed_transcripts = process_transcripts_batch(
+        patients_dict = transcripts,
+        checkpoint_path = args.checkpoint_file or f"{args.output_file}.checkpoint.jsonl",
+        transcript_field = args.transcript_field,
+        max_concurrency = args.max_concurrency,
+        window = args.window if args.window >= 0 else None,
     )
 
     # Save the processed transcripts to the output file
     save_transcripts(args.output_file, processed_transcripts)
 
-    print(f"Processed transcripts have been saved to {args.output_file}")
\ No newline at end of file
+    print(f"Processed transcripts have been saved to {args.output_file}")
@@ -0,0 +1,115 @@
+"""
+Train the local end-of-conversation classifier used by `EndDetector` as a fast path.
+
+Training examples are the labelled examples from the end detector prompt, the examples from
+`end_detector.py`'s usage section, and (doctor, patient) pairs labelled from transcript files that
+were processed by `extractor.py` (see `classifier.transcript_examples`).
+
+Usage:
+    python -m reco_analysis.end_detector.train_classifier data/transcripts/transcripts_full_*.json
+"""
+
+import json
+import re
+import typing
+from pathlib import Path
+
+import typer
+from loguru import logger
+from sklearn.model_selection import cross_val_score
+
+from reco_analysis.end_detector.classifier import (
+    DEFAULT_CLASSIFIER_PATH,
+    EndClassifier,
+    Pair,
+    pair_to_text,
+    transcript_examples,
+)
+from reco_analysis.end_detector.end_detector import PROMPT_TEXT
+
+app = typer.Typer()
+
+# Additional hand-labelled examples, as in the `end_detector.py` usage section
+HAND_LABELLED_EXAMPLES: typing.List[typing.Tuple[str, str, bool]] = [
+    ("Do you have any more questions?", "No, doctor. Goodbye.", True),
+    (
+        "Could you please provide your latest vital signs?",
+        "My temperature is 98.6 degrees.",
+        False,
+    ),
+    ("Is there anything else you would like to discuss?", "No, I think that's all for now.", True),
+    (
+        "Please follow up with your primary care physician.",
+        "I will. Thank you, doctor. See you later.",
+        True,
+    ),
+]
+
+
+def prompt_examples(
+    prompt_text: str = PROMPT_TEXT,
+) -> typing.Tuple[typing.List[Pair], typing.List[bool]]:
+    """
+    Extract the labelled examples from the end detector prompt.
+    """
+    matches = re.findall(
+        r"\*\*Doctor:\*\* (.*)\n\*\*Patient:\*\* (.*)\n\*\*Response:\*\* (True|False)", prompt_text
+    )
+    return [(doctor, patient) for doctor, patient, _ in matches], [
+        label == "True" for _, _, label in matches
+    ]
+
+
+def load_examples(
+    transcript_files: typing.List[Path],
+    full_transcript_field: str = "chat_transcript_full",
+    short_transcript_field: str = "chat_transcript",
+) -> typing.Tuple[typing.List[Pair], typing.List[bool]]:
+    """
+    Gather all labelled examples: from the prompt, hand-labelled, and from transcript files.
+    """
+    pairs, labels = prompt_examples()
+    for doctor, patient, label in HAND_LABELLED_EXAMPLES:
+        pairs.append((doctor, patient))
+        labels.append(label)
+
+    for transcript_file in transcript_files:
+        with open(transcript_file, "r") as file:
+            patients_dict = json.load(file)
+        file_pairs, file_labels = transcript_examples(
+            patients_dict, full_transcript_field, short_transcript_field
+        )
+        logger.info(f"{len(file_pairs)} examples from {transcript_file}")
+        pairs += file_pairs
+        labels += file_labels
+
+    return pairs, labels
+
+
+@app.command()
+def main(
+    transcript_files: typing.List[Path] = typer.Argument(
+        None, help="JSON files with both full and extracted transcripts per patient."
+    ),
+    output_path: Path = DEFAULT_CLASSIFIER_PATH,
+    full_transcript_field: str = "chat_transcript_full",
+    short_transcript_field: str = "chat_transcript",
+):
+    pairs, labels = load_examples(
+        transcript_files or [], full_transcript_field, short_transcript_field
+    )
+    logger.info(f"Training on {len(pairs)} examples ({sum(labels)} closings)")
+
+    classifier = EndClassifier()
+    if min(sum(labels), len(labels) - sum(labels)) >= 5:
+        scores = cross_val_score(
+            classifier.pipeline, [pair_to_text(*pair) for pair in pairs], labels, cv=5
+        )
+        logger.info(f"Cross-validated accuracy: {scores.mean():.3f} (+/- {scores.std():.3f})")
+
+    classifier.fit(pairs, labels).save(output_path)
+    logger.success(f"End classifier saved to {output_path}")
+
+
+if __name__ == "__main__":
+    app()
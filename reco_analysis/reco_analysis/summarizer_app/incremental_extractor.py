@@ -0,0 +1,309 @@
+"""Incremental Extractor.
+
+This module extracts "current_symptoms" and "current_medications" turn by turn while the
+conversation is ongoing, so that when the session ends only the narrative fields
+("patient_overview" and "summary") and the vital signs are left to generate.
+
+After each doctor/patient exchange, the LLM updates only the sections the exchange touches
+(matched by specific keywords), so small talk and vital sign readings make no LLM call at all.
+Exchanges are processed in order in a background thread, and the partial summary is saved to
+`ConversationSession.partial_summary` after each of them. Pending exchanges are always processed
+before the session is marked as completed (see `data_models.PRE_COMPLETION_HOOKS`).
+
+`finalize` then builds the `TranscriptSummary` from the partial summary and one LLM call for the
+rest, with a shorter prompt. When the partial summary does not cover the whole transcript (e.g. an
+extraction failed, or the extractor was attached to a session that had already started), it
+summarizes the whole transcript instead. Both go through `summarizer_engine.summarize`, so the
+vital signs follow its `vitals_mode`."""
+
+import collections
+import concurrent.futures
+import dataclasses
+import json
+import re
+import threading
+import typing
+import uuid
+import weakref
+
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema.output_parser import StrOutputParser
+from langchain_core.messages import BaseMessage
+from loguru import logger
+
+from reco_analysis.data_model import data_models
+from reco_analysis.summarizer_app import (
+    data_type,
+    summarizer_engine,
+    summary_cache,
+)
+from reco_analysis.summarizer_app.prompts import (
+    section_conventions,
+    system_message_summarize_narrative_json,
+    system_message_update_section_json,
+)
+
+SECTIONS = ["current_symptoms", "current_medications"]
+
+# An exchange touches a section if the doctor or the patient message matches its keywords. Only
+# specific terms are listed, so that small talk (e.g. "How are you feeling today?") makes no call.
+SECTION_KEYWORDS: typing.Dict[str, re.Pattern] = {
+    "current_symptoms": re.compile(
+        r"symptom|breath|dyspnea|orthopnea|pillows?\b|lying (?:down|flat)|swell|swollen|edema"
+        r"|ankles?\b|cough|chest|fatigue|exhaust|dizz|light-?headed|faint|confus|nause|vomit"
+        r"|appetite|palpitation",
+        re.IGNORECASE,
+    ),
+    "current_medications": re.compile(
+        r"medic|meds\b|pills?\b|tablet|dose|prescri|drug|diuretic|blocker|inhibitor"
+        r"|statin|lisinopril|enalapril|metoprolol|carvedilol|bisoprolol|furosemide|lasix"
+        r"|torsemide|bumetanide|spironolactone|eplerenone|entresto|sacubitril|valsartan"
+        r"|losartan|digoxin|hydralazine|isosorbide|aspirin|atorvastatin|warfarin|apixaban"
+        r"|dapagliflozin|empagliflozin",
+        re.IGNORECASE,
+    ),
+}
+
+# Terms that only touch a section when the patient uses them, as the doctor uses them in passing
+PATIENT_SECTION_KEYWORDS: typing.Dict[str, re.Pattern] = {
+    "current_symptoms": re.compile(r"\b(?:tired|legs?|feet|pain|weak)\b", re.IGNORECASE),
+}
+
+EXTRACTION_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=8, thread_name_prefix="incremental-extractor"
+)
+
+# Extractors by session ID, so that the pre-completion hook can wait for their pending exchanges
+EXTRACTORS: "weakref.WeakValueDictionary[str, IncrementalExtractor]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def empty_partial_summary() -> dict:
+    """Get the partial summary of a conversation with no exchanges yet."""
+    return {
+        "current_symptoms": [],
+        "current_medications": [],
+        "exchanges": 0,  # number of doctor/patient exchanges processed
+        "complete": True,  # False once an exchange fails to be processed
+    }
+
+
+def parse_json(content: str) -> typing.Any:
+    """Parses a JSON model output, removing markdown."""
+    try:
+        return json.loads(content.replace("```json", "").replace("```", "").replace("\n", ""))
+    except json.JSONDecodeError as e:
+        raise ValueError("Failed to decode JSON from model output") from e
+
+
+class IncrementalExtractor:
+    """
+    Keeps the partial summary of one conversation up to date, one exchange at a time.
+    """
+
+    def __init__(
+        self,
+        session_id: uuid.UUID | str | None = None,
+        model: summarizer_engine.ChatOpenAI = summarizer_engine.default_model,
+        partial_summary: dict | None = None,
+    ) -> None:
+        """
+        Args:
+            session_id (UUID | str, optional): The conversation session to save the partial
+                summary to. If None, the partial summary is only kept in memory.
+            model (ChatOpenAI, optional): The model used to update the sections.
+            partial_summary (dict, optional): The partial summary to resume from.
+        """
+        self.session_id = session_id
+        self.partial_summary = partial_summary or empty_partial_summary()
+        self.section_chains = {
+            section: ChatPromptTemplate.from_messages(
+                [
+                    ("system", system_message_update_section_json),
+                    ("user", "{exchange}"),
+                ]
+            )
+            | model
+            | StrOutputParser()
+            for section in SECTIONS
+        }
+        self._queue: typing.Deque[typing.Tuple[str, str]] = collections.deque()
+        self._lock = threading.Lock()
+        self._pending: concurrent.futures.Future | None = None
+        if session_id is not None:
+            EXTRACTORS[str(session_id)] = self
+
+    @staticmethod
+    def for_session(
+        conversation_session: data_models.ConversationSession,
+        model: summarizer_engine.ChatOpenAI = summarizer_engine.default_model,
+    ) -> "IncrementalExtractor":
+        """Creates an extractor for a conversation session, resuming its saved partial summary."""
+        partial_summary = (
+            json.loads(conversation_session.partial_summary)
+            if conversation_session.partial_summary
+            else None
+        )
+        return IncrementalExtractor(conversation_session.id, model, partial_summary)
+
+    @staticmethod
+    def changed_sections(doctor_message: str, patient_message: str) -> list[str]:
+        """Gets the sections an exchange touches."""
+        return [
+            section
+            for section in SECTIONS
+            if SECTION_KEYWORDS[section].search(doctor_message)
+            or SECTION_KEYWORDS[section].search(patient_message)
+            or (
+                section in PATIENT_SECTION_KEYWORDS
+                and PATIENT_SECTION_KEYWORDS[section].search(patient_message)
+            )
+        ]
+
+    def update(self, doctor_message: str, patient_message: str) -> dict:
+        """
+        Applies one doctor/patient exchange to the partial summary, and saves it.
+
+        Args:
+            doctor_message (str): The doctor message.
+            patient_message (str): The patient's answer.
+
+        Returns:
+            dict: The updated partial summary.
+        """
+        partial_summary = dict(self.partial_summary)
+
+        # Symptoms and medications: updated by the LLM, only if the exchange touches them
+        exchange = f"Doctor: {doctor_message}\nPatient: {patient_message}"
+        for section in self.changed_sections(doctor_message, patient_message):
+            updated = parse_json(
+                self.section_chains[section].invoke(
+                    {
+                        "section": section.replace("_", " "),
+                        "conventions": section_conventions[section],
+                        "current": json.dumps(partial_summary[section]),
+                        "exchange": exchange,
+                    }
+                )
+            )
+            if not isinstance(updated, list):
+                raise ValueError(f"Expected a JSON list for {section}, got {updated!r}")
+            partial_summary[section] = [str(item) for item in updated]
+
+        partial_summary["exchanges"] += 1
+        self.partial_summary = partial_summary
+        self.save()
+        return partial_summary
+
+    def submit(self, doctor_message: str, patient_message: str) -> None:
+        """
+        Queues an exchange to be applied in the background. Exchanges are applied in order.
+
+        Args:
+            doctor_message (str): The doctor message.
+            patient_message (str): The patient's answer.
+        """
+        with self._lock:
+            self._queue.append((doctor_message, patient_message))
+            if self._pending is None:
+                self._pending = EXTRACTION_EXECUTOR.submit(self._drain)
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._pending = None
+                    return
+                doctor_message, patient_message = self._queue.popleft()
+            try:
+                self.update(doctor_message, patient_message)
+            except Exception:
+                # The summary then falls back to summarizing the whole transcript
+                logger.exception(f"Incremental extraction failed for session {self.session_id}")
+                self.partial_summary = {**self.partial_summary, "complete": False}
+                self.save()
+
+    def wait(self) -> None:
+        """Waits until all queued exchanges are applied."""
+        while (pending := self._pending) is not None:
+            pending.result()
+
+    def reset(self) -> None:
+        """Resets the partial summary, e.g. when the conversation history is cleared."""
+        self.wait()
+        self.partial_summary = empty_partial_summary()
+        self.save()
+
+    def save(self) -> None:
+        """Saves the partial summary to the conversation session, if any."""
+        if self.session_id is None:
+            return
+        # a session of its own, as this usually runs in the background thread
+        with data_models.session_scope() as session:
+            data_models.ConversationSession.save_partial_summary(
+                self.session_id, self.partial_summary, session
+            )
+
+
+def wait_for_extraction(session_id: uuid.UUID | str) -> None:
+    """
+    Waits for the pending exchanges of a session's extractor (a no-op if there is none).
+
+    Args:
+        session_id (UUID | str): The session ID to wait for.
+    """
+    if extractor := EXTRACTORS.get(str(session_id)):
+        extractor.wait()
+
+
+data_models.PRE_COMPLETION_HOOKS.append(wait_for_extraction)
+
+
+def covers(partial_summary: dict | None, patient_transcript: list[str]) -> bool:
+    """Whether a partial summary was extracted from every exchange of a transcript."""
+    if not partial_summary or not partial_summary.get("complete"):
+        return False
+    patient_lines = sum(1 for line in patient_transcript if line.startswith("Patient"))
+    return partial_summary["exchanges"] >= patient_lines
+
+
+def finalize(
+    patient_transcript: list[str],
+    partial_summary: dict | None,
+    model: summarizer_engine.ChatOpenAI = summarizer_engine.default_model,
+    cache: summary_cache.SummaryCache | None = None,
+    vitals_mode: str = "llm",
+) -> typing.Tuple[data_type.TranscriptSummary, BaseMessage]:
+    """Summarizes a transcript, generating only the narrative fields and the vital signs if a
+    partial summary covers it.
+
+    Either way the LLM call goes through `summarizer_engine.summarize`, so it is cached, long
+    transcripts are summarized with map-reduce, and the vital signs follow `vitals_mode`.
+
+    Args:
+        patient_transcript (list[str]): The patient transcript to summarize.
+        partial_summary (dict, optional): The partial summary extracted during the conversation.
+        model (ChatOpenAI, optional): The model to use for summarization.
+        cache (SummaryCache, optional): The cache for the summaries. Defaults to None.
+        vitals_mode (str, optional): How the vital signs are extracted, one of
+            `summarizer_engine.VITALS_MODES`. Defaults to "llm".
+    """
+    if not covers(partial_summary, patient_transcript):
+        return summarizer_engine.summarize(
+            patient_transcript, model=model, cache=cache, vitals_mode=vitals_mode
+        )
+
+    narrative, response = summarizer_engine.summarize(
+        patient_transcript,
+        model=model,
+        system_prompt=system_message_summarize_narrative_json,
+        cache=cache,
+        vitals_mode=vitals_mode,
+    )
+    summary = dataclasses.replace(
+        narrative,
+        current_symptoms=partial_summary["current_symptoms"],
+        current_medications=partial_summary["current_medications"],
+    )
+    return summary, response
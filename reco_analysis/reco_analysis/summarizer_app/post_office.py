@@ -1,5 +1,24 @@
+"""Post Office.
+
+This module emails the PDF reports to the healthcare providers.
+
+Emails go through an `Outbox`, which keeps one authenticated SMTP connection open across messages
+instead of connecting, starting TLS and logging in for every report. A connection that was idle
+for a while is checked with NOOP before it is reused, and a dropped connection is reopened and the
+message retried. Messages can also be queued with `Outbox.enqueue` and sent in batches with
+`Outbox.flush`, in the order they were queued: a message that still fails after its retries goes
+back to the head of the queue and stops the flush. `rate_per_second` spaces out messages to stay
+within the provider's rate limits.
+
+The SMTP settings are read from the environment (see `.env.example`); `SMTP_STARTTLS=false` and
+an empty `SMTP_USER`/`SMTP_PASSWORD` allow a local stand-in server, e.g. `aiosmtpd`, in tests."""
+
+import collections
+import dataclasses
 import os
 import smtplib
+import threading
+import time
 from email.headerregistry import Address
 from email.message import EmailMessage
 from email.utils import make_msgid
@@ -16,31 +35,230 @@ If intervention is needed, you can reach out to the patient at {patient_email}\n
 -- RECO"""
 
 
-def email_report(
+@dataclasses.dataclass
+class SMTPSettings:
+    server: str
+    port: int
+    user: str | None = None
+    password: str | None = None
+    starttls: bool = True
+    sender: str | None = None  # defaults to the user
+
+    @staticmethod
+    def from_env() -> "SMTPSettings":
+        """Read the SMTP settings from the environment variables."""
+        smtp_server = os.getenv("SMTP_SERVER")
+        smtp_port = os.getenv("SMTP_PORT")
+        smtp_user = os.getenv("SMTP_USER")
+        smtp_password = os.getenv("SMTP_PASSWORD")
+        starttls = os.getenv("SMTP_STARTTLS", "true").lower() != "false"
+
+        # a login is required unless the server is a local stand-in without TLS
+        if not all([smtp_server, smtp_port]) or (starttls and not all([smtp_user, smtp_password])):
+            raise ValueError("SMTP server details are missing in the environment variables.")
+
+        return SMTPSettings(
+            server=smtp_server,
+            port=int(smtp_port),
+            user=smtp_user,
+            password=smtp_password,
+            starttls=starttls,
+            sender=os.getenv("SMTP_SENDER") or smtp_user,
+        )
+
+
+# Errors after which the connection is reopened and the message retried
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError)
+
+
+class Outbox:
+    """
+    Sends emails over one persistent, authenticated SMTP connection.
+
+    Thread-safe: messages are sent one at a time over the shared connection.
+    """
+
+    def __init__(
+        self,
+        settings: SMTPSettings,
+        rate_per_second: float | None = None,
+        batch_size: int = 50,
+        idle_timeout: float = 60.0,
+        max_attempts: int = 3,
+        retry_backoff: float = 1.0,
+        timeout: float = 30.0,
+    ) -> None:
+        """
+        Args:
+            settings (SMTPSettings): The SMTP server and credentials.
+            rate_per_second (float, optional): The maximum number of messages sent per second.
+                Defaults to None (no limit).
+            batch_size (int, optional): The maximum number of queued messages sent per batch by
+                `flush`; the connection is checked between batches. Defaults to 50.
+            idle_timeout (float, optional): A connection idle for longer than this is checked
+                with NOOP before it is reused. Defaults to 60 seconds.
+            max_attempts (int, optional): The number of attempts per message when the
+                connection drops. Defaults to 3.
+            retry_backoff (float, optional): Seconds to wait before the first retry, doubled for
+                each further retry. Defaults to 1 second.
+            timeout (float, optional): The socket timeout. Defaults to 30 seconds.
+        """
+        self.settings = settings
+        self.rate_per_second = rate_per_second
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.connections_opened = 0
+        self.messages_sent = 0
+        self._connection: smtplib.SMTP | None = None
+        self._last_used = 0.0
+        self._last_sent = 0.0
+        self._lock = threading.RLock()
+        self._queue: collections.deque[EmailMessage] = collections.deque()
+
+    def __enter__(self) -> "Outbox":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.settings.server, self.settings.port, timeout=self.timeout)
+        try:
+            if self.settings.starttls:
+                connection.starttls()  # Secure the connection
+            if self.settings.user and self.settings.password:
+                connection.login(self.settings.user, self.settings.password)
+        except BaseException:
+            connection.close()
+            raise
+        self.connections_opened += 1
+        return connection
+
+    def _check_connection(self) -> None:
+        """Close the connection if the server no longer answers NOOP on it."""
+        if self._connection is None:
+            return
+        try:
+            if self._connection.noop()[0] != 250:
+                self.close()
+        except (smtplib.SMTPException, OSError):
+            self.close()
+
+    def _get_connection(self) -> smtplib.SMTP:
+        """Get the open connection, checking it if it was idle, or open a new one."""
+        if time.monotonic() - self._last_used > self.idle_timeout:
+            self._check_connection()
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection
+
+    def _throttle(self) -> None:
+        if self.rate_per_second:
+            wait = self._last_sent + 1 / self.rate_per_second - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+    def send(self, message: EmailMessage) -> None:
+        """
+        Send a message now, reconnecting and retrying if the connection drops.
+
+        Args:
+            message (EmailMessage): The message to send.
+        """
+        with self._lock:
+            self._throttle()
+            for attempt in range(self.max_attempts):
+                try:
+                    self._get_connection().send_message(message)
+                    break
+                except RECONNECT_ERRORS:
+                    self.close()
+                    if attempt == self.max_attempts - 1:
+                        raise
+                    time.sleep(self.retry_backoff * 2**attempt)
+            self._last_sent = self._last_used = time.monotonic()
+            self.messages_sent += 1
+
+    def enqueue(self, message: EmailMessage) -> None:
+        """Queue a message to be sent by `flush`."""
+        self._queue.append(message)
+
+    def flush(self) -> int:
+        """
+        Send the queued messages in order, in batches of at most `batch_size`. A message that
+        cannot be sent is put back at the head of the queue, and the error raised, so the next
+        flush resumes from it.
+
+        Returns:
+            int: The number of messages sent.
+        """
+        sent = 0
+        with self._lock:
+            while self._queue:
+                self._check_connection()
+                for _ in range(min(self.batch_size, len(self._queue))):
+                    message = self._queue.popleft()
+                    try:
+                        self.send(message)
+                    except Exception:
+                        self._queue.appendleft(message)
+                        raise
+                    sent += 1
+        return sent
+
+    def __len__(self) -> int:
+        """The number of queued messages."""
+        return len(self._queue)
+
+    def close(self) -> None:
+        """Close the connection, if open. The next message opens a new one."""
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._connection.quit()
+            except (smtplib.SMTPException, OSError):
+                self._connection.close()
+            self._connection = None
+
+
+DEFAULT_OUTBOX: Outbox | None = None
+
+
+def get_outbox() -> Outbox:
+    """Get the outbox shared across the process, configured from the environment variables."""
+    global DEFAULT_OUTBOX
+    if DEFAULT_OUTBOX is None:
+        rate_per_second = os.getenv("SMTP_RATE_PER_SECOND")
+        DEFAULT_OUTBOX = Outbox(
+            SMTPSettings.from_env(),
+            rate_per_second=float(rate_per_second) if rate_per_second else None,
+        )
+    return DEFAULT_OUTBOX
+
+
+def build_report_email(
     pdf_bytes: bytes,
     hcp: data_models.HealthcareProvider,
     patient: data_models.Patient,
     conversation_session: data_models.ConversationSession,
-) -> bool:
-    """Send an email with a PDF report as an attachment.
+    sender: str,
+) -> EmailMessage:
+    """Build the email of a PDF report, with the report as an attachment.
 
     Args:
         pdf_bytes (bytes): The bytes of the PDF report.
-        hcp_email (str): Email address of the healthcare provider.
-        patient_name (str): Name of the patient for contextual email content.
+        hcp (HealthcareProvider): The healthcare provider to send the report to.
+        patient (Patient): The patient, for contextual email content.
+        conversation_session (ConversationSession): The reported conversation session.
+        sender (str): The sender's email address.
 
     Returns:
-        bool: True if the email was sent successfully.
+        EmailMessage: The email.
     """
-    # Email setup
-    smtp_server = os.getenv("SMTP_SERVER")
-    smtp_port = int(os.getenv("SMTP_PORT"))
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_password = os.getenv("SMTP_PASSWORD")
-
-    if not all([smtp_server, smtp_port, smtp_user, smtp_password]):
-        raise ValueError("SMTP server details are missing in the environment variables.")
-
     # Email content
     patient_name = patient.first_name + " " + str(patient.last_name).upper()
     session_date = conversation_session.created_at
@@ -58,7 +276,7 @@ def email_report(
     # Create the email message
     msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = Address(display_name="RECO", addr_spec=smtp_user)
+    msg["From"] = Address(display_name="RECO", addr_spec=sender)
     msg["To"] = hcp.email
     msg.set_content(body)
 
@@ -71,14 +289,33 @@ def email_report(
         filename=f"RECO summary - {patient_name} - {session_date_numbers_only}.pdf",
         cid=as_cid[1:-1],
     )
+    return msg
+
 
-    # breakpoint()  # throttling this for now, don't want to spam while testing
+def email_report(
+    pdf_bytes: bytes,
+    hcp: data_models.HealthcareProvider,
+    patient: data_models.Patient,
+    conversation_session: data_models.ConversationSession,
+    outbox: Outbox | None = None,
+) -> bool:
+    """Send an email with a PDF report as an attachment.
+
+    Args:
+        pdf_bytes (bytes): The bytes of the PDF report.
+        hcp (HealthcareProvider): The healthcare provider to send the report to.
+        patient (Patient): The patient, for contextual email content.
+        conversation_session (ConversationSession): The reported conversation session.
+        outbox (Outbox, optional): The outbox to send with. Defaults to `get_outbox()`.
+
+    Returns:
+        bool: True if the email was sent successfully.
+    """
+    outbox = outbox or get_outbox()
+    msg = build_report_email(pdf_bytes, hcp, patient, conversation_session, outbox.settings.sender)
 
     # Send the email
-    with smtplib.SMTP(smtp_server, smtp_port) as server:
-        server.starttls()  # Secure the connection
-        server.login(smtp_user, smtp_password)
-        server.send_message(msg)
-        print("Email sent successfully!")
+    outbox.send(msg)
+    print("Email sent successfully!")
 
     return True
@@ -31,3 +31,86 @@ Write a one-sentence summary about primary symptoms or chief complaint and the m
 JSON format:
 {{"patient_overview": "text", "current_symptoms": ["text", "text", ...], "vital_signs": {{"temperature": number|null, "heart_rate": number|null, "respiratory_rate": number|null, "oxygen_saturation": number|null, "blood_pressure_systolic": number|null, "blood_pressure_diastolic": number|null, "weight": number|null}}, "current_medications": ["text", "text", ...], "summary": "text"]}}
 """
+
+
+def remove_between(text: str, start: str, end: str) -> str:
+    """Removes the part of `text` from `start` up to (not including) `end`."""
+    return text[: text.index(start)] + text[text.index(end) :]
+
+
+# Without the vital signs, which are then parsed from the transcript (see `vitals_parser`)
+system_message_summarize_json_no_vitals = remove_between(
+    remove_between(system_message_summarize_json, '# "vital_signs"', '# "current_medications"'),
+    '"vital_signs": {{',
+    '"current_medications": [',
+).replace(', and provide a dictionary/object for "vital_signs".', ".")
+
+system_message_update_section_json = """
+You are a medical assistant keeping a running list of the {section} of a heart failure patient while the patient talks to a medical chatbot. You are given the current list and the latest exchange of the conversation. Return the current list updated with what the patient says in the latest exchange, as a JSON list of texts (do not use indents or new-lines). Do not wrap the output in backquotes '```'. Keep the texts of the current list unless the patient corrects them. Do not add any information that is not present in the exchange. Avoid any language that implies a diagnosis or interpretation of the patient's condition.
+{conventions}
+Current list:
+{current}
+"""
+
+section_conventions = {
+    "current_symptoms": """
+Add context to symptoms where appropriate, but be brief. The following symptoms are commonly associated with heart failure, but symptoms that do not match here should still be included:
+- Dyspnea - present if patient mentions shortness of breath
+- Paroxysmal Nocturnal Dyspnea (PND) -- present if patient mentions waking up at night with shortness of breath
+- Orthopnea - present if patient mentions needing to prop themselves up with pillows to breathe comfortably while lying down, this is orthopnea
+- Edema - present if patient mentions swelling in legs or ankles
+- Nocturnal Cough
+- Chest Pain
+- Fatigue and Mental Status -- or questions about mental clarity
+""",
+    "current_medications": """
+List specific medications by name under the appropriate medication category. Medications mentions that are similar should be grouped together into a single text, e.g. "Beta-Blocker - Metoprolol" (Metoprolol is a beta-blocker), and not be broken down into multiple texts.
+""",
+}
+
+system_message_summarize_narrative_json = """
+You are a medical assistant tasked with reviewing a transcript of a conversation between a patient and a medical chatbot. The symptoms and medications have already been extracted. Your task is to write the "patient_overview" and the "summary" of the transcript, and to provide a dictionary/object for "vital_signs". Do not add any information that is not present in the transcript. Avoid any language that implies a diagnosis or interpretation of the patient's condition. Stick to reporting the facts. Return in JSON format (do not use indents or new-lines). Do not wrap the output in backquotes '```'.
+
+# "patient_overview"
+Write a one-sentence summary about primary symptoms or chief complaint and the most important information about the patient.
+
+# "vital_signs" (Note: if any specific vital sign is not mentioned in the transcript, set it to JSON null):
+- temperature (°F):
+- heart_rate (bpm):
+- respiratory_rate (bpm):
+- oxygen_saturation (%):
+- blood_pressure_systolic (mmHg):
+- blood_pressure_diastolic (mmHg):
+- weight (lbs):
+
+# "summary"
+- In 2-to-5 sentences at a high level, summarize a few key points from the transcript. Include the symptoms that the patient confirms, and the symptoms that the patient denies. Do not list vital sign details in this section. Refer to patient as "Patient," not by their name. Avoid any interpretation of the patient's condition or vital signs. Mention if the patient is unable to provide any vitals measurements.
+
+JSON format:
+{{"patient_overview": "text", "vital_signs": {{"temperature": number|null, "heart_rate": number|null, "respiratory_rate": number|null, "oxygen_saturation": number|null, "blood_pressure_systolic": number|null, "blood_pressure_diastolic": number|null, "weight": number|null}}, "summary": "text"}}
+"""
+
+system_message_summarize_narrative_json_no_vitals = remove_between(
+    remove_between(system_message_summarize_narrative_json, '# "vital_signs"', '# "summary"'),
+    '"vital_signs": {{',
+    '"summary": "text"',
+).replace(', and to provide a dictionary/object for "vital_signs".', ".")
+
+system_message_reduce_summaries_json = """
+You are a medical assistant tasked with combining the summaries of consecutive parts of one transcript of a conversation between a patient and a medical chatbot into a single summary. The summaries are given in order, as JSON. Provide texts for "patient_overview" and "summary", and provide lists of texts for "current_symptoms", and "current_medications". Do not add any information that is not present in the summaries. Avoid any language that implies a diagnosis or interpretation of the patient's condition. Stick to reporting the facts. Return in JSON format (do not use indents or new-lines). Do not wrap the output in backquotes '```'.
+
+# "patient_overview"
+Write a one-sentence summary about primary symptoms or chief complaint and the most important information about the patient.
+
+# "current_symptoms"
+- Merge the symptoms of all parts. Symptoms mentioned in several parts should be listed once; if the parts disagree, keep what the patient said last.
+
+# "current_medications"
+- Merge the medications of all parts. Medications mentions that are similar should be grouped together into a single text, e.g. "Beta-Blocker - Metoprolol" (Metoprolol is a beta-blocker), and not be broken down into multiple texts.
+
+# "summary"
+- In 2-to-5 sentences at a high level, summarize a few key points from the summaries. Include the symptoms that the patient confirms, and the symptoms that the patient denies. Do not list vital sign details in this section. Refer to patient as "Patient," not by their name. Avoid any interpretation of the patient's condition or vital signs. Mention if the patient is unable to provide any vitals measurements.
+
+JSON format:
+{{"patient_overview": "text", "current_symptoms": ["text", "text", ...], "current_medications": ["text", "text", ...], "summary": "text"}}
+"""
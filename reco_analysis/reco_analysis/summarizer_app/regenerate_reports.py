@@ -0,0 +1,223 @@
+"""
+Regenerate the PDF reports of completed conversation sessions in bulk, e.g. after a change to the
+report template or for an audit.
+
+Completed sessions are streamed from the database with their stored summaries, optionally
+filtered by healthcare provider and by date range. The reports are rendered in a pool of processes
+(one per core by default), since rendering is CPU-bound, and written to a directory or, if the
+output path ends with ".zip", to a zip file. The LLM is never called: sessions without a stored
+summary are skipped and counted.
+
+Usage:
+    python -m reco_analysis.summarizer_app.regenerate_reports reports/ --provider-id 1
+    python -m reco_analysis.summarizer_app.regenerate_reports audit.zip --start 2024-08-01 --end 2024-09-01
+"""
+
+import concurrent.futures
+import datetime
+import os
+import time
+import typing
+import zipfile
+from pathlib import Path
+
+import typer
+from loguru import logger
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from reco_analysis.data_model import data_models
+from reco_analysis.summarizer_app import data_type, report_maker
+
+app = typer.Typer()
+
+ReportArgs = typing.Tuple[
+    data_type.TranscriptSummary, list[str], str, str, datetime.datetime, datetime.datetime
+]
+
+
+def stream_sessions(
+    session: Session,
+    provider_id: int | None = None,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    batch_size: int = 100,
+) -> typing.Iterator[data_models.ConversationSession]:
+    """Stream the completed conversation sessions, oldest first, with their patient and messages.
+
+    Args:
+        session (Session): The database session.
+        provider_id (int, optional): Only the sessions of this healthcare provider's patients.
+        start (datetime, optional): Only the sessions created at or after this time.
+        end (datetime, optional): Only the sessions created before this time.
+        batch_size (int, optional): The number of sessions loaded from the database at a time.
+    """
+    query = (
+        session.query(data_models.ConversationSession)
+        .join(data_models.Patient)
+        .filter(data_models.ConversationSession.completed.is_(True))
+        .options(
+            joinedload(data_models.ConversationSession.patient),
+            # the transcript and the end time only, not the JSON messages
+            selectinload(data_models.ConversationSession.messages).load_only(
+                data_models.Message.role,
+                data_models.Message.content,
+                data_models.Message.timestamp,
+            ),
+        )
+        .order_by(data_models.ConversationSession.created_at)
+    )
+    if provider_id is not None:
+        query = query.filter(data_models.Patient.healthcare_provider_id == provider_id)
+    if start is not None:
+        query = query.filter(data_models.ConversationSession.created_at >= start)
+    if end is not None:
+        query = query.filter(data_models.ConversationSession.created_at < end)
+    yield from query.yield_per(batch_size)
+
+
+def report_args(conversation_session: data_models.ConversationSession) -> ReportArgs:
+    """Get the arguments to render a session's report from its stored summary."""
+    return (
+        conversation_session.transcript_summary,
+        conversation_session.get_transcript(),
+        conversation_session.patient.first_name,
+        conversation_session.patient.last_name,
+        conversation_session.created_at,
+        conversation_session.messages[-1].timestamp,
+    )
+
+
+def report_filename(conversation_session: data_models.ConversationSession) -> str:
+    patient = conversation_session.patient
+    return (
+        f"{patient.last_name}_{patient.first_name}_"
+        f"{conversation_session.created_at:%Y%m%d-%H%M}_{conversation_session.id}.pdf"
+    )
+
+
+def render_report(args: ReportArgs) -> bytes:
+    """Render a report in a worker process, reusing the process's renderer."""
+    return report_maker.get_default_renderer().render(*args)
+
+
+class ReportWriter:
+    """Writes reports to a directory, or to a zip file if the path ends with ".zip"."""
+
+    def __init__(self, output_path: Path) -> None:
+        self.output_path = Path(output_path)
+        self.zip_file: zipfile.ZipFile | None = None
+        if self.output_path.suffix == ".zip":
+            self.output_path.parent.mkdir(parents=True, exist_ok=True)
+            # PDF streams are already compressed
+            self.zip_file = zipfile.ZipFile(self.output_path, "w", zipfile.ZIP_STORED)
+        else:
+            self.output_path.mkdir(parents=True, exist_ok=True)
+
+    def write(self, filename: str, pdf_report: bytes) -> None:
+        if self.zip_file is not None:
+            self.zip_file.writestr(filename, pdf_report)
+        else:
+            (self.output_path / filename).write_bytes(pdf_report)
+
+    def close(self) -> None:
+        if self.zip_file is not None:
+            self.zip_file.close()
+
+
+def regenerate_reports(
+    sessions: typing.Iterable[data_models.ConversationSession],
+    writer: ReportWriter,
+    workers: int | None = None,
+    log_every: int = 100,
+) -> typing.Dict[str, float]:
+    """Render the reports of conversation sessions in a process pool and write them.
+
+    At most twice as many reports as workers are in flight, so memory stays bounded however many
+    sessions are streamed.
+
+    Args:
+        sessions (Iterable[ConversationSession]): The sessions, e.g. from `stream_sessions`.
+        writer (ReportWriter): Where to write the reports.
+        workers (int, optional): The number of processes. Defaults to the number of cores.
+        log_every (int, optional): Log progress every this many reports.
+
+    Returns:
+        dict: The number of reports written, sessions skipped and failed reports, the elapsed
+            seconds and the throughput in reports per second.
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = {"written": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+
+    def collect(done: typing.Iterable[concurrent.futures.Future]) -> None:
+        for future in done:
+            filename = pending.pop(future)
+            try:
+                writer.write(filename, future.result())
+            except Exception as e:
+                logger.warning(f"Failed to render {filename}: {e}")
+                stats["failed"] += 1
+                continue
+            stats["written"] += 1
+            if stats["written"] % log_every == 0:
+                elapsed = time.perf_counter() - start
+                logger.info(
+                    f"{stats['written']} reports written, {stats['written'] / elapsed:.1f} reports/s"
+                )
+
+    pending: typing.Dict[concurrent.futures.Future, str] = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for conversation_session in sessions:
+            if not conversation_session.summary or not conversation_session.messages:
+                stats["skipped"] += 1
+                continue
+            try:
+                args = report_args(conversation_session)
+            except ValueError as e:
+                logger.warning(f"Skipping session {conversation_session.id}: {e}")
+                stats["skipped"] += 1
+                continue
+            future = executor.submit(render_report, args)
+            pending[future] = report_filename(conversation_session)
+            if len(pending) >= 2 * workers:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                collect(done)
+        collect(list(pending))
+
+    stats["elapsed"] = time.perf_counter() - start
+    stats["reports_per_second"] = stats["written"] / stats["elapsed"] if stats["elapsed"] else 0.0
+    return stats
+
+
+@app.command()
+def main(
+    output_path: Path = typer.Argument(..., help='A directory, or a file ending with ".zip".'),
+    provider_id: typing.Optional[int] = None,
+    start: typing.Optional[datetime.datetime] = None,
+    end: typing.Optional[datetime.datetime] = None,
+    workers: typing.Optional[int] = None,
+    batch_size: int = 100,
+):
+    writer = ReportWriter(output_path)
+    try:
+        with Session(data_models.get_engine()) as session:
+            stats = regenerate_reports(
+                stream_sessions(session, provider_id, start, end, batch_size),
+                writer,
+                workers=workers,
+            )
+    finally:
+        writer.close()
+
+    logger.info(
+        f"Wrote {stats['written']} reports in {stats['elapsed']:.1f}s "
+        f"({stats['reports_per_second']:.1f} reports/s), skipped {stats['skipped']} sessions "
+        f"without a stored summary, {stats['failed']} failed"
+    )
+    logger.success(f"Reports saved to {output_path}")
+
+
+if __name__ == "__main__":
+    app()
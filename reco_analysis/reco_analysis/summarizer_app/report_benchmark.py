@@ -0,0 +1,89 @@
+"""
+Benchmark the patient report rendering for transcripts of increasing length.
+
+"cold" creates a new `ReportRenderer` for each report, which is what every report paid before
+the logo and styles were reused; "warm" reuses one renderer, as `create_patient_report` does.
+Reports the mean time per report and the report size.
+
+Usage:
+    python -m reco_analysis.summarizer_app.report_benchmark --lines 30 --lines 300 --lines 3000
+"""
+
+import datetime
+import time
+import typing
+
+import typer
+from loguru import logger
+
+from reco_analysis.summarizer_app import data_type, report_maker
+
+app = typer.Typer()
+
+summary_data = data_type.TranscriptSummary(
+    patient_overview="Patient reports increased shortness of breath and swelling in the ankles.",
+    current_symptoms=[
+        "Dyspnea when climbing stairs",
+        "Orthopnea - sleeps on 3 pillows",
+        "Edema - swelling in both ankles",
+    ],
+    vital_signs=data_type.VitalSigns(
+        temperature=98.0,
+        heart_rate=72,
+        respiratory_rate=18,
+        oxygen_saturation=92,
+        blood_pressure_systolic=186,
+        blood_pressure_diastolic=106,
+        weight=180,
+    ),
+    current_medications=["ACE inhibitor - Lisinopril", "Beta-Blocker - Metoprolol"],
+    summary="Patient confirms shortness of breath, orthopnea and edema, and denies chest pain.",
+)
+
+
+def make_transcript(lines: int) -> list[str]:
+    return [
+        (
+            "Doctor: How have you been feeling since our last conversation?"
+            if i % 2 == 0
+            else "Patient: I have been a bit more tired than usual, and my ankles are swollen."
+        )
+        for i in range(lines)
+    ]
+
+
+def benchmark(
+    render: typing.Callable[[list[str]], bytes], transcript: list[str], repeats: int
+) -> typing.Tuple[float, int]:
+    """Get the mean time per report and the report size."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        pdf_report = render(transcript)
+    return (time.perf_counter() - start) / repeats, len(pdf_report)
+
+
+@app.command()
+def main(lines: typing.List[int] = typer.Option([30, 300, 3000]), repeats: int = 5):
+    end_time = datetime.datetime.now()
+    start_time = end_time - datetime.timedelta(minutes=20)
+    renderer = report_maker.ReportRenderer()
+
+    def render_cold(transcript: list[str]) -> bytes:
+        return report_maker.ReportRenderer().render(
+            summary_data, transcript, "John", "Doe", start_time, end_time
+        )
+
+    def render_warm(transcript: list[str]) -> bytes:
+        return renderer.render(summary_data, transcript, "John", "Doe", start_time, end_time)
+
+    for count in lines:
+        transcript = make_transcript(count)
+        for name, render in [("cold", render_cold), ("warm", render_warm)]:
+            elapsed, size = benchmark(render, transcript, repeats)
+            logger.info(
+                f"{count:>5} lines, {name}: {1000 * elapsed:.1f} ms/report, {size / 1024:.0f} KiB"
+            )
+
+
+if __name__ == "__main__":
+    app()
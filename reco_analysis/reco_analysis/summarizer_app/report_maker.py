@@ -6,182 +6,276 @@ patient's conversation with the virtual doctor.
 Input: A TranscriptSummary object.
 
 Output: A PDF report summarizing the patient's overview, current symptoms, vital.
+
+Reports are rendered in memory by a `ReportRenderer`, which loads the logo and builds the styles
+once; `create_patient_report` uses one shared per process. Pass a `report_store.ReportStore` to
+`create_patient_report` to reuse reports that were already rendered from the same inputs. To
+measure rendering time, run `python -m reco_analysis.summarizer_app.report_benchmark`.
 """
 
-import copy
 import datetime
+import io
 import os
 
 from PIL import Image as PILImage
 from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.utils import ImageReader, simpleSplit
 from reportlab.pdfgen import canvas
 from reportlab.platypus import Paragraph
 
-from reco_analysis.summarizer_app import data_type
+from reco_analysis.summarizer_app import data_type, report_store
 
 reco_analysis_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 logo_path = os.path.join(reco_analysis_path, "static", "reco_logo.jpeg")
 
+# The logo is drawn at a quarter of its pixel size (in points), and embedded at twice that
+LOGO_SCALE = 1 / 4
+LOGO_RESOLUTION = 2
 
-def create_patient_report(
-    summary_data: data_type.TranscriptSummary,
-    transcript: list[str],
-    patient_first_name: str,
-    patient_last_name: str,
-    conversation_start_time: datetime.datetime,
-    conversation_end_time: datetime.datetime,
-    output_filename: str | None = None,
-) -> bytes:
-    """Create a PDF report summarizing the patient's conversation with the virtual doctor.
+# Set font styles
+title_style = "Helvetica-Bold"
+section_title_style = "Helvetica-Bold"
+section_content_style = "Helvetica"
 
-    Args:
-        summary_data (data_type.TranscriptSummary): The summary data of the patient's conversation.
-        transcript (list[str]): The transcript of the patient's conversation.
-        output_filename (str): The output filename for the PDF report.
 
-    Returns:
-        A file object of the PDF report.
-    """
-    c = canvas.Canvas(output_filename, pagesize=letter)
-
-    logo = PILImage.open(logo_path)
-    img_width, img_height = logo.size
-
-    # Set font styles
-    title_style = "Helvetica-Bold"
-    section_title_style = "Helvetica-Bold"
-    section_content_style = "Helvetica"
-
-    # Draw logo and title
-    title = "RECO Patient Report"
-    c.setFont(title_style, 18)
-    c.drawImage(logo_path, 50, 720, width=img_width / 4, height=img_height / 4)
-    c.drawString(88, 727, title)
-    c.line(50, 710, 550, 710)  # Draw a line under the title
-
-    # Draw patient name and conversation date
-    c.setFont(section_content_style, 11)
-    c.drawString(50, 695, f"Patient: {patient_first_name}, {patient_last_name.upper()}")
-    # get the duration of the conversation in 00d 00h 00m format
-    hh, mm = divmod((conversation_end_time - conversation_start_time).seconds / 60, 60)
-    c.drawString(
-        50,
-        680,
-        f"Conversation Date: {conversation_start_time.strftime('%B %d, %Y %I:%M %p')} "
-        f"- {conversation_end_time.strftime('%I:%M %p')} ({int(hh)}h {int(mm)}m)",
-    )
+class ReportRenderer:
+    """Renders patient reports, reusing the logo and paragraph styles across reports.
 
-    # Vertical position for content
-    y_position = 665
-
-    # Define paragraph styles
-    styles = getSampleStyleSheet()
-    body_style = styles["Normal"]
-    body_style.fontName = "Helvetica"
-    body_style.fontSize = 11
-    body_style.leading = 14
-
-    bulleted_body_style = copy.deepcopy(body_style)
-    bulleted_body_style.leftIndent = 10
-
-    def start_new_page_if_needed(new_height):
-        """Check if the line will fit on the current page, if not, start a new page"""
-        nonlocal y_position
-        if y_position - new_height < 50:
-            c.showPage()
-            y_position = letter[1] - 50
-
-    vitals_lines = "\n".join(
-        [
-            f"Temperature: {summary_data.vital_signs.temperature or 'N/A'} °F",
-            f"Heart Rate: {summary_data.vital_signs.heart_rate or 'N/A'} bpm",
-            f"Respiratory Rate: {summary_data.vital_signs.respiratory_rate or 'N/A'} bpm",
-            f"Oxygen Saturation: {summary_data.vital_signs.oxygen_saturation or 'N/A'} %",
-            (
-                "Blood Pressure: "
-                + (
-                    f"{summary_data.vital_signs.blood_pressure_systolic}/{summary_data.vital_signs.blood_pressure_diastolic}"
-                    if summary_data.vital_signs.blood_pressure_systolic
-                    and summary_data.vital_signs.blood_pressure_diastolic
-                    else "N/A"
-                )
-            ),
-            f"Weight: {summary_data.vital_signs.weight or 'N/A'} lbs",
-        ]
-    )
+    The logo is decoded and downscaled once, and the paragraph styles are built once, so that
+    rendering many reports (e.g. in the summarizer worker or a bulk regeneration) only pays for
+    the layout of each report.
+    """
 
-    # Iterate through the sections and draw each section
-    for key, value in [
-        ("Patient Overview", summary_data.patient_overview),
-        ("Current Symptoms", summary_data.current_symptoms),
-        ("Vital Signs", vitals_lines),
-        ("Current Medications", summary_data.current_medications),
-        ("Summary", summary_data.summary),
-    ]:
-        value = copy.deepcopy(value)
-
-        # Section title
+    def __init__(self, logo_path: str = logo_path) -> None:
+        logo = PILImage.open(logo_path)
+        img_width, img_height = logo.size
+        self.logo_size = (img_width * LOGO_SCALE, img_height * LOGO_SCALE)
+        self.logo = ImageReader(
+            logo.convert("RGB").resize(
+                (
+                    max(1, round(self.logo_size[0] * LOGO_RESOLUTION)),
+                    max(1, round(self.logo_size[1] * LOGO_RESOLUTION)),
+                ),
+                PILImage.LANCZOS,
+            )
+        )
+
+        # Define paragraph styles
+        self.body_style = ParagraphStyle(
+            "ReportBody",
+            parent=getSampleStyleSheet()["Normal"],
+            fontName="Helvetica",
+            fontSize=11,
+            leading=14,
+        )
+        self.bulleted_body_style = ParagraphStyle(
+            "ReportBulletedBody", parent=self.body_style, leftIndent=10
+        )
+
+    def render(
+        self,
+        summary_data: data_type.TranscriptSummary,
+        transcript: list[str],
+        patient_first_name: str,
+        patient_last_name: str,
+        conversation_start_time: datetime.datetime,
+        conversation_end_time: datetime.datetime,
+    ) -> bytes:
+        """Render a patient report in memory. See `create_patient_report`.
+
+        Returns:
+            bytes: The PDF report.
+        """
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=letter)
+        body_style = self.body_style
+        bulleted_body_style = self.bulleted_body_style
+
+        # Draw logo and title
+        title = "RECO Patient Report"
+        c.setFont(title_style, 18)
+        c.drawImage(self.logo, 50, 720, width=self.logo_size[0], height=self.logo_size[1])
+        c.drawString(88, 727, title)
+        c.line(50, 710, 550, 710)  # Draw a line under the title
+
+        # Draw patient name and conversation date
+        c.setFont(section_content_style, 11)
+        c.drawString(50, 695, f"Patient: {patient_first_name}, {patient_last_name.upper()}")
+        # get the duration of the conversation in 00d 00h 00m format
+        hh, mm = divmod((conversation_end_time - conversation_start_time).seconds / 60, 60)
+        c.drawString(
+            50,
+            680,
+            f"Conversation Date: {conversation_start_time.strftime('%B %d, %Y %I:%M %p')} "
+            f"- {conversation_end_time.strftime('%I:%M %p')} ({int(hh)}h {int(mm)}m)",
+        )
+
+        # Vertical position for content
+        y_position = 665
+
+        def start_new_page_if_needed(new_height):
+            """Check if the line will fit on the current page, if not, start a new page"""
+            nonlocal y_position
+            if y_position - new_height < 50:
+                c.showPage()
+                y_position = letter[1] - 50
+
+        vitals_lines = "\n".join(
+            [
+                f"Temperature: {summary_data.vital_signs.temperature or 'N/A'} °F",
+                f"Heart Rate: {summary_data.vital_signs.heart_rate or 'N/A'} bpm",
+                f"Respiratory Rate: {summary_data.vital_signs.respiratory_rate or 'N/A'} bpm",
+                f"Oxygen Saturation: {summary_data.vital_signs.oxygen_saturation or 'N/A'} %",
+                (
+                    "Blood Pressure: "
+                    + (
+                        f"{summary_data.vital_signs.blood_pressure_systolic}/{summary_data.vital_signs.blood_pressure_diastolic}"
+                        if summary_data.vital_signs.blood_pressure_systolic
+                        and summary_data.vital_signs.blood_pressure_diastolic
+                        else "N/A"
+                    )
+                ),
+                f"Weight: {summary_data.vital_signs.weight or 'N/A'} lbs",
+            ]
+        )
+
+        # Iterate through the sections and draw each section
+        for key, value in [
+            ("Patient Overview", summary_data.patient_overview),
+            ("Current Symptoms", summary_data.current_symptoms),
+            ("Vital Signs", vitals_lines),
+            ("Current Medications", summary_data.current_medications),
+            ("Summary", summary_data.summary),
+        ]:
+            # Section title
+            c.setFont(section_title_style, 12)
+            y_position -= 20  # Move down 20 units
+            c.drawString(50, y_position, key.upper())
+
+            # Section content
+            c.setFont(section_content_style, 11)
+            y_position -= 20  # Move down another 20 units for content
+
+            if isinstance(value, str):  # patient overview, summary
+                # Replace newlines with HTML line breaks
+                summary_text = value.replace("\n", "<br/>")
+
+                if summary_text[-1] != ".":
+                    summary_text = summary_text + "."
+
+                summary_paragraph = Paragraph(summary_text, body_style)
+
+                width, height = summary_paragraph.wrap(500, 800)
+                start_new_page_if_needed(height)
+                summary_paragraph.drawOn(c, 50, y_position - height + 10)
+                y_position -= height  # Add extra space after the paragraph
+
+            elif isinstance(value, list):  # current symptoms, current medications
+                for line in value:
+                    bulleted_paragraph = Paragraph(line, bulleted_body_style, bulletText="•")
+                    width, height = bulleted_paragraph.wrap(500, 800)
+                    start_new_page_if_needed(height)
+                    bulleted_paragraph.drawOn(c, 50, y_position - height + 10)
+                    y_position -= height
+
+        # Add the transcript to the end of the file
+        c.showPage()  # Start a new page
+        y_position = letter[1] - 50  # Reset y position for new page
+
+        section_title = "Transcript"
         c.setFont(section_title_style, 12)
         y_position -= 20  # Move down 20 units
-        c.drawString(50, y_position, key.upper())
+        c.drawString(50, y_position, section_title.upper())
 
         # Section content
         c.setFont(section_content_style, 11)
         y_position -= 20  # Move down another 20 units for content
 
-        if isinstance(value, str):  # patient overview, summary
-            summary_text = value.replace("\n", "<br/>")  # Replace newlines with HTML line breaks
+        for transcript_line in transcript:
+            summary_text = transcript_line
+
+            if "Doctor" in summary_text[:6]:
+                summary_text = "DOCTOR" + summary_text[6:]
+            if "Patient" in summary_text[:7]:
+                summary_text = "PATIENT" + summary_text[7:]
+
+            # Transcript lines are plain text, so they are wrapped and drawn directly, which is
+            # much faster than laying out a Paragraph per line on long transcripts
+            text_lines = [
+                wrapped_line
+                for line in summary_text.split("\n")
+                for wrapped_line in simpleSplit(
+                    line, body_style.fontName, body_style.fontSize, 500
+                )
+            ]
+            height = len(text_lines) * body_style.leading
 
-            if summary_text[-1] != ".":
-                summary_text = summary_text + "."
+            start_new_page_if_needed(height)
+            text_object = c.beginText(50, y_position + 10 - body_style.fontSize)
+            text_object.setFont(body_style.fontName, body_style.fontSize, body_style.leading)
+            text_object.textLines(text_lines)
+            c.drawText(text_object)
+            y_position -= height + 10
 
-            summary_paragraph = Paragraph(summary_text, body_style)
+        c.save()
+        return buffer.getvalue()
 
-            width, height = summary_paragraph.wrap(500, 800)
-            start_new_page_if_needed(height)
-            summary_paragraph.drawOn(c, 50, y_position - height + 10)
-            y_position -= height  # Add extra space after the paragraph
 
-        elif isinstance(value, list):  # current symptoms, current medications
-            for line in value:
-                bulleted_paragraph = Paragraph(line, bulleted_body_style, bulletText="•")
-                width, height = bulleted_paragraph.wrap(500, 800)
-                start_new_page_if_needed(height)
-                bulleted_paragraph.drawOn(c, 50, y_position - height + 10)
-                y_position -= height
+DEFAULT_RENDERER: ReportRenderer | None = None
 
-    # Add the transcript to the end of the file
-    c.showPage()  # Start a new page
-    y_position = letter[1] - 50  # Reset y position for new page
 
-    section_title = "Transcript"
-    c.setFont(section_title_style, 12)
-    y_position -= 20  # Move down 20 units
-    c.drawString(50, y_position, section_title.upper())
+def get_default_renderer() -> ReportRenderer:
+    """Get the renderer shared by the `create_patient_report` calls of this process."""
+    global DEFAULT_RENDERER
+    if DEFAULT_RENDERER is None:
+        DEFAULT_RENDERER = ReportRenderer()
+    return DEFAULT_RENDERER
 
-    # Section content
-    c.setFont(section_content_style, 11)
-    y_position -= 20  # Move down another 20 units for content
 
-    for transcript_line in transcript:
-        # Create a paragraph with the summary text
-        summary_text = transcript_line.replace("\n", "<br/>")
+def create_patient_report(
+    summary_data: data_type.TranscriptSummary,
+    transcript: list[str],
+    patient_first_name: str,
+    patient_last_name: str,
+    conversation_start_time: datetime.datetime,
+    conversation_end_time: datetime.datetime,
+    output_filename: str | None = None,
+    store: report_store.ReportStore | None = None,
+) -> bytes:
+    """Create a PDF report summarizing the patient's conversation with the virtual doctor.
 
-        if "Doctor" in summary_text[:6]:
-            summary_text = "DOCTOR" + summary_text[6:]
-        if "Patient" in summary_text[:7]:
-            summary_text = "PATIENT" + summary_text[7:]
+    The report is rendered in memory, and only written to disk if `output_filename` is given.
 
-        summary_paragraph = Paragraph(summary_text, body_style)
-        width, height = summary_paragraph.wrap(500, 800)
+    Args:
+        summary_data (data_type.TranscriptSummary): The summary data of the patient's conversation.
+        transcript (list[str]): The transcript of the patient's conversation.
+        output_filename (str, optional): The output filename for the PDF report. Defaults to None.
+        store (ReportStore, optional): If provided, return the stored report rendered from the
+            same inputs, and store new reports. Defaults to None.
 
-        start_new_page_if_needed(height)
-        summary_paragraph.drawOn(c, 50, y_position - height + 10)
-        y_position -= height + 10
+    Returns:
+        A file object of the PDF report.
+    """
+    render_args = (
+        summary_data,
+        transcript,
+        patient_first_name,
+        patient_last_name,
+        conversation_start_time,
+        conversation_end_time,
+    )
+    if store is not None:
+        key = report_store.report_key(*render_args)
+        if (pdf_report := store.get(key)) is None:
+            pdf_report = get_default_renderer().render(*render_args)
+            store.put(key, pdf_report)
+    else:
+        pdf_report = get_default_renderer().render(*render_args)
 
     # Save the PDF file
     if output_filename:
-        c.save()
+        with open(output_filename, "wb") as file:
+            file.write(pdf_report)
 
-    return c.getpdfdata()
+    return pdf_report
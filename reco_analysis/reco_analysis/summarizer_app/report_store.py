@@ -0,0 +1,131 @@
+"""Report Store.
+
+This module contains an optional, content-addressed store of rendered PDF reports, so that
+resending or downloading a report does not render it again.
+
+The key is a hash of everything a report is rendered from: the summary, the transcript, the
+patient's name and the conversation times. Reports are stored as `<key>.pdf` files in the store
+directory. Files are written to a temporary name and then renamed, so concurrent workers never
+read a partially written report, and two workers rendering the same report write the same bytes.
+
+Reports contain protected health information, so the store is opt-in and bounded: the summarizer
+job only uses it when the `REPORT_STORE_PATH` environment variable is set, and reports older than
+`REPORT_STORE_MAX_AGE_DAYS` (7 by default) are treated as misses and deleted when a report is
+stored."""
+
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from reco_analysis.config import INTERIM_DATA_DIR
+from reco_analysis.summarizer_app import data_type
+
+DEFAULT_STORE_PATH = INTERIM_DATA_DIR / "reports"
+DEFAULT_MAX_AGE = datetime.timedelta(days=float(os.getenv("REPORT_STORE_MAX_AGE_DAYS", "7")))
+
+
+def report_key(
+    summary_data: data_type.TranscriptSummary,
+    transcript: list[str],
+    patient_first_name: str,
+    patient_last_name: str,
+    conversation_start_time: datetime.datetime,
+    conversation_end_time: datetime.datetime,
+) -> str:
+    """Get the store key of the report rendered from these inputs."""
+    to_hash = json.dumps(
+        [
+            summary_data.to_dict(),
+            transcript,
+            patient_first_name,
+            patient_last_name,
+            conversation_start_time.isoformat(),
+            conversation_end_time.isoformat(),
+        ]
+    )
+    return hashlib.sha256(to_hash.encode("utf-8")).hexdigest()
+
+
+class ReportStore:
+    def __init__(
+        self,
+        path: Path = DEFAULT_STORE_PATH,
+        max_age: datetime.timedelta | None = DEFAULT_MAX_AGE,
+    ) -> None:
+        self.path = Path(path)
+        self.max_age = max_age  # None to keep reports forever
+        self.hits = 0
+        self.misses = 0
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key: str) -> Path:
+        """Get the path of the report stored under a key (which may not exist)."""
+        return self.path / f"{key}.pdf"
+
+    def is_expired(self, path: Path) -> bool:
+        """Whether a stored report is older than `max_age`."""
+        if self.max_age is None:
+            return False
+        return time.time() - path.stat().st_mtime > self.max_age.total_seconds()
+
+    def get(self, key: str) -> bytes | None:
+        """Get the report stored under a key, or None on a miss."""
+        path = self.path_for(key)
+        try:
+            expired = self.is_expired(path)
+            pdf_report = None if expired else path.read_bytes()
+        except FileNotFoundError:
+            pdf_report = None
+        if pdf_report is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pdf_report
+
+    def put(self, key: str, pdf_report: bytes) -> Path:
+        """Store a report under a key, and return its path. Evicts the expired reports."""
+        self.evict_expired()
+        path = self.path_for(key)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                file.write(pdf_report)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+        return path
+
+    def evict_expired(self) -> int:
+        """Delete the reports older than `max_age`, and return how many were deleted."""
+        evicted = 0
+        for path in self.path.glob("*.pdf"):
+            try:
+                if self.is_expired(path):
+                    path.unlink()
+                    evicted += 1
+            except FileNotFoundError:
+                pass  # evicted by another worker
+        return evicted
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.path.glob("*.pdf"))
+
+    def stats(self) -> dict:
+        """Get the hit and miss counts of this store object, and the number of reports."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+
+DEFAULT_STORE: ReportStore | None = None
+
+
+def get_default_store() -> ReportStore | None:
+    """Get the store at `REPORT_STORE_PATH`, shared across the process, or None if it is not set."""
+    global DEFAULT_STORE
+    if DEFAULT_STORE is None and (path := os.getenv("REPORT_STORE_PATH")):
+        DEFAULT_STORE = ReportStore(Path(path))
+    return DEFAULT_STORE
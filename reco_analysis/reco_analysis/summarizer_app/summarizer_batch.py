@@ -0,0 +1,208 @@
+"""Summarizer Batch.
+
+This module summarizes a whole transcripts file (e.g. one cell of the experiment grid, see
+`utils.path_makers.compile_paths`) with bounded concurrency, through `summarizer_engine.asummarize`,
+so that cached summaries are reused (see `summary_cache`, disabled with --no-use-cache) and long
+transcripts are summarized with map-reduce.
+
+Input: A transcripts JSON file ({patient_id: {"id": ..., "chat_transcript": [...]}, ...}) or JSONL
+file (one {"id": ..., "chat_transcript": [...]} object per line).
+
+Output: The matching summaries JSON file in `config.SUMMARIES_DIR`
+({patient_id: {"id": ..., "summary": {...}}, ...}). While running, each summary is appended to a
+JSONL progress file next to it as soon as it finishes, and patients already in the progress file
+are skipped, so an interrupted run resumes where it left off. Throughput and token usage are
+reported at the end.
+
+Usage:
+    python -m reco_analysis.summarizer_app.summarizer_batch data/transcripts/transcripts_short_gpt4o-m_basepat_basedoc.json
+"""
+
+import asyncio
+import json
+import os
+import time
+import typing
+from pathlib import Path
+
+import typer
+from langchain_openai import ChatOpenAI
+from loguru import logger
+
+from reco_analysis.summarizer_app import summarizer_engine, summary_cache
+from reco_analysis.summarizer_app.prompts import system_message_summarize_json
+from reco_analysis.utils.path_makers import summaries_path_for
+
+app = typer.Typer()
+
+
+def load_transcripts(transcripts_path: Path) -> typing.Dict[str, dict]:
+    """Load the patients from a transcripts JSON or JSONL file, by patient ID."""
+    with open(transcripts_path, "r") as file:
+        if Path(transcripts_path).suffix == ".jsonl":
+            patients = [json.loads(line) for line in file if line.strip()]
+            return {str(patient["id"]): patient for patient in patients}
+        return {str(key): value for key, value in json.load(file).items()}
+
+
+def load_progress(progress_path: Path) -> typing.Dict[str, dict]:
+    """Load the summaries already written to the JSONL progress file, by patient ID. A truncated
+    last line (e.g. from a crash mid-write) is ignored."""
+    summaries: typing.Dict[str, dict] = {}
+    if not Path(progress_path).exists():
+        return summaries
+    with open(progress_path, "r") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            summaries[str(entry["id"])] = entry
+    return summaries
+
+
+async def summarize_batch(
+    patients: typing.Dict[str, dict],
+    progress_path: Path,
+    model: ChatOpenAI = summarizer_engine.default_model,
+    system_prompt: str = system_message_summarize_json,
+    transcript_field: str = "chat_transcript",
+    max_concurrency: int = 16,
+    vitals_mode: str = "llm",
+    cache: summary_cache.SummaryCache | None = None,
+) -> typing.Tuple[typing.Dict[str, dict], typing.Dict[str, int]]:
+    """Summarize the patients' transcripts, at most `max_concurrency` at a time, appending each
+    summary to the progress file as it finishes and skipping the patients already in it.
+
+    Args:
+        patients (dict): The patients, by patient ID, each with a transcript.
+        progress_path (Path): The JSONL progress file.
+        model (ChatOpenAI, optional): The model to use for summarization.
+        system_prompt (str, optional): The system prompt to use.
+        transcript_field (str, optional): The key containing the transcript.
+        max_concurrency (int, optional): The maximum number of concurrent summaries.
+        vitals_mode (str, optional): How the vital signs are extracted, one of
+            `summarizer_engine.VITALS_MODES`. Defaults to "llm".
+        cache (SummaryCache, optional): If provided, reuse the cached summaries of transcripts
+            already summarized with the same model and prompt. Defaults to None.
+
+    Returns:
+        Tuple[dict, dict]: The summaries by patient ID (including previous runs), and the run's
+            statistics (summarized, cached, failed, and prompt, completion and total tokens of
+            the summaries that were not cached).
+    """
+    if vitals_mode not in summarizer_engine.VITALS_MODES:
+        raise ValueError(f"Vitals mode must be one of {summarizer_engine.VITALS_MODES}")
+    summaries = load_progress(progress_path)
+    keys = [key for key in patients if key not in summaries]
+    logger.info(f"{len(summaries)} transcripts already summarized, {len(keys)} to go")
+
+    stats = {
+        "summarized": 0,
+        "cached": 0,
+        "failed": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+    }
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def summarize_patient(key: str):
+        async with semaphore:
+            try:
+                return key, await summarizer_engine.asummarize(
+                    patients[key][transcript_field],
+                    model,
+                    system_prompt,
+                    cache=cache,
+                    vitals_mode=vitals_mode,
+                )
+            except Exception as e:
+                return key, e
+
+    with open(progress_path, "a+") as progress_file:
+        # start on a new line after a truncated last line (e.g. from a crash mid-write)
+        progress_file.seek(0, os.SEEK_END)
+        if progress_file.tell() > 0:
+            progress_file.seek(progress_file.tell() - 1)
+            if progress_file.read(1) != "\n":
+                progress_file.write("\n")
+
+        for next_summary in asyncio.as_completed([summarize_patient(key) for key in keys]):
+            key, result = await next_summary
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to summarize transcript {key}: {result}")
+                stats["failed"] += 1
+                continue
+
+            summary, response = result
+            stats["summarized"] += 1
+            if response.response_metadata.get("cache_hit"):
+                stats["cached"] += 1
+            else:
+                token_usage = response.response_metadata.get("token_usage", {})
+                for name in ["prompt_tokens", "completion_tokens", "total_tokens"]:
+                    stats[name] += token_usage.get(name, 0)
+
+            summaries[key] = {"id": patients[key].get("id", key), "summary": summary.to_dict()}
+            progress_file.write(json.dumps(summaries[key]) + "\n")
+            progress_file.flush()
+
+    return summaries, stats
+
+
+@app.command()
+def main(
+    transcripts_path: Path,
+    summaries_path: typing.Optional[Path] = None,
+    model_name: str = "gpt-3.5-turbo",
+    transcript_field: str = "chat_transcript",
+    max_concurrency: int = 16,
+    vitals_mode: str = "llm",
+    use_cache: bool = True,
+):
+    summaries_path = Path(summaries_path or summaries_path_for(transcripts_path))
+    progress_path = summaries_path.with_suffix(".jsonl")
+    summaries_path.parent.mkdir(parents=True, exist_ok=True)
+
+    patients = load_transcripts(transcripts_path)
+    model = ChatOpenAI(temperature=0.0, model_name=model_name)
+    cache = None
+    if use_cache:
+        # the configured cache, else a local one for offline runs
+        cache = summary_cache.get_default_cache() or summary_cache.SummaryCache()
+
+    start = time.perf_counter()
+    summaries, stats = asyncio.run(
+        summarize_batch(
+            patients,
+            progress_path,
+            model=model,
+            transcript_field=transcript_field,
+            max_concurrency=max_concurrency,
+            vitals_mode=vitals_mode,
+            cache=cache,
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    with open(summaries_path, "w") as file:
+        json.dump({key: summaries[key] for key in patients if key in summaries}, file)
+
+    logger.info(
+        f"Summarized {stats['summarized']} transcripts ({stats['cached']} cached, "
+        f"{stats['failed']} failed) in {elapsed:.1f}s: "
+        f"{stats['summarized'] / elapsed:.2f} transcripts/s, "
+        f"{stats['total_tokens'] / elapsed:.0f} tokens/s"
+    )
+    logger.info(
+        f"Token usage: {stats['prompt_tokens']} prompt + {stats['completion_tokens']} completion "
+        f"= {stats['total_tokens']} total"
+    )
+    if stats["failed"]:
+        logger.warning(f"Re-run to retry the {stats['failed']} failed transcripts")
+    logger.success(f"Summaries saved to {summaries_path}")
+
+
+if __name__ == "__main__":
+    app()
@@ -3,8 +3,29 @@
 This module contains the summarizer engine, which is responsible for summarizing
 patient transcripts. Input is a patient transcript, and output is a summary json
 of the patient's overview, current symptoms, vital signs, current medications,
-and a summary of the patient's condition."""
+and a summary of the patient's condition.
 
+Pass a `summary_cache.SummaryCache` to `summarize` to reuse summaries of transcripts that were
+already summarized with the same model and prompt. Cached responses have "cache_hit" set in their
+response metadata.
+
+Vital signs are also parsed deterministically from the patient lines (see `vitals_parser`), as set
+by `vitals_mode`:
+- "llm" (default): the vital signs are taken from the LLM output only.
+- "cross_check": the parsed vital signs fill in and take precedence over the LLM output.
+  Disagreements are recorded in the response metadata under "vital_signs_discrepancies".
+- "parser": the LLM is not asked for the vital signs at all, and only the parsed ones are used.
+With "cross_check" and "parser", the line and character span of each parsed vital sign are recorded
+in the response metadata under "vital_signs_provenance".
+
+Transcripts longer than `max_single_call_tokens` are summarized with map-reduce: the transcript is
+split into chunks of about `chunk_tokens` tokens (at doctor lines, so exchanges are not split), the
+chunks are summarized in parallel, and the chunk summaries are combined in parallel groups of
+`REDUCE_FAN_IN` until one is left. Latency then grows with the logarithm of the transcript length
+rather than linearly. Vital signs are merged deterministically, later chunks taking precedence."""
+
+import asyncio
+import dataclasses
 import json
 import typing
 
@@ -12,16 +33,37 @@ from langchain.prompts import ChatPromptTemplate
 from langchain_core.messages import BaseMessage
 from langchain_openai import ChatOpenAI
 
-from reco_analysis.summarizer_app import data_type
-from reco_analysis.summarizer_app.prompts import system_message_summarize_json
+from reco_analysis.summarizer_app import data_type, summary_cache, vitals_parser
+from reco_analysis.summarizer_app.prompts import (
+    system_message_reduce_summaries_json,
+    system_message_summarize_json,
+    system_message_summarize_json_no_vitals,
+    system_message_summarize_narrative_json,
+    system_message_summarize_narrative_json_no_vitals,
+)
 
 default_model = ChatOpenAI(temperature=0.0, model_name="gpt-3.5-turbo")
 
+VITALS_MODES = ["llm", "cross_check", "parser"]
+# The prompts used with "parser", which do not ask for the vital signs
+NO_VITALS_PROMPTS = {
+    system_message_summarize_json: system_message_summarize_json_no_vitals,
+    system_message_summarize_narrative_json: system_message_summarize_narrative_json_no_vitals,
+}
+
+MAX_SINGLE_CALL_TOKENS = 12000  # gpt-3.5-turbo has a 16k context, leave room for the output
+CHUNK_TOKENS = 4000
+REDUCE_FAN_IN = 8  # chunk summaries combined per reduce call
+
 
 def summarize(
     patient_transcript: list[str],
     model: ChatOpenAI = default_model,
     system_prompt: str = system_message_summarize_json,
+    cache: summary_cache.SummaryCache | None = None,
+    vitals_mode: str = "llm",
+    max_single_call_tokens: int = MAX_SINGLE_CALL_TOKENS,
+    chunk_tokens: int = CHUNK_TOKENS,
 ) -> typing.Tuple[data_type.TranscriptSummary, BaseMessage]:
     """Summarizes a patient transcript.
 
@@ -30,23 +72,211 @@ def summarize(
         model (ChatOpenAI, optional): The model to use for summarization.
             Defaults to default_model.
         system_prompt (str, optional): The system prompt to use.
+        cache (SummaryCache, optional): If provided, return the cached summary for the same
+            transcript, model and prompt, and cache new summaries. Defaults to None.
+        vitals_mode (str, optional): How the vital signs are extracted, one of `VITALS_MODES`.
+            Defaults to "llm".
+        max_single_call_tokens (int, optional): Longer transcripts are summarized with
+            map-reduce. Defaults to MAX_SINGLE_CALL_TOKENS.
+        chunk_tokens (int, optional): The size of the chunks summarized with map-reduce.
+            Defaults to CHUNK_TOKENS.
+    """
+    if vitals_mode not in VITALS_MODES:
+        raise ValueError(f"Vitals mode must be one of {VITALS_MODES}")
+    if vitals_mode != "llm":
+        summary, response = summarize(
+            patient_transcript,
+            model,
+            prompt_for_vitals_mode(system_prompt, vitals_mode),
+            cache,
+            vitals_mode="llm",
+            max_single_call_tokens=max_single_call_tokens,
+            chunk_tokens=chunk_tokens,
+        )
+        return apply_parsed_vitals(summary, response, patient_transcript, vitals_mode), response
+
+    if cache is not None:
+        key = summary_cache.cache_key(
+            patient_transcript, model.model_name, model.temperature, system_prompt
+        )
+        if cached := cache.get(key):
+            cached[1].response_metadata["cache_hit"] = True
+            return cached
+        summary, response = summarize(
+            patient_transcript,
+            model,
+            system_prompt,
+            vitals_mode="llm",
+            max_single_call_tokens=max_single_call_tokens,
+            chunk_tokens=chunk_tokens,
+        )
+        cache.put(key, summary, response)
+        return summary, response
+
+    text = "\n".join(patient_transcript)
+    # a token is at least one character, so short transcripts need not be tokenized
+    if len(text) > max_single_call_tokens and model.get_num_tokens(text) > max_single_call_tokens:
+        return summarize_map_reduce(patient_transcript, model, system_prompt, chunk_tokens)
+
+    response = model.invoke(build_messages(patient_transcript, system_prompt))
+    return parse_summary(response.content), response
+
+
+async def asummarize(
+    patient_transcript: list[str],
+    model: ChatOpenAI = default_model,
+    system_prompt: str = system_message_summarize_json,
+    cache: summary_cache.SummaryCache | None = None,
+    vitals_mode: str = "llm",
+    max_single_call_tokens: int = MAX_SINGLE_CALL_TOKENS,
+    chunk_tokens: int = CHUNK_TOKENS,
+) -> typing.Tuple[data_type.TranscriptSummary, BaseMessage]:
+    """Async version of `summarize`, run in a worker thread, so that an event loop can drive many
+    summaries at once with the same caching, vital signs and map-reduce behavior."""
+    return await asyncio.to_thread(
+        summarize,
+        patient_transcript,
+        model,
+        system_prompt,
+        cache,
+        vitals_mode,
+        max_single_call_tokens,
+        chunk_tokens,
+    )
+
+
+def chunk_transcript(
+    patient_transcript: list[str], model: ChatOpenAI, chunk_tokens: int = CHUNK_TOKENS
+) -> list[list[str]]:
+    """Splits a transcript into chunks of about `chunk_tokens` tokens.
+
+    Chunks start at doctor lines, so that a question and its answer stay together, unless a chunk
+    grows to twice `chunk_tokens` without one.
+    """
+    chunks: list[list[str]] = []
+    chunk: list[str] = []
+    tokens = 0
+    for line in patient_transcript:
+        line_tokens = model.get_num_tokens(line)
+        if chunk and (
+            (tokens + line_tokens > chunk_tokens and line.startswith("Doctor"))
+            or tokens + line_tokens > 2 * chunk_tokens
+        ):
+            chunks.append(chunk)
+            chunk, tokens = [], 0
+        chunk.append(line)
+        tokens += line_tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def merge_vital_signs(summaries: list[data_type.TranscriptSummary]) -> data_type.VitalSigns:
+    """Merges the vital signs of consecutive chunk summaries, the latest value of each winning."""
+    vitals: typing.Dict[str, typing.Any] = {name: None for name in vitals_parser.VITAL_NAMES}
+    for summary in summaries:
+        for name, value in summary.vital_signs.to_dict().items():
+            if value is not None:
+                vitals[name] = value
+    return data_type.VitalSigns(**vitals)
+
+
+def add_token_usage(response: BaseMessage, responses: list[BaseMessage]) -> None:
+    """Sets the token usage of a response to the total of all the responses."""
+    token_usage: typing.Dict[str, int] = {}
+    for each in responses:
+        for name, count in each.response_metadata.get("token_usage", {}).items():
+            if isinstance(count, int):
+                token_usage[name] = token_usage.get(name, 0) + count
+    response.response_metadata["token_usage"] = token_usage
+
+
+def summarize_map_reduce(
+    patient_transcript: list[str],
+    model: ChatOpenAI = default_model,
+    system_prompt: str = system_message_summarize_json,
+    chunk_tokens: int = CHUNK_TOKENS,
+    max_concurrency: int = 8,
+) -> typing.Tuple[data_type.TranscriptSummary, BaseMessage]:
+    """Summarizes a long transcript by summarizing chunks in parallel, then combining them.
+
+    Args:
+        patient_transcript (list[str]): The patient transcript to summarize.
+        model (ChatOpenAI, optional): The model to use for summarization.
+        system_prompt (str, optional): The system prompt used for the chunks.
+        chunk_tokens (int, optional): The size of the chunks. Defaults to CHUNK_TOKENS.
+        max_concurrency (int, optional): The maximum number of concurrent requests.
+
+    Returns:
+        Tuple[TranscriptSummary, BaseMessage]: The summary, and the last reduce response, with
+            the token usage of all the calls and the number of chunks in its metadata.
+    """
+    config = {"max_concurrency": max_concurrency}
+    chunks = chunk_transcript(patient_transcript, model, chunk_tokens)
+    responses = model.batch([build_messages(chunk, system_prompt) for chunk in chunks], config)
+    summaries = [parse_summary(response.content) for response in responses]
+    all_responses = list(responses)
+
+    while len(summaries) > 1:
+        groups = [
+            summaries[i : i + REDUCE_FAN_IN] for i in range(0, len(summaries), REDUCE_FAN_IN)
+        ]
+        responses = model.batch(
+            [
+                build_messages(
+                    [json.dumps(summary.to_dict()) for summary in group],
+                    system_message_reduce_summaries_json,
+                )
+                for group in groups
+            ],
+            config,
+        )
+        summaries = [
+            dataclasses.replace(
+                parse_summary(response.content), vital_signs=merge_vital_signs(group)
+            )
+            for group, response in zip(groups, responses)
+        ]
+        all_responses += responses
+
+    response = all_responses[-1]
+    add_token_usage(response, all_responses)
+    response.response_metadata["map_reduce_chunks"] = len(chunks)
+    return summaries[0], response
+
+
+def build_messages(
+    patient_transcript: list[str], system_prompt: str = system_message_summarize_json
+) -> list[BaseMessage]:
+    """Builds the messages sent to the model to summarize a patient transcript.
+
+    Args:
+        patient_transcript (list[str]): The patient transcript to summarize.
+        system_prompt (str, optional): The system prompt to use.
     """
     prompt_template = ChatPromptTemplate.from_messages(
         [
             ("system", system_prompt),
-            ("user", "\n".join(patient_transcript)),
+            # a variable rather than part of the template, so that braces are kept verbatim
+            ("user", "{transcript}"),
         ]
     )
+    return prompt_template.format_messages(transcript="\n".join(patient_transcript))
+
 
-    response = model.invoke(prompt_template.format_messages())
-    result_summary = response.content
+def parse_summary(result_summary: str) -> data_type.TranscriptSummary:
+    """Parses the model output into a TranscriptSummary.
 
+    Args:
+        result_summary (str): The content of the model response.
+    """
     try:
         # Process the result, remove markdown and convert to JSON
         processed_result = json.loads(
             result_summary.replace("```json", "").replace("```", "").replace("\n", "")
         )
-        vitals: typing.Dict[str, typing.Any] = processed_result["vital_signs"]
+        # missing when the vital signs are parsed from the transcript instead
+        vitals: typing.Dict[str, typing.Any] = processed_result.get("vital_signs") or {}
 
         def get_vital(vital_name: str) -> typing.Any:
             ret = vitals.get(vital_name, None)
@@ -54,24 +284,78 @@ def summarize(
                 return None
             return ret
 
-        return (
-            data_type.TranscriptSummary(
-                patient_overview=processed_result["patient_overview"],
-                current_symptoms=processed_result["current_symptoms"],
-                vital_signs=data_type.VitalSigns(
-                    temperature=get_vital("temperature"),
-                    heart_rate=get_vital("heart_rate"),
-                    respiratory_rate=get_vital("respiratory_rate"),
-                    oxygen_saturation=get_vital("oxygen_saturation"),
-                    blood_pressure_systolic=get_vital("blood_pressure_systolic"),
-                    blood_pressure_diastolic=get_vital("blood_pressure_diastolic"),
-                    weight=get_vital("weight"),
-                ),
-                current_medications=processed_result["current_medications"],
-                summary=processed_result["summary"],
+        return data_type.TranscriptSummary(
+            patient_overview=processed_result["patient_overview"],
+            # missing when only the narrative fields are generated (see `incremental_extractor`)
+            current_symptoms=processed_result.get("current_symptoms", []),
+            vital_signs=data_type.VitalSigns(
+                temperature=get_vital("temperature"),
+                heart_rate=get_vital("heart_rate"),
+                respiratory_rate=get_vital("respiratory_rate"),
+                oxygen_saturation=get_vital("oxygen_saturation"),
+                blood_pressure_systolic=get_vital("blood_pressure_systolic"),
+                blood_pressure_diastolic=get_vital("blood_pressure_diastolic"),
+                weight=get_vital("weight"),
             ),
-            response,
+            current_medications=processed_result.get("current_medications", []),
+            summary=processed_result["summary"],
         )
 
     except json.JSONDecodeError as e:
         raise ValueError("Failed to decode JSON from model output") from e
+
+
+def prompt_for_vitals_mode(system_prompt: str, vitals_mode: str) -> str:
+    """Gets the system prompt to use with a vitals mode.
+
+    With "parser", the prompts of this package are replaced by their versions that do not ask for
+    the vital signs. Custom prompts are used as they are.
+    """
+    if vitals_mode == "parser":
+        return NO_VITALS_PROMPTS.get(system_prompt, system_prompt)
+    return system_prompt
+
+
+def apply_parsed_vitals(
+    summary: data_type.TranscriptSummary,
+    response: BaseMessage,
+    patient_transcript: list[str],
+    vitals_mode: str = "cross_check",
+) -> data_type.TranscriptSummary:
+    """Applies the vital signs parsed from the transcript to a summary.
+
+    Records the provenance of the parsed vital signs, and with "cross_check" the disagreements with
+    the LLM output, in the response metadata.
+
+    Args:
+        summary (TranscriptSummary): The summary generated by the LLM.
+        response (BaseMessage): The LLM response.
+        patient_transcript (list[str]): The summarized patient transcript.
+        vitals_mode (str, optional): "cross_check" or "parser". Defaults to "cross_check".
+
+    Returns:
+        TranscriptSummary: The summary with the parsed vital signs.
+    """
+    if vitals_mode == "llm":
+        return summary
+
+    readings = vitals_parser.parse_transcript(patient_transcript)
+    llm_vitals = summary.vital_signs.to_dict()
+    vitals = {}
+    discrepancies = {}
+    for name in vitals_parser.VITAL_NAMES:
+        if name in readings:
+            vitals[name] = readings[name].value
+            llm_value = llm_vitals[name]
+            if llm_value is not None and abs(llm_value - vitals[name]) > 0.05:
+                discrepancies[name] = {"llm": llm_value, "parsed": vitals[name]}
+        else:
+            vitals[name] = llm_vitals[name] if vitals_mode == "cross_check" else None
+
+    response.response_metadata["vital_signs_provenance"] = {
+        name: {"line_index": reading.line_index, "span": list(reading.span)}
+        for name, reading in readings.items()
+    }
+    if vitals_mode == "cross_check" and discrepancies:
+        response.response_metadata["vital_signs_discrepancies"] = discrepancies
+    return dataclasses.replace(summary, vital_signs=data_type.VitalSigns(**vitals))
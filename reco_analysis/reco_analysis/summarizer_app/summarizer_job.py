@@ -3,15 +3,30 @@
 Input: A ConversationSession ID.
 What it does:
 - Retrieves the conversation transcript from the database.
-- Summarizes the conversation transcript using the summarizer engine.
+- Summarizes the conversation transcript using the summarizer engine. If the sections were
+  extracted during the conversation (see `incremental_extractor`), only the narrative fields are
+  generated.
 - Saves the summary and response metadata to the database.
+- Renders the PDF report in memory, or, if the report store is enabled, reuses the stored one if
+  it was already rendered from the same summary and transcript (see `report_store`).
 - Emails the summary to the HCP (look up the HCP email from db).
 - Returns the summary.
 
-Output: A summary of the conversation session, the bytes of the PDF report."""
+Output: A summary of the conversation session, the bytes of the PDF report.
+
+In the app, this runs in the background: see `summarizer_worker`."""
+
+import json
 
 from reco_analysis.data_model import data_models
-from reco_analysis.summarizer_app import post_office, report_maker, summarizer_engine
+from reco_analysis.summarizer_app import (
+    incremental_extractor,
+    post_office,
+    report_maker,
+    report_store,
+    summarizer_engine,
+    summary_cache,
+)
 
 
 def summarize_conversation(
@@ -26,53 +41,63 @@ def summarize_conversation(
     Returns:
         bytes: The bytes of the PDF report.
     """
-    # Retrieve the conversation transcript from the database
-    conversation_session = data_models.ConversationSession.get_by_id(
-        conversation_session_id, session=data_models.get_session()
-    )
-
-    if not conversation_session.completed:
-        raise ValueError("The conversation session is not completed.")
+    with data_models.session_scope() as session:
+        # Retrieve the conversation transcript from the database
+        conversation_session = data_models.ConversationSession.get_by_id(
+            conversation_session_id, session=session
+        )
 
-    patient_transcript = conversation_session.get_transcript()
+        if not conversation_session.completed:
+            raise ValueError("The conversation session is not completed.")
+
+        patient_transcript = conversation_session.get_transcript()
+
+        if not patient_transcript:
+            raise ValueError("No transcript found for the conversation session.")
+
+        if not conversation_session.summary:
+            print("Summarizing the conversation transcript.")
+            # end the transaction, so that no connection is held during the LLM call
+            session.commit()
+            # Summarize the conversation transcript
+            partial_summary = (
+                json.loads(conversation_session.partial_summary)
+                if conversation_session.partial_summary
+                else None
+            )
+            summary, response_message = incremental_extractor.finalize(
+                patient_transcript=patient_transcript,
+                partial_summary=partial_summary,
+                model=model,
+                cache=summary_cache.get_default_cache(),
+            )
+            # Save the summary and response metadata to the database
+            conversation_session.save_summary(
+                summary,
+                response_message,
+                session=session,
+            )
+        else:
+            print("Summary already exists in the database.")
+            summary = conversation_session.transcript_summary
+
+        # Create the PDF report -- pdf_report is a bytes object
+        pdf_report = report_maker.create_patient_report(
+            summary_data=summary,
+            transcript=patient_transcript,
+            patient_first_name=conversation_session.patient.first_name,
+            patient_last_name=conversation_session.patient.last_name,
+            conversation_start_time=conversation_session.created_at,
+            conversation_end_time=conversation_session.get_end_time(),
+            store=report_store.get_default_store(),
+        )
 
-    if not patient_transcript:
-        raise ValueError("No transcript found for the conversation session.")
+        # Email the summary to the HCP
+        patient = conversation_session.patient
+        if hcp := patient.healthcare_provider:
+            post_office.email_report(pdf_report, hcp, patient, conversation_session)
 
-    if not conversation_session.summary:
-        print("Summarizing the conversation transcript.")
-        # Summarize the conversation transcript
-        summary, response_message = summarizer_engine.summarize(
-            patient_transcript=patient_transcript,
-            model=model,
-        )
-        # Save the summary and response metadata to the database
-        conversation_session.save_summary(
-            summary,
-            response_message,
-            session=data_models.get_session(),
-        )
-    else:
-        print("Summary already exists in the database.")
-        summary = conversation_session.transcript_summary
-
-    # Create the PDF report -- pdf_report is a bytes object
-    pdf_report = report_maker.create_patient_report(
-        summary_data=summary,
-        transcript=patient_transcript,
-        patient_first_name=conversation_session.patient.first_name,
-        patient_last_name=conversation_session.patient.last_name,
-        conversation_start_time=conversation_session.created_at,
-        conversation_end_time=conversation_session.messages[-1].timestamp,
-        output_filename="test_report.pdf",
-    )
-
-    # Email the summary to the HCP
-    patient = conversation_session.patient
-    if hcp := patient.healthcare_provider:
-        post_office.email_report(pdf_report, hcp, patient, conversation_session)
-
-    return pdf_report
+        return pdf_report
 
 
 # test
@@ -0,0 +1,80 @@
+"""Summarizer worker module.
+
+Runs the summarizer job (`summarizer_job.summarize_conversation`) in the background, outside of the
+Streamlit app: the app only enqueues a `data_models.SummaryJob` when a conversation ends, and one or
+more worker processes claim and process the jobs.
+
+What it does:
+- Claims the next due job with `SELECT ... FOR UPDATE SKIP LOCKED`, so workers never process the
+  same job twice and can be scaled independently of the app.
+- Summarizes the conversation, creates the PDF report and emails it to the HCP.
+- On failure, retries the job with exponential backoff, and moves it to the "dead" state once its
+  attempts are exhausted.
+- Sleeps for `poll_interval` seconds when there is no due job.
+
+Usage:
+    python -m reco_analysis.summarizer_app.summarizer_worker
+"""
+
+import datetime
+import time
+import traceback
+
+import typer
+from loguru import logger
+
+from reco_analysis.data_model import data_models
+from reco_analysis.summarizer_app import summarizer_job
+
+app = typer.Typer()
+
+
+def process_next_job(backoff: datetime.timedelta = datetime.timedelta(seconds=30)) -> bool:
+    """Claim and process the next due summary job.
+
+    Args:
+        backoff (datetime.timedelta): The delay before the first retry of a failed job, doubled
+            on each further attempt.
+
+    Returns:
+        bool: True if a job was processed (successfully or not), False if no job was due.
+    """
+    with data_models.session_scope() as session:
+        job = data_models.SummaryJob.claim_next(session)
+        if job is None:
+            return False
+
+        logger.info(f"Processing {job}")
+        try:
+            # in a session of its own, see `summarizer_job`
+            summarizer_job.summarize_conversation(
+                conversation_session_id=job.conversation_session_id
+            )
+        except Exception:
+            error = traceback.format_exc()
+            logger.error(f"Summary job {job.id} failed (attempt {job.attempts}):\n{error}")
+            job.mark_as_failed(error, session, backoff=backoff)
+        else:
+            job.mark_as_done(session)
+            logger.success(f"Summary job {job.id} done")
+        return True
+
+
+@app.command()
+def main(
+    poll_interval: float = 2.0,
+    backoff_seconds: float = 30.0,
+    run_once: bool = False,
+):
+    """Process summary jobs until interrupted (or until the queue is empty, with --run-once)."""
+    backoff = datetime.timedelta(seconds=backoff_seconds)
+    logger.info("Summarizer worker started")
+    while True:
+        if not process_next_job(backoff=backoff):
+            if run_once:
+                break
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,161 @@
+"""Summary Cache.
+
+This module contains a persistent, content-addressed cache of transcript summaries, so that
+summarizing the same transcript again with the same model and prompt does not call the LLM.
+
+The cache key is a hash of the normalized transcript, the model name, the temperature and the
+system prompt. Entries are stored in a SQLite file, and the least recently used entries are
+evicted once the cache holds more than `max_entries`. Hits and misses are counted per cache
+object.
+
+Summaries contain protected health information, so the cache is opt-in and bounded: the summarizer
+job only uses it when the `SUMMARY_CACHE_PATH` environment variable is set, and entries older than
+`SUMMARY_CACHE_MAX_AGE_DAYS` (7 by default) are treated as misses and deleted when a summary is
+cached."""
+
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import typing
+from pathlib import Path
+
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from reco_analysis.config import INTERIM_DATA_DIR
+from reco_analysis.summarizer_app import data_type
+
+DEFAULT_CACHE_PATH = INTERIM_DATA_DIR / "summary_cache.sqlite"
+DEFAULT_MAX_AGE = datetime.timedelta(days=float(os.getenv("SUMMARY_CACHE_MAX_AGE_DAYS", "7")))
+
+
+def normalize_transcript(patient_transcript: list[str]) -> list[str]:
+    """Normalize a transcript for hashing: collapse whitespace and drop empty lines."""
+    return [" ".join(line.split()) for line in patient_transcript if line.strip()]
+
+
+def cache_key(
+    patient_transcript: list[str], model_name: str, temperature: float, system_prompt: str
+) -> str:
+    """Get the cache key for summarizing a transcript with a model and a system prompt."""
+    to_hash = json.dumps(
+        [normalize_transcript(patient_transcript), model_name, temperature, system_prompt]
+    )
+    return hashlib.sha256(to_hash.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    def __init__(
+        self,
+        path: Path = DEFAULT_CACHE_PATH,
+        max_entries: int = 10_000,
+        max_age: datetime.timedelta | None = DEFAULT_MAX_AGE,
+    ) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_age = max_age  # None to keep entries until they are evicted for space
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, summary TEXT NOT NULL, response_message TEXT NOT NULL, "
+                "last_used REAL NOT NULL, created REAL NOT NULL)"
+            )
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(summaries)")]
+            if "created" not in columns:
+                # a cache from before entries expired: its entries are treated as expired
+                connection.execute(
+                    "ALTER TABLE summaries ADD COLUMN created REAL NOT NULL DEFAULT 0"
+                )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self) -> typing.Iterator[sqlite3.Connection]:
+        # a connection per operation, so the cache can be shared across threads; committed (or
+        # rolled back) and closed at the end of the block
+        with contextlib.closing(sqlite3.connect(self.path, timeout=30)) as connection:
+            with connection:
+                yield connection
+
+    def _oldest_created(self) -> float:
+        """Get the creation time of the oldest entry that has not expired."""
+        return time.time() - self.max_age.total_seconds() if self.max_age is not None else 0.0
+
+    def get(self, key: str) -> typing.Tuple[data_type.TranscriptSummary, BaseMessage] | None:
+        """Get the cached summary and response message for a key, or None on a miss."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT summary, response_message FROM summaries WHERE key = ? AND created >= ?",
+                (key, self._oldest_created()),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute(
+                "UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+
+        self.hits += 1
+        summary, response_message = row
+        return (
+            data_type.TranscriptSummary.from_dict(json.loads(summary)),
+            messages_from_dict([json.loads(response_message)])[0],
+        )
+
+    def put(
+        self,
+        key: str,
+        summary: data_type.TranscriptSummary,
+        response_message: BaseMessage,
+    ) -> None:
+        """Cache a summary and response message, evicting the expired entries, and the least
+        recently used entries if the cache is full."""
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM summaries WHERE created < ?", (self._oldest_created(),)
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO summaries "
+                "(key, summary, response_message, last_used, created) VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    summary.to_json(),
+                    json.dumps(message_to_dict(response_message)),
+                    now,
+                    now,
+                ),
+            )
+            connection.execute(
+                "DELETE FROM summaries WHERE key IN ("
+                "SELECT key FROM summaries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Get the hit and miss counts of this cache object, and the number of entries."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+
+DEFAULT_CACHE: SummaryCache | None = None
+
+
+def get_default_cache() -> SummaryCache | None:
+    """Get the cache at `SUMMARY_CACHE_PATH`, shared across the process, or None if it is not
+    set."""
+    global DEFAULT_CACHE
+    if DEFAULT_CACHE is None and (path := os.getenv("SUMMARY_CACHE_PATH")):
+        DEFAULT_CACHE = SummaryCache(Path(path))
+    return DEFAULT_CACHE
@@ -0,0 +1,214 @@
+"""Vital Signs Parser.
+
+This module extracts vital signs from the patient lines of a transcript with compiled regular
+expressions, without calling the LLM. Patients nearly always state vitals in a regular form, e.g.
+"Temperature 98.0°F, heart rate 72 bpm, respiratory rate 18, oxygen saturation 92%, blood pressure
+186/106", or answer a question about a single vital with a bare number.
+
+Each patient line is split into clauses. A number in a clause is attributed to a vital by its unit
+("bpm", "%", "lbs", ...), else by a keyword in the clause ("heart rate", "weigh", ...), else by the
+vital the doctor asked about in the previous line. Numbers that count something else ("72 years",
+"60 minutes", ...) are skipped. Values outside plausible ranges are dropped, and Celsius
+temperatures and kilogram weights are converted to the units of `VitalSigns`. Each reading keeps
+the line and character span it was parsed from. When a vital is stated more than once, the latest
+reading wins."""
+
+import dataclasses
+import re
+import typing
+
+from reco_analysis.summarizer_app import data_type
+
+VITAL_NAMES = [field.name for field in dataclasses.fields(data_type.VitalSigns)]
+
+# Keywords identifying the vital a clause (or a doctor question) is about. Blood pressure covers
+# both the systolic and diastolic readings.
+VITAL_KEYWORDS: typing.Dict[str, re.Pattern] = {
+    "temperature": re.compile(r"\b(?:temp(?:erature)?|fever)\b", re.IGNORECASE),
+    # not "pulse ox", which measures the oxygen saturation
+    "heart_rate": re.compile(r"\b(?:heart\s*rate|pulse(?!\s*ox)|heartbeat)\b", re.IGNORECASE),
+    "respiratory_rate": re.compile(
+        r"\b(?:respiratory\s*rate|respiration|breathing\s*rate|breaths?\s*per\s*min(?:ute)?)\b",
+        re.IGNORECASE,
+    ),
+    # not a bare "sat", as in "I sat down"
+    "oxygen_saturation": re.compile(
+        r"\b(?:oxygen|o2|sp\s?o2|sat(?:uration|s)|pulse\s*ox(?:imeter)?)\b", re.IGNORECASE
+    ),
+    "blood_pressure": re.compile(r"\b(?:blood\s*pressure|bp)\b", re.IGNORECASE),
+    "weight": re.compile(r"\b(?:weigh(?:t|s|ed|ing)?)\b", re.IGNORECASE),
+}
+
+NUMBER_PATTERN = re.compile(
+    r"(?<![\d/.])(?P<value>\d{1,3}(?:\.\d+)?)(?![\d/])\s*"
+    r"(?P<unit>°\s*[FC]\b|°|degrees?(?:\s*(?:F|C|fahrenheit|celsius)\b)?|bpm\b"
+    r"|beats\s*(?:per|a|/)\s*min(?:ute)?\b|breaths\s*(?:per|a|/)\s*min(?:ute)?\b"
+    r"|%|percent\b|lbs?\b|pounds\b|kgs?\b|kilo(?:gram)?s?\b|mm\s*hg\b)?",
+    re.IGNORECASE,
+)
+# Units of numbers that are not vital signs, e.g. "72 years old" or "60 minutes"
+OTHER_QUANTITY_PATTERN = re.compile(
+    r"\s*(?:-\s*)?(?:years?|yrs?|months?|weeks?|days?|hours?|hrs?|minutes?|mins?|seconds?|secs?"
+    r"|times|pillows?|pills?|tablets?|mg|steps|blocks|miles|flights?|stairs)\b",
+    re.IGNORECASE,
+)
+BLOOD_PRESSURE_PATTERN = re.compile(
+    r"(?<![\d.])(?P<systolic>\d{2,3})\s*(?:/|over)\s*(?P<diastolic>\d{2,3})(?![\d.])",
+    re.IGNORECASE,
+)
+
+# Clauses end at commas, semicolons, "and", and sentence ends (but not decimal points)
+CLAUSE_SPLIT_PATTERN = re.compile(r"[,;!?]|(?<!\d)\.|\.(?!\d)|\band\b", re.IGNORECASE)
+
+UNIT_VITALS = [
+    (re.compile(r"°|degree", re.IGNORECASE), "temperature"),
+    (re.compile(r"bpm|beats", re.IGNORECASE), "heart_rate"),
+    (re.compile(r"breaths", re.IGNORECASE), "respiratory_rate"),
+    (re.compile(r"%|percent", re.IGNORECASE), "oxygen_saturation"),
+    (re.compile(r"lb|pound|kg|kilo", re.IGNORECASE), "weight"),
+    (re.compile(r"mm\s*hg", re.IGNORECASE), "blood_pressure"),
+]
+
+PLAUSIBLE_RANGES = {
+    "temperature": (90.0, 110.0),
+    "heart_rate": (25.0, 250.0),
+    "respiratory_rate": (4.0, 60.0),
+    "oxygen_saturation": (50.0, 100.0),
+    "blood_pressure_systolic": (60.0, 260.0),
+    "blood_pressure_diastolic": (30.0, 160.0),
+    "weight": (60.0, 800.0),
+}
+
+
+@dataclasses.dataclass
+class VitalReading:
+    """A vital sign value parsed from a transcript, with its provenance."""
+
+    name: str  # a `VitalSigns` field name
+    value: float
+    line_index: int  # index of the transcript line the value was parsed from
+    span: typing.Tuple[int, int]  # character span of the value (and unit) in that line
+
+    def source_text(self, transcript: list[str]) -> str:
+        """Get the text the value was parsed from."""
+        return transcript[self.line_index][self.span[0] : self.span[1]]
+
+
+def asked_vital(doctor_line: str | None) -> str | None:
+    """Get the vital the doctor asked about, if the question is about exactly one vital."""
+    if not doctor_line:
+        return None
+    asked = [name for name, pattern in VITAL_KEYWORDS.items() if pattern.search(doctor_line)]
+    return asked[0] if len(asked) == 1 else None
+
+
+def clause_spans(line: str) -> typing.Iterator[typing.Tuple[int, int]]:
+    """Split a line into clauses, yielding their character spans."""
+    start = 0
+    for separator in CLAUSE_SPLIT_PATTERN.finditer(line):
+        yield start, separator.start()
+        start = separator.end()
+    yield start, len(line)
+
+
+def normalize_value(name: str, value: float, unit: str) -> float | None:
+    """Convert a value to the units of `VitalSigns`, or None if it is not plausible."""
+    unit = unit.lower()
+    if name == "temperature" and ("c" in unit.replace("degree", "") or 30.0 <= value <= 45.0):
+        value = round(value * 9 / 5 + 32, 1)
+    if name == "weight" and ("kg" in unit or "kilo" in unit):
+        value = round(value * 2.20462, 1)
+    low, high = PLAUSIBLE_RANGES[name]
+    return value if low <= value <= high else None
+
+
+def parse_line(
+    line: str, line_index: int = 0, doctor_line: str | None = None
+) -> list[VitalReading]:
+    """Parse the vital signs stated in one patient line.
+
+    Args:
+        line (str): The patient line.
+        line_index (int, optional): The index of the line in the transcript, for provenance.
+        doctor_line (str, optional): The preceding doctor line, used to attribute bare numbers.
+
+    Returns:
+        list[VitalReading]: The readings in the line, in order.
+    """
+    context = asked_vital(doctor_line)
+    readings = []
+    for start, end in clause_spans(line):
+        clause = line[start:end]
+        keywords = [name for name, pattern in VITAL_KEYWORDS.items() if pattern.search(clause)]
+
+        # Blood pressure: "186/106" or "120 over 80"
+        if (bp := BLOOD_PRESSURE_PATTERN.search(clause)) and (
+            "blood_pressure" in keywords or (not keywords and context in (None, "blood_pressure"))
+        ):
+            systolic = normalize_value("blood_pressure_systolic", float(bp["systolic"]), "")
+            diastolic = normalize_value("blood_pressure_diastolic", float(bp["diastolic"]), "")
+            if systolic and diastolic and systolic > diastolic:
+                readings += [
+                    VitalReading(
+                        "blood_pressure_systolic",
+                        systolic,
+                        line_index,
+                        (start + bp.start("systolic"), start + bp.end("systolic")),
+                    ),
+                    VitalReading(
+                        "blood_pressure_diastolic",
+                        diastolic,
+                        line_index,
+                        (start + bp.start("diastolic"), start + bp.end("diastolic")),
+                    ),
+                ]
+            continue
+
+        for number in NUMBER_PATTERN.finditer(clause):
+            unit = number["unit"] or ""
+            if not unit and OTHER_QUANTITY_PATTERN.match(clause, number.end("value")):
+                continue
+            unit_vitals = [name for pattern, name in UNIT_VITALS if unit and pattern.search(unit)]
+            candidates = [name for name in keywords if name != "blood_pressure"]
+            # the unit is unambiguous, while a keyword may be about something else in the clause
+            name = (unit_vitals or candidates or [context])[0]
+            if name is None or name == "blood_pressure":
+                continue
+            if (value := normalize_value(name, float(number["value"]), unit)) is not None:
+                span = (start + number.start(), start + number.end("unit" if unit else "value"))
+                readings.append(VitalReading(name, value, line_index, span))
+                break  # one reading per clause
+
+    return readings
+
+
+def parse_transcript(transcript: list[str]) -> typing.Dict[str, VitalReading]:
+    """Parse the vital signs stated in the patient lines of a transcript.
+
+    Args:
+        transcript (list[str]): The transcript lines, e.g. "Doctor: ..." and "Patient: ...".
+
+    Returns:
+        dict[str, VitalReading]: The latest reading of each vital stated, by `VitalSigns` field.
+    """
+    readings: typing.Dict[str, VitalReading] = {}
+    doctor_line = None
+    for line_index, line in enumerate(transcript):
+        if line.startswith("Doctor"):
+            doctor_line = line
+        elif line.startswith("Patient"):
+            for reading in parse_line(line, line_index, doctor_line):
+                readings[reading.name] = reading
+    return readings
+
+
+def to_vital_signs(readings: typing.Dict[str, VitalReading]) -> data_type.VitalSigns:
+    """Build `VitalSigns` from readings, with None for the vitals that were not stated."""
+    return data_type.VitalSigns(
+        **{name: readings[name].value if name in readings else None for name in VITAL_NAMES}
+    )
+
+
+def parse_vitals(transcript: list[str]) -> data_type.VitalSigns:
+    """Parse the vital signs stated in the patient lines of a transcript."""
+    return to_vital_signs(parse_transcript(transcript))
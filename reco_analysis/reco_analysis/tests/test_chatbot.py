@@ -0,0 +1,259 @@
+import asyncio
+import time
+import weakref
+
+import pytest
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from reco_analysis.chatbot import chatbot
+from reco_analysis.data_model import data_models
+
+
+@pytest.fixture
+def patient_id(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chatbot.sqlite'}")
+    data_models.Base.metadata.create_all(engine)
+    monkeypatch.setattr(data_models, "SESSION_FACTORY", sessionmaker(bind=engine))
+    monkeypatch.setattr(data_models, "SCOPED_SESSION", None)
+    # the chat histories are kept in memory even if postgres is configured
+    monkeypatch.setattr(chatbot, "use_postgres", False)
+    with data_models.session_scope() as session:
+        provider = data_models.HealthcareProvider(
+            first_name="Mike", last_name="Khor", email="mike@example.com"
+        )
+        session.add(provider)
+        session.flush()
+        patient = data_models.Patient(
+            username="john",
+            first_name="John",
+            last_name="Doe",
+            email="john@example.com",
+            password="x",
+            healthcare_provider_id=provider.id,
+        )
+        session.add(patient)
+    return patient.id
+
+
+def test_stream_response_saves_full_message(patient_id):
+    doctor = chatbot.DialogueAgent(
+        patient_id, model=FakeListChatModel(responses=["How are you feeling today?"])
+    )
+    doctor.receive("Hello.")
+
+    stream = doctor.stream_response()
+    chunks = [next(stream)]
+    assert doctor.get_history() == ["Patient: Hello."]  # not saved until exhausted
+    chunks.extend(stream)
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == "How are you feeling today?"
+    assert doctor.get_history() == ["Patient: Hello.", "Doctor: How are you feeling today?"]
+
+
+def test_async_api(patient_id):
+    doctor = chatbot.DialogueAgent(
+        patient_id,
+        model=FakeListChatModel(responses=["How are you feeling today?", "Any swelling?"]),
+        async_mode=True,
+    )
+
+    async def converse():
+        await doctor.areceive("Hello.")
+        first = await doctor.agenerate_response()
+        await doctor.areceive("Tired.")
+        second = "".join([chunk async for chunk in doctor.astream_response()])
+        return first, second
+
+    assert asyncio.run(converse()) == ("How are you feeling today?", "Any swelling?")
+    assert doctor.get_history() == [
+        "Patient: Hello.",
+        "Doctor: How are you feeling today?",
+        "Patient: Tired.",
+        "Doctor: Any swelling?",
+    ]
+
+
+class WordCountChatModel(FakeListChatModel):
+    """Counts words instead of tokens, as counting tokens needs a tokenizer download."""
+
+    def get_num_tokens_from_messages(self, messages):
+        return sum(len(message.content.split()) for message in messages)
+
+
+def converse(agent, turns):
+    for turn in range(turns):
+        agent.send(f"Question {turn}?")
+        agent.receive(f"Answer {turn}.")
+
+
+def test_split_for_summary(patient_id):
+    doctor = chatbot.DialogueAgent(
+        patient_id,
+        model=WordCountChatModel(responses=[""]),
+        memory_strategy="summary",
+        max_recent_turns=2,
+        max_context_tokens=100,
+    )
+    converse(doctor, 5)
+    messages = doctor.memory.messages
+
+    to_summarize, recent = doctor._split_for_summary(messages)
+    assert (to_summarize, recent) == (messages[:6], messages[6:])
+
+    # turns already folded into the summary are not summarized again
+    doctor.summarized_message_count = 2
+    assert doctor._split_for_summary(messages)[0] == messages[2:6]
+
+    # over the token budget, older turns are folded in, but the latest turn is always kept
+    doctor.max_context_tokens = 1
+    assert doctor._split_for_summary(messages) == (messages[2:8], messages[8:])
+
+
+def test_running_summary_is_updated_incrementally(monkeypatch, patient_id):
+    summary_model = FakeListChatModel(responses=["Summary 1.", "Summary 2."])
+    monkeypatch.setattr(chatbot, "summary_model", summary_model)
+    doctor = chatbot.DialogueAgent(
+        patient_id,
+        model=WordCountChatModel(responses=[""]),
+        memory_strategy="summary",
+        max_recent_turns=1,
+    )
+    converse(doctor, 3)
+
+    history = doctor.get_chat_history()
+    assert history[0].content == "Summary of the earlier conversation:\nSummary 1."
+    assert [message.content for message in history[1:]] == ["Question 2?", "Answer 2."]
+    assert doctor.summarized_message_count == 4
+
+    # no new turn, no summary call
+    doctor.get_chat_history()
+    assert summary_model.i == 1
+
+    converse(doctor, 1)
+    assert doctor.get_chat_history()[0].content.endswith("Summary 2.")
+    assert doctor.summarized_message_count == 6
+
+
+class CountingChatMessageHistory(BaseChatMessageHistory):
+    """Counts the reads of the history, standing in for `SQLChatMessageHistory`."""
+
+    def __init__(self):
+        self.stored = []
+        self.reads = 0
+
+    @property
+    def messages(self):
+        self.reads += 1
+        return list(self.stored)
+
+    def add_messages(self, messages):
+        self.stored.extend(messages)
+
+    def clear(self):
+        self.stored = []
+
+
+def test_cached_history_reads_once():
+    stored = CountingChatMessageHistory()
+    stored.add_message(AIMessage(content="How are you?"))
+    history = chatbot.CachedChatMessageHistory(stored)
+
+    history.add_message(HumanMessage(content="Fine."))
+    assert [message.content for message in history.messages] == ["How are you?", "Fine."]
+    history.add_message(AIMessage(content="Good."))
+    history.messages.append(HumanMessage(content="not stored"))
+    assert len(history.messages) == 3
+    assert stored.reads == 1
+
+    history.clear()
+    assert history.messages == [] and stored.stored == []
+    assert stored.reads == 2  # reloaded after the cache was invalidated
+
+
+def test_buffered_history_is_flushed_before_completion(monkeypatch, patient_id):
+    with data_models.session_scope() as session:
+        conversation_session = data_models.ConversationSession.new_session(patient_id, session)
+    stored = CountingChatMessageHistory()
+    history = chatbot.BufferedChatMessageHistory(stored)
+    monkeypatch.setitem(
+        chatbot.BUFFERED_HISTORIES, str(conversation_session.id), weakref.WeakSet([history])
+    )
+
+    history.add_messages([AIMessage(content="How are you?"), HumanMessage(content="Fine.")])
+    assert len(history.messages) == 2 and stored.stored == []
+
+    with data_models.session_scope() as session:
+        data_models.ConversationSession.get_by_id(
+            conversation_session.id, session
+        ).mark_as_completed(session)
+    assert [message.content for message in stored.stored] == ["How are you?", "Fine."]
+
+
+def test_buffered_history_flush_interval():
+    stored = CountingChatMessageHistory()
+    history = chatbot.BufferedChatMessageHistory(stored, flush_interval=0.01)
+    history.add_message(AIMessage(content="How are you?"))
+    deadline = time.monotonic() + 5
+    while not stored.stored and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(stored.stored) == 1 and history._timer is None
+
+
+@pytest.mark.parametrize("ended", [True, False])
+def test_speculative_end_detection(monkeypatch, patient_id, ended):
+    def detect_end(doctor_input, patient_input):
+        time.sleep(0.05)  # still running while the response is generated
+        return ended
+
+    monkeypatch.setattr(chatbot, "detect_end", detect_end)
+    doctor = chatbot.DialogueAgent(
+        patient_id,
+        model=FakeListChatModel(responses=["Any swelling?"]),
+        end_detection=True,
+        speculative_end_detection=True,
+        closing_message="Goodbye.",
+    )
+    doctor.send("Anything else?")
+
+    doctor.receive("No, that's all.")
+    assert doctor.generate_response() == ("Goodbye." if ended else "Any swelling?")
+    assert doctor.end_conversation is ended
+
+    # the speculative response is never shown when it is discarded
+    doctor.end_conversation = False
+    doctor.receive("No, that's all.")
+    chunks = list(doctor.stream_response())
+    if ended:
+        assert chunks == ["Goodbye."]
+    else:
+        assert "".join(chunks) == "Any swelling?"
+    assert doctor.get_history()[-1] == "Doctor: " + "".join(chunks)
+
+
+def test_async_speculative_end_detection(monkeypatch, patient_id):
+    async def adetect_end(doctor_input, patient_input):
+        await asyncio.sleep(0.05)
+        return True
+
+    monkeypatch.setattr(chatbot, "adetect_end", adetect_end)
+    doctor = chatbot.DialogueAgent(
+        patient_id,
+        model=FakeListChatModel(responses=["Any swelling?"]),
+        async_mode=True,
+        end_detection=True,
+        speculative_end_detection=True,
+        closing_message="Goodbye.",
+    )
+
+    async def converse():
+        await doctor.asend("Anything else?")
+        await doctor.areceive("No, that's all.")
+        return [chunk async for chunk in doctor.astream_response()]
+
+    assert asyncio.run(converse()) == ["Goodbye."]
+    assert doctor.end_conversation is True
@@ -0,0 +1,295 @@
+import concurrent.futures
+import datetime
+import gc
+import json
+import os
+
+import psutil
+import pytest
+from langchain_community.chat_message_histories import SQLChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import InvalidRequestError, TimeoutError
+from sqlalchemy.orm import Session, sessionmaker
+
+from reco_analysis.chatbot import chatbot
+from reco_analysis.data_model import data_models
+from reco_analysis.data_model.pool_metrics import MeteredQueuePool
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    data_models.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        provider = data_models.HealthcareProvider(
+            first_name="Mike", last_name="Khor", email="mike@example.com"
+        )
+        session.add(provider)
+        session.flush()
+        session.add(
+            data_models.Patient(
+                username="john",
+                first_name="John",
+                last_name="Doe",
+                email="john@example.com",
+                password="x",
+                healthcare_provider_id=provider.id,
+            )
+        )
+        session.commit()
+        yield session
+
+
+def add_session(session, patient, minutes_ago, completed):
+    conversation_session = data_models.ConversationSession(
+        patient_id=patient.id,
+        created_at=datetime.datetime(2024, 8, 1) - datetime.timedelta(minutes=minutes_ago),
+        completed=completed,
+        summary="{}",
+    )
+    session.add(conversation_session)
+    session.commit()
+    return conversation_session
+
+
+def test_latest_conversation_session(session):
+    patient = data_models.Patient.get_by_username("john", session)
+    assert patient.get_latest_conversation_session() is None
+
+    # inserted out of order, so the latest is not the last one loaded
+    latest = add_session(session, patient, 1, completed=True)
+    add_session(session, patient, 30, completed=False)
+    add_session(session, patient, 20, completed=True)
+
+    assert patient.get_latest_conversation_session().id == latest.id
+    assert patient.get_latest_conversation_session(incomplete_only=True).completed is False
+
+    headers = patient.get_recent_conversation_sessions(limit=2)
+    assert headers[0].id == latest.id
+    assert len(headers) == 2
+
+
+def test_recent_headers_do_not_load_messages(session):
+    patient = data_models.Patient.get_by_username("john", session)
+    add_session(session, patient, 1, completed=True)
+    patient_id = patient.id
+    session.expunge_all()
+
+    (header,) = data_models.ConversationSession.get_recent_headers(patient_id, session)
+    assert "summary" not in header.__dict__
+    with pytest.raises(InvalidRequestError):
+        header.messages
+
+
+def test_transcript_reads_plain_columns(session):
+    patient = data_models.Patient.get_by_username("john", session)
+    conversation_session = add_session(session, patient, 1, completed=False)
+    session_id = conversation_session.id
+    for message in [
+        AIMessage(content="How are you?", name="Doctor"),
+        HumanMessage(content="Fine."),
+    ]:
+        session.add(data_models.Message.from_message_dict(session_id, message_to_dict(message)))
+    session.commit()
+    messages = session.query(data_models.Message).order_by(data_models.Message.id).all()
+    assert [message.turn_index for message in messages] == [0, 1]
+    session.expunge_all()
+
+    statements = []
+    event.listen(
+        session.get_bind(),
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+    conversation_session = data_models.ConversationSession.get_by_id(session_id, session)
+    assert conversation_session.get_transcript() == ["Doctor: How are you?", "Patient: Fine."]
+    assert conversation_session.get_end_time() == max(message.timestamp for message in messages)
+    assert "messages" not in conversation_session.__dict__
+    assert not any("message_store.message " in statement for statement in statements)
+
+    # not backfilled
+    message = data_models.Message(
+        session_id=session_id, message=json.dumps(message_to_dict(AIMessage(content="Good.")))
+    )
+    assert message.as_transcript_line() == "Doctor: Good."
+
+
+def test_session_lookups_use_indexes(session):
+    patient = data_models.Patient.get_by_username("john", session)
+    patient_id, session_id = patient.id, add_session(session, patient, 1, completed=False).id
+    session.expunge_all()
+
+    queries = []
+    event.listen(
+        session.get_bind(),
+        "before_cursor_execute",
+        lambda conn, cursor, statement, parameters, *args: queries.append((statement, parameters)),
+    )
+    data_models.ConversationSession.get_latest(patient_id, session)
+    data_models.ConversationSession.get_by_id(session_id, session).get_transcript()
+
+    plans = {}
+    for statement, parameters in queries:
+        if statement.startswith("SELECT"):
+            rows = session.connection().exec_driver_sql(
+                "EXPLAIN QUERY PLAN " + statement, parameters
+            )
+            plans[statement] = " ".join(row[-1] for row in rows)
+    latest_plan, transcript_plan = [
+        next(plan for statement, plan in plans.items() if table in statement.split("FROM")[1])
+        for table in ["conversation_sessions", "message_store"]
+    ]
+    assert "ix_conversation_sessions_patient_id_created_at" in latest_plan
+    assert "ix_message_store_session_id_id" in transcript_plan
+    assert "TEMP B-TREE" not in latest_plan + transcript_plan  # no sort
+
+
+def test_session_scope(monkeypatch, session):
+    monkeypatch.setattr(data_models, "SESSION_FACTORY", sessionmaker(bind=session.get_bind()))
+    monkeypatch.setattr(data_models, "SCOPED_SESSION", None)
+
+    with data_models.session_scope() as scoped:
+        patient = data_models.Patient.get_by_username("john", scoped)
+        patient.first_name = "Johnny"
+    # committed, and still readable once detached
+    assert patient.first_name == "Johnny"
+    with pytest.raises(RuntimeError):
+        with data_models.session_scope() as scoped:
+            data_models.Patient.get_by_username("john", scoped).first_name = "Jack"
+            raise RuntimeError
+    session.expire_all()
+    assert data_models.Patient.get_by_username("john", session).first_name == "Johnny"
+
+    # one session per thread
+    def get_and_remove_session():
+        other_session = data_models.get_session()
+        data_models.remove_session()
+        return other_session
+
+    with concurrent.futures.ThreadPoolExecutor(1) as pool:
+        other_session = pool.submit(get_and_remove_session).result()
+    assert data_models.get_session() is data_models.get_session()
+    assert data_models.get_session() is not other_session
+    data_models.remove_session()
+
+
+def test_pool_metrics(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.sqlite'}",
+        poolclass=MeteredQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    MeteredQueuePool.metrics.reset()
+    with engine.connect():
+        with pytest.raises(TimeoutError):
+            engine.connect()
+    with engine.connect():
+        pass
+
+    metrics = MeteredQueuePool.metrics.snapshot()
+    assert (metrics["checkouts"], metrics["timeouts"]) == (2, 1)
+    assert metrics["max_wait_ms"] >= 100
+
+
+def simulate_conversation(engine, patient, turns):
+    """The database requests of one conversation: the agent's initialization at login, the chat
+    history reads and writes (through the chatbot's history classes), the end of the conversation
+    and the summary job."""
+    with data_models.session_scope() as session:
+        conversation_session = patient.get_latest_conversation_session(
+            session, incomplete_only=True
+        ) or data_models.ConversationSession.new_session(patient.id, session)
+    history = chatbot.CachedChatMessageHistory(
+        SQLChatMessageHistory(
+            session_id=conversation_session.id,
+            connection=engine,
+            session_id_field_name="session_id",
+            custom_message_converter=chatbot.CustomMessageConverter(),
+        )
+    )
+    for turn in range(turns):
+        history.add_messages(
+            [
+                AIMessage(content=f"How have you been feeling since yesterday? ({turn})"),
+                HumanMessage(content="A bit more tired, and my ankles are swollen. " * 10),
+            ]
+        )
+        assert len(history.messages) == 2 * (turn + 1)
+    with data_models.session_scope() as session:
+        data_models.ConversationSession.get_by_id(
+            conversation_session.id, session
+        ).mark_as_completed(session)
+    with data_models.session_scope() as session:
+        completed = data_models.ConversationSession.get_by_id(conversation_session.id, session)
+        assert len(completed.get_transcript()) == 2 * turns
+        assert completed.messages[-1].timestamp and completed.patient.first_name
+    data_models.remove_session()
+    return conversation_session
+
+
+def run_soak(monkeypatch, tmp_path, sessions):
+    """Simulates conversations of 20 patients, and returns the RSS growth after a warm-up, the
+    number of patients and the last conversation session."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'soak.sqlite'}")
+    data_models.Base.metadata.create_all(engine)
+    monkeypatch.setattr(data_models, "SESSION_FACTORY", sessionmaker(bind=engine))
+    monkeypatch.setattr(data_models, "SCOPED_SESSION", None)
+    with data_models.session_scope() as session:
+        provider = data_models.HealthcareProvider(
+            first_name="Mike", last_name="Khor", email="mike@example.com"
+        )
+        session.add(provider)
+        session.flush()
+        patients = [
+            data_models.Patient(
+                username=f"patient{i}",
+                first_name="John",
+                last_name="Doe",
+                email=f"patient{i}@example.com",
+                password="x",
+                healthcare_provider_id=provider.id,
+            )
+            for i in range(20)
+        ]
+        session.add_all(patients)
+
+    process = psutil.Process()
+    warm_up = sessions // 5
+    for i in range(sessions):
+        # like `st.session_state`, the patients and the latest conversation outlive the requests
+        conversation_session = simulate_conversation(engine, patients[i % len(patients)], turns=3)
+        if i == warm_up:
+            gc.collect()
+            baseline_rss = process.memory_info().rss
+
+    gc.collect()
+    return process.memory_info().rss - baseline_rss, len(patients), conversation_session
+
+
+def live_objects(cls):
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, cls))
+
+
+def test_sessions_release_objects(monkeypatch, tmp_path):
+    """A short run of the soak test below, checking that no ORM objects accumulate."""
+    _, patients, conversation_session = run_soak(monkeypatch, tmp_path, sessions=50)
+    assert live_objects(data_models.Message) == 0
+    assert live_objects(data_models.ConversationSession) <= 1 + patients
+    assert conversation_session.completed is not None
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(
+    not os.getenv("RECO_SOAK_SESSIONS"), reason="set RECO_SOAK_SESSIONS to run the soak test"
+)
+def test_soak_memory_stays_flat(monkeypatch, tmp_path):
+    """Simulates thousands of conversations, e.g. RECO_SOAK_SESSIONS=1000, and checks that neither
+    the ORM objects nor the resident memory accumulate."""
+    growth, patients, _ = run_soak(monkeypatch, tmp_path, int(os.environ["RECO_SOAK_SESSIONS"]))
+    # before counting the live objects, which allocates a list of all of them
+    assert growth < 10 * 2**20, f"RSS grew by {growth / 2**20:.1f} MB"
+    assert live_objects(data_models.Message) == 0
+    assert live_objects(data_models.ConversationSession) <= 1 + patients
@@ -0,0 +1,53 @@
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from reco_analysis.end_detector import classifier, end_detector
+
+
+def test_contains_closing_terms():
+    assert end_detector.contains_closing_terms("Okay, goodbye doctor!", end_detector.END_TERMS)
+    assert end_detector.contains_closing_terms("SEE YOU LATER", end_detector.END_TERMS)
+    assert not end_detector.contains_closing_terms("My legs are swollen.", end_detector.END_TERMS)
+    # whole words only
+    assert not end_detector.contains_closing_terms("I feel byzantine.", end_detector.END_TERMS)
+    assert not end_detector.contains_closing_terms(None, end_detector.END_TERMS)
+
+
+def test_end_detector_caches_verdicts():
+    calls = []
+
+    def fake_llm(inputs: dict) -> str:
+        calls.append(inputs)
+        return "True"
+
+    detector = end_detector.EndDetector(classifier_path=None)
+    detector.chain = RunnableLambda(fake_llm)
+
+    doctor = "Is there anything else you would like to share?"
+    patient = "No, I think that covers everything."
+    assert detector.detect(doctor, patient)
+    assert detector.detect(doctor.upper(), "  " + patient)
+    assert len(calls) == 1
+    assert detector.cache_hits == 1
+
+    # closing terms never reach the language model
+    assert detector.detect("Take care.", "Thanks!")
+    assert len(calls) == 1
+
+
+def test_end_detector_uses_confident_classifier_only():
+    pairs = [
+        ("Is there anything else you would like to share?", "No, that covers everything."),
+        ("Please contact your provider if anything changes.", "I will, thank you."),
+        ("What is your latest temperature reading?", "It was 98.2 this morning."),
+        ("What is your latest heart rate?", "My heart rate is 72 bpm."),
+    ]
+    labels = [True, True, False, False]
+
+    detector = end_detector.EndDetector(classifier_path=None, classifier_confidence=0.5)
+    detector._classifier = classifier.EndClassifier().fit(pairs, labels)
+    detector._classifier_loaded = True
+    detector.chain = RunnableLambda(lambda inputs: pytest.fail("the LLM should not be called"))
+
+    assert detector.detect(*pairs[0])
+    assert not detector.detect(*pairs[2])
@@ -0,0 +1,71 @@
+import json
+
+from langchain_core.runnables import RunnableLambda
+
+from reco_analysis.end_detector import extractor
+
+
+def make_transcript(n_lines: int) -> list[str]:
+    return ["Doctor: Hello Kevin, how are you feeling today?"] + [
+        f"Doctor: Question {i}?" if i % 2 == 0 else f"Patient: Answer {i}."
+        for i in range(1, n_lines)
+    ]
+
+
+def test_enumerate_transcript_window_keeps_original_numbering():
+    transcript = make_transcript(60)
+    transcript[21] = "Patient: No, that covers everything. Thank you, goodbye."
+    transcript[22] = "Doctor: Hello again, Kevin. How have you been feeling recently?"
+
+    assert extractor.find_candidate_end_lines(transcript) == [21]
+
+    text = extractor.enumerate_transcript_window(transcript, window=2)
+    assert text.splitlines() == [
+        "...",
+        "19: Patient: Answer 19.",
+        "20: Doctor: Question 20?",
+        "21: Patient: No, that covers everything. Thank you, goodbye.",
+        "22: Doctor: Hello again, Kevin. How have you been feeling recently?",
+        "23: Patient: Answer 23.",
+        "...",
+    ]
+
+
+def test_enumerate_transcript_window_falls_back_to_full_transcript():
+    transcript = make_transcript(10)
+    assert extractor.enumerate_transcript_window(transcript) == extractor.enumerate_transcript(
+        transcript
+    )
+
+
+def test_process_transcripts_batch_resumes_from_checkpoint(monkeypatch, tmp_path):
+    calls = []
+
+    def detect_end(inputs):
+        calls.append(inputs["transcript"])
+        if "Broken" in inputs["transcript"]:
+            raise ValueError("rate limited")
+        return "3"
+
+    monkeypatch.setattr(extractor, "create_chain", lambda: RunnableLambda(detect_end))
+    patients = {
+        key: {"id": i, "name": key, "prompt": "", "chat_transcript": make_transcript(8)}
+        for i, key in enumerate(["ann", "bob", "cid"])
+    }
+    patients["bob"]["chat_transcript"][1] = "Patient: Broken."
+    checkpoint_path = tmp_path / "checkpoint.jsonl"
+    checkpoint_path.write_text(
+        json.dumps({"key": "cid", "result": {"chat_transcript": ["done"]}}) + "\n" + '{"key": "tr'
+    )
+
+    processed = extractor.process_transcripts_batch(patients, str(checkpoint_path))
+
+    assert list(processed) == ["ann", "cid"]  # bob failed, cid was already processed
+    assert processed["ann"]["chat_transcript"] == make_transcript(8)[:4]
+    assert len(calls) == 2
+    assert list(extractor.load_checkpoint(str(checkpoint_path))) == ["cid", "ann"]
+
+    patients["bob"]["chat_transcript"][1] = "Patient: Fixed."
+    processed = extractor.process_transcripts_batch(patients, str(checkpoint_path))
+    assert list(processed) == ["ann", "bob", "cid"]
+    assert len(calls) == 3  # only bob was retried
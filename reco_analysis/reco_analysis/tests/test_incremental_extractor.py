@@ -0,0 +1,201 @@
+import functools
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from reco_analysis.data_model import data_models
+from reco_analysis.summarizer_app import (
+    incremental_extractor,
+    summarizer_engine,
+    summary_cache,
+    vitals_parser,
+)
+
+
+def test_parse_vitals_with_provenance():
+    transcript = [
+        "Doctor: Can you share your recent vital signs?",
+        "Patient: Temperature 98.0°F, heart rate 72 bpm, respiratory rate 18, oxygen saturation "
+        "92%, blood pressure 186/106.",
+        "Doctor: How many pillows do you sleep on?",
+        "Patient: I use 3 pillows.",
+        "Doctor: And what is your weight?",
+        "Patient: About 82 kg.",
+    ]
+    readings = vitals_parser.parse_transcript(transcript)
+    assert readings["heart_rate"].source_text(transcript) == "72 bpm"
+    assert readings["blood_pressure_systolic"].value == 186
+    assert readings["weight"].line_index == 5
+    assert vitals_parser.to_vital_signs(readings).to_dict() == {
+        "temperature": 98.0,
+        "heart_rate": 72,
+        "respiratory_rate": 18,
+        "oxygen_saturation": 92,
+        "blood_pressure_systolic": 186,
+        "blood_pressure_diastolic": 106,
+        "weight": 180.8,
+    }
+
+
+@pytest.mark.parametrize(
+    "doctor_line, patient_line, expected",
+    [
+        # the unit and "pulse ox" outrank "pulse"
+        ("Any readings today?", "My pulse ox reading is 95%.", {"oxygen_saturation": 95}),
+        ("What does the pulse oximeter say?", "It says 95.", {"oxygen_saturation": 95}),
+        ("Did you check your pulse?", "My pulse is 95.", {"heart_rate": 95}),
+        # not "sat" for saturation, nor durations and ages
+        ("What did you do today?", "I sat down for 60 minutes.", {}),
+        ("What is your heart rate?", "I am 72 years old, it is usually 80.", {"heart_rate": 80}),
+        ("What is your heart rate?", "I measured it 2 hours ago.", {}),
+        ("What are your sats?", "My sats are 93.", {"oxygen_saturation": 93}),
+    ],
+)
+def test_parse_vitals_ambiguous_numbers(doctor_line, patient_line, expected):
+    readings = vitals_parser.parse_transcript(
+        [f"Doctor: {doctor_line}", f"Patient: {patient_line}"]
+    )
+    assert {name: reading.value for name, reading in readings.items()} == expected
+
+
+def test_update_calls_llm_only_for_changed_sections():
+    model = FakeListChatModel(responses=['["Dyspnea when climbing stairs"]', '["unused"]'])
+    extractor = incremental_extractor.IncrementalExtractor(model=model)
+
+    extractor.update("What is your heart rate?", "It is 88.")
+    extractor.update("Any shortness of breath?", "Yes, when I climb stairs.")
+
+    partial_summary = extractor.partial_summary
+    assert partial_summary["current_symptoms"] == ["Dyspnea when climbing stairs"]
+    assert partial_summary["current_medications"] == []
+    assert partial_summary["exchanges"] == 2
+    assert model.i == 1  # one LLM call, for the symptoms only
+
+
+def test_small_talk_makes_no_llm_call():
+    model = FakeListChatModel(responses=["[]"])
+    extractor = incremental_extractor.IncrementalExtractor(model=model)
+
+    extractor.update("How are you feeling today?", "I'm doing well. My grandson visited.")
+    extractor.update("How has your week been?", "Pretty good, I feel rested.")
+    extractor.update("What is your heart rate?", "It is 88.")
+    assert model.i == 0
+    assert extractor.partial_summary["exchanges"] == 3
+
+    # the broader terms only count when the patient uses them
+    assert extractor.changed_sections("Anything else?", "I've been feeling tired.") == [
+        "current_symptoms"
+    ]
+    assert extractor.changed_sections("Any pain?", "No.") == []
+
+
+@pytest.mark.parametrize("vitals_mode, heart_rate", [("llm", 87), ("cross_check", 88)])
+def test_finalize_generates_only_narrative_and_vitals(vitals_mode, heart_rate):
+    transcript = ["Doctor: What is your heart rate?", "Patient: It is 88."]
+    partial_summary = {
+        **incremental_extractor.empty_partial_summary(),
+        "current_symptoms": ["Fatigue"],
+        "exchanges": 1,
+    }
+    model = FakeListChatModel(
+        responses=[
+            '{"patient_overview": "Overview.", "vital_signs": {"heart_rate": 87}, '
+            '"summary": "Summary."}'
+        ]
+    )
+
+    summary, _ = incremental_extractor.finalize(
+        transcript, partial_summary, model=model, vitals_mode=vitals_mode
+    )
+
+    assert summary.summary == "Summary."
+    assert summary.current_symptoms == ["Fatigue"]
+    assert summary.vital_signs.heart_rate == heart_rate
+    assert not incremental_extractor.covers({**partial_summary, "complete": False}, transcript)
+
+
+class NamedFakeListChatModel(FakeListChatModel):
+    """Named, so that its summaries can be cached."""
+
+    model_name: str = "fake"
+    temperature: float = 0.0
+
+
+def test_finalize_uses_cache(tmp_path):
+    transcript = ["Doctor: What is your heart rate?", "Patient: It is 88."]
+    partial_summary = {**incremental_extractor.empty_partial_summary(), "exchanges": 1}
+    cache = summary_cache.SummaryCache(tmp_path / "cache.sqlite")
+    model = NamedFakeListChatModel(
+        responses=['{"patient_overview": "Overview.", "summary": "Summary."}', "unused"]
+    )
+
+    first, _ = incremental_extractor.finalize(
+        transcript, partial_summary, model=model, cache=cache
+    )
+    second, response = incremental_extractor.finalize(
+        transcript, partial_summary, model=model, cache=cache
+    )
+    assert model.i == 1
+    assert response.response_metadata["cache_hit"]
+    assert first == second
+
+
+class WordCountChatModel(FakeListChatModel):
+    """Counts words instead of tokens, as counting tokens needs a tokenizer download."""
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(text.split())
+
+
+def test_finalize_uses_map_reduce_for_long_transcripts(monkeypatch):
+    transcript = []
+    for i in range(10):
+        transcript += ["Doctor: How are you feeling today?", f"Patient: Better than day {i}."]
+    partial_summary = {**incremental_extractor.empty_partial_summary(), "exchanges": 10}
+    model = WordCountChatModel(
+        responses=['{"patient_overview": "Overview.", "summary": "Summary."}']
+    )
+    monkeypatch.setattr(
+        summarizer_engine,
+        "summarize",
+        functools.partial(summarizer_engine.summarize, max_single_call_tokens=30, chunk_tokens=15),
+    )
+
+    summary, response = incremental_extractor.finalize(transcript, partial_summary, model=model)
+    assert response.response_metadata["map_reduce_chunks"] > 1
+    assert summary.summary == "Summary."
+
+
+def test_partial_summary_is_saved_and_resumed(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'extractor.sqlite'}")
+    data_models.Base.metadata.create_all(engine)
+    monkeypatch.setattr(data_models, "SESSION_FACTORY", sessionmaker(bind=engine))
+    with data_models.session_scope() as session:
+        provider = data_models.HealthcareProvider(
+            first_name="Mike", last_name="Khor", email="mike@example.com"
+        )
+        session.add(provider)
+        session.flush()
+        patient = data_models.Patient(
+            username="john",
+            first_name="John",
+            last_name="Doe",
+            email="john@example.com",
+            password="x",
+            healthcare_provider_id=provider.id,
+        )
+        session.add(patient)
+        session.flush()
+        conversation_session = data_models.ConversationSession.new_session(patient.id, session)
+
+    model = FakeListChatModel(responses=['["Dyspnea"]'])
+    extractor = incremental_extractor.IncrementalExtractor.for_session(conversation_session, model)
+    extractor.update("Any shortness of breath?", "Yes.")
+
+    with data_models.session_scope() as session:
+        saved = data_models.ConversationSession.get_by_id(conversation_session.id, session)
+        resumed = incremental_extractor.IncrementalExtractor.for_session(saved, model)
+    assert resumed.partial_summary["current_symptoms"] == ["Dyspnea"]
+    assert resumed.partial_summary["exchanges"] == 1
@@ -0,0 +1,118 @@
+import smtplib
+import socket
+import time
+from email.message import EmailMessage
+
+import pytest
+
+from reco_analysis.summarizer_app import post_office
+
+controller_module = pytest.importorskip("aiosmtpd.controller")
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.reject = set()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        session.host_name = hostname
+        self.connections += 1
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if any(f"Subject: {subject}".encode() in envelope.content for subject in self.reject):
+            return "550 Rejected"
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp_server():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    handler = RecordingHandler()
+    controller = controller_module.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    yield handler, controller
+    controller.stop()
+
+
+def make_message(i: int) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = f"Report {i}"
+    message["From"] = "reco@example.com"
+    message["To"] = "hcp@example.com"
+    message.set_content("Please find the report attached.")
+    return message
+
+
+def make_outbox(controller, **kwargs) -> post_office.Outbox:
+    settings = post_office.SMTPSettings(
+        server=controller.hostname,
+        port=controller.port,
+        starttls=False,
+        sender="reco@example.com",
+    )
+    return post_office.Outbox(settings, retry_backoff=0.0, **kwargs)
+
+
+def test_outbox_reuses_connection_and_reconnects(smtp_server):
+    handler, controller = smtp_server
+    with make_outbox(controller) as outbox:
+        for i in range(3):
+            outbox.send(make_message(i))
+        assert outbox.connections_opened == 1
+
+        outbox._connection.sock.shutdown(socket.SHUT_RDWR)  # the connection drops
+        outbox.send(make_message(3))
+
+    assert outbox.connections_opened == 2
+    assert [envelope.content.count(b"Report") for envelope in handler.messages] == [1] * 4
+
+
+def test_outbox_sends_at_rate(smtp_server):
+    handler, controller = smtp_server
+    with make_outbox(controller, rate_per_second=20) as outbox:
+        start = time.monotonic()
+        for i in range(5):
+            outbox.send(make_message(i))
+        assert time.monotonic() - start >= 4 / 20
+
+    assert len(handler.messages) == 5
+    assert outbox.connections_opened == 1
+
+
+def test_outbox_flush_sends_in_batches_at_rate(smtp_server):
+    handler, controller = smtp_server
+    with make_outbox(controller, rate_per_second=20, batch_size=2) as outbox:
+        for i in range(5):
+            outbox.enqueue(make_message(i))
+        start = time.monotonic()
+        assert outbox.flush() == 5
+        assert time.monotonic() - start >= 4 / 20
+        assert len(outbox) == 0
+
+    assert len(handler.messages) == 5
+    assert outbox.connections_opened == 1
+
+
+def test_outbox_flush_keeps_order_after_failure(smtp_server):
+    handler, controller = smtp_server
+    handler.reject.add("Report 2")
+    with make_outbox(controller, batch_size=2) as outbox:
+        for i in range(5):
+            outbox.enqueue(make_message(i))
+        with pytest.raises(smtplib.SMTPDataError):
+            outbox.flush()
+        assert len(outbox) == 3  # the failed message is back at the head
+
+        handler.reject.clear()
+        assert outbox.flush() == 3
+
+    subjects = [
+        envelope.content.split(b"Subject: ")[1].split(b"\r\n")[0] for envelope in handler.messages
+    ]
+    assert subjects == [f"Report {i}".encode() for i in range(5)]
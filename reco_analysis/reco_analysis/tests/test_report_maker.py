@@ -1,9 +1,19 @@
+import collections
 import datetime
 import os
+import time
+import types
+import zipfile
 
 import pytest
+from reportlab import rl_config
 
-from reco_analysis.summarizer_app import data_type, report_maker
+from reco_analysis.summarizer_app import (
+    data_type,
+    regenerate_reports,
+    report_maker,
+    report_store,
+)
 
 test_module_path = os.path.abspath(os.path.dirname(__file__))
 
@@ -45,3 +55,106 @@ def test_report_maker(summary_data, fake_transcript):
         conversation_end_time=datetime.datetime.now(),
         output_filename=test_module_path + "/test_report.pdf",
     )
+
+
+def test_report_renderer_reuse(summary_data, fake_transcript, monkeypatch):
+    built = collections.Counter()
+
+    def counting(name, factory):
+        def build(*args, **kwargs):
+            built[name] += 1
+            return factory(*args, **kwargs)
+
+        monkeypatch.setattr(report_maker, name, build)
+
+    counting("ImageReader", report_maker.ImageReader)
+    counting("ParagraphStyle", report_maker.ParagraphStyle)
+    # no timestamps or random document IDs, so that identical reports are identical bytes
+    monkeypatch.setattr(rl_config, "invariant", 1)
+
+    renderer = report_maker.ReportRenderer()
+    start_time = datetime.datetime(2024, 8, 1, 10, 0)
+    end_time = start_time + datetime.timedelta(minutes=20)
+    transcript = fake_transcript + ["Patient: My blood pressure was <120/80 & stable."]
+    built_once = dict(built)
+
+    first = renderer.render(summary_data, transcript, "John", "Doe", start_time, end_time)
+    second = renderer.render(summary_data, transcript, "John", "Doe", start_time, end_time)
+
+    assert built_once == {"ImageReader": 1, "ParagraphStyle": 2}
+    assert built == built_once  # rendering reuses the logo and the styles
+    assert first.startswith(b"%PDF")
+    assert first == second
+
+
+def test_report_store(summary_data, fake_transcript, tmp_path):
+    store = report_store.ReportStore(tmp_path)
+    args = (
+        summary_data,
+        fake_transcript,
+        "John",
+        "Doe",
+        datetime.datetime(2024, 8, 1, 10, 0),
+        datetime.datetime(2024, 8, 1, 10, 20),
+    )
+
+    first = report_maker.create_patient_report(*args, store=store)
+    second = report_maker.create_patient_report(*args, store=store)
+
+    assert first == second
+    assert store.stats() == {"hits": 1, "misses": 1, "entries": 1}
+    assert store.path_for(report_store.report_key(*args)).read_bytes() == first
+
+
+def test_report_store_is_opt_in_and_evicts_old_reports(monkeypatch, tmp_path):
+    monkeypatch.setattr(report_store, "DEFAULT_STORE", None)
+    monkeypatch.delenv("REPORT_STORE_PATH", raising=False)
+    assert report_store.get_default_store() is None
+
+    store = report_store.ReportStore(tmp_path, max_age=datetime.timedelta(days=7))
+    old_path = store.put("old", b"%PDF old")
+    week_ago = time.time() - 8 * 24 * 60 * 60
+    os.utime(old_path, (week_ago, week_ago))
+    assert store.get("old") is None
+
+    store.put("new", b"%PDF new")
+    assert not old_path.exists()
+    assert store.get("new") == b"%PDF new"
+    assert store.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def fake_session(session_id, summary_data, transcript):
+    """Stands in for a `ConversationSession` streamed from the database."""
+    start_time = datetime.datetime(2024, 8, 1, 10, 0)
+    return types.SimpleNamespace(
+        id=session_id,
+        summary=summary_data and summary_data.to_dict(),
+        transcript_summary=summary_data,
+        get_transcript=lambda: transcript,
+        patient=types.SimpleNamespace(first_name="John", last_name="Doe"),
+        created_at=start_time,
+        messages=[types.SimpleNamespace(timestamp=start_time + datetime.timedelta(minutes=20))],
+    )
+
+
+@pytest.mark.parametrize("output_name", ["reports", "reports.zip"])
+def test_regenerate_reports(summary_data, fake_transcript, tmp_path, output_name):
+    sessions = [
+        fake_session(1, summary_data, fake_transcript),
+        fake_session(2, None, fake_transcript),  # no stored summary
+        fake_session(3, summary_data, fake_transcript[:2]),
+    ]
+    writer = regenerate_reports.ReportWriter(tmp_path / output_name)
+    try:
+        stats = regenerate_reports.regenerate_reports(sessions, writer, workers=1)
+    finally:
+        writer.close()
+
+    assert (stats["written"], stats["skipped"], stats["failed"]) == (2, 1, 0)
+    filenames = ["Doe_John_20240801-1000_1.pdf", "Doe_John_20240801-1000_3.pdf"]
+    if output_name.endswith(".zip"):
+        with zipfile.ZipFile(tmp_path / output_name) as zip_file:
+            assert sorted(zip_file.namelist()) == filenames
+            assert zip_file.read(filenames[0]).startswith(b"%PDF")
+    else:
+        assert sorted(path.name for path in (tmp_path / output_name).iterdir()) == filenames
@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from reco_analysis.summarizer_app import (
+    summarizer_batch,
+    summarizer_engine,
+    summary_cache,
+)
+
+llm_output = {
+    "patient_overview": "Overview.",
+    "current_symptoms": ["Fatigue"],
+    "vital_signs": {"heart_rate": 88},
+    "current_medications": [],
+    "summary": "Summary.",
+}
+
+
+class FakeSummaryModel(FakeListChatModel):
+    """Summarizes any transcript the same way, except garbled ones, and counts its calls. Named so
+    that its summaries can be cached."""
+
+    model_name: str = "fake-summarizer"
+    temperature: float = 0.0
+    responses: list = []
+    calls: int = 0
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+        self.calls += 1
+        return "not JSON" if "garbled" in messages[-1].content else json.dumps(llm_output)
+
+
+def make_patients(*answers):
+    return {
+        str(i): {
+            "id": i,
+            "chat_transcript": ["Doctor: What is your heart rate?", f"Patient: {answer}"],
+        }
+        for i, answer in enumerate(answers)
+    }
+
+
+def test_summarize_batch_uses_cache_and_resumes(tmp_path):
+    cache = summary_cache.SummaryCache(tmp_path / "cache.sqlite")
+    patients = make_patients("It is 88.", "It is garbled.", "It is 92.")
+    # patient 0 was summarized before, e.g. by the summarizer job
+    summarizer_engine.summarize(
+        patients["0"]["chat_transcript"], model=FakeSummaryModel(), cache=cache, vitals_mode="llm"
+    )
+    progress_path = tmp_path / "summaries.jsonl"
+    model = FakeSummaryModel()
+
+    summaries, stats = asyncio.run(
+        summarizer_batch.summarize_batch(
+            patients, progress_path, model=model, vitals_mode="llm", cache=cache
+        )
+    )
+
+    assert model.calls == 2  # not for the cached transcript
+    assert (stats["summarized"], stats["cached"], stats["failed"]) == (2, 1, 1)
+    assert sorted(summaries) == sorted(summarizer_batch.load_progress(progress_path)) == ["0", "2"]
+    assert summaries["0"]["summary"]["current_symptoms"] == ["Fatigue"]
+
+    # the failed transcript is retried on the next run, and the others are not summarized again
+    patients["1"]["chat_transcript"][-1] = "Patient: It is 90."
+    model = FakeSummaryModel()
+    summaries, stats = asyncio.run(
+        summarizer_batch.summarize_batch(
+            patients, progress_path, model=model, vitals_mode="llm", cache=cache
+        )
+    )
+    assert model.calls == 1
+    assert (stats["summarized"], stats["failed"]) == (1, 0)
+    assert sorted(summaries) == ["0", "1", "2"]
@@ -0,0 +1,103 @@
+import json
+import re
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from reco_analysis.summarizer_app import summarizer_engine
+from reco_analysis.summarizer_app.prompts import (
+    system_message_summarize_json_no_vitals,
+    system_message_summarize_narrative_json,
+)
+
+transcript = [
+    "Doctor: Can you share your recent vital signs?",
+    "Patient: Temperature 98.0°F, heart rate 72 bpm, respiratory rate 18, oxygen saturation 92%, "
+    "blood pressure 186/106.",
+]
+llm_output = {
+    "patient_overview": "Overview.",
+    "current_symptoms": [],
+    "vital_signs": {
+        "temperature": 98.0,
+        "heart_rate": 27,  # misread by the LLM
+        "respiratory_rate": None,  # missed by the LLM
+        "oxygen_saturation": 92,
+        "blood_pressure_systolic": 186,
+        "blood_pressure_diastolic": 106,
+        "weight": None,
+    },
+    "current_medications": [],
+    "summary": "Summary.",
+}
+
+
+def test_cross_check_prefers_parsed_vitals():
+    model = FakeListChatModel(responses=[json.dumps(llm_output)])
+
+    summary, response = summarizer_engine.summarize(
+        transcript, model=model, vitals_mode="cross_check"
+    )
+
+    assert summary.vital_signs.heart_rate == 72
+    assert summary.vital_signs.respiratory_rate == 18
+    assert summary.vital_signs.weight is None
+    assert response.response_metadata["vital_signs_discrepancies"] == {
+        "heart_rate": {"llm": 27, "parsed": 72}
+    }
+    provenance = response.response_metadata["vital_signs_provenance"]["heart_rate"]
+    start, end = provenance["span"]
+    assert transcript[provenance["line_index"]][start:end] == "72 bpm"
+
+
+def test_parser_mode_skips_llm_vitals():
+    output = {key: value for key, value in llm_output.items() if key != "vital_signs"}
+    model = FakeListChatModel(responses=[json.dumps(output)])
+
+    summary, _ = summarizer_engine.summarize(transcript, model=model, vitals_mode="parser")
+
+    assert "vital_signs" not in system_message_summarize_json_no_vitals
+    narrative_prompt = summarizer_engine.prompt_for_vitals_mode(
+        system_message_summarize_narrative_json, "parser"
+    )
+    assert "vital_signs" not in narrative_prompt and '"summary"' in narrative_prompt
+    assert summary.vital_signs.blood_pressure_systolic == 186
+    assert summary.vital_signs.respiratory_rate == 18
+
+
+class FakeSummaryModel(FakeListChatModel):
+    """Summarizes by reporting the last heart rate stated in the input, counting words as tokens."""
+
+    responses: list = []
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(text.split())
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+        rates = re.findall(r"heart rate is (\d+)", messages[-1].content)
+        return json.dumps(
+            {
+                **llm_output,
+                "vital_signs": {"heart_rate": int(rates[-1]) if rates else None},
+            }
+        )
+
+
+def test_map_reduce_for_long_transcripts():
+    long_transcript = []
+    for i in range(20):
+        long_transcript += [
+            "Doctor: What is your heart rate?",
+            f"Patient: My heart rate is {60 + i}.",
+        ]
+    model = FakeSummaryModel()
+
+    chunks = summarizer_engine.chunk_transcript(long_transcript, model, chunk_tokens=12)
+    assert all(chunk[0].startswith("Doctor") for chunk in chunks)
+    assert sum(chunks, []) == long_transcript
+
+    summary, response = summarizer_engine.summarize(
+        long_transcript, model=model, vitals_mode="llm", max_single_call_tokens=50, chunk_tokens=12
+    )
+    assert response.response_metadata["map_reduce_chunks"] == len(chunks) > 8
+    assert summary.vital_signs.heart_rate == 79  # the latest chunk wins
+    assert summary.summary == "Summary."
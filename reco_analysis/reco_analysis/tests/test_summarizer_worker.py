@@ -0,0 +1,145 @@
+import datetime
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import sessionmaker
+
+from reco_analysis.data_model import data_models
+from reco_analysis.summarizer_app import summarizer_job, summarizer_worker
+
+# The job queue relies on postgres (`FOR UPDATE SKIP LOCKED`, interval arithmetic)
+pytestmark = pytest.mark.skipif(
+    not data_models.connection_env_vars_available(), reason="postgres is not configured"
+)
+
+
+@pytest.fixture
+def conversation_session_id(monkeypatch):
+    """A conversation session in a scratch schema, dropped at the end of the test."""
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    admin_engine = create_engine(data_models.DB_URL)
+    with admin_engine.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(data_models.DB_URL, connect_args={"options": f"-csearch_path={schema}"})
+    data_models.Base.metadata.create_all(engine)
+    monkeypatch.setattr(data_models, "SESSION_FACTORY", sessionmaker(bind=engine))
+    monkeypatch.setattr(data_models, "SCOPED_SESSION", None)
+    try:
+        with data_models.session_scope() as session:
+            provider = data_models.HealthcareProvider(
+                first_name="Mike", last_name="Khor", email="mike@example.com"
+            )
+            session.add(provider)
+            session.flush()
+            patient = data_models.Patient(
+                username="john",
+                first_name="John",
+                last_name="Doe",
+                email="john@example.com",
+                password="x",
+                healthcare_provider_id=provider.id,
+            )
+            session.add(patient)
+            session.flush()
+            conversation_session = data_models.ConversationSession.new_session(patient.id, session)
+        yield conversation_session.id
+    finally:
+        engine.dispose()
+        with admin_engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin_engine.dispose()
+
+
+def enqueue(conversation_session_id, max_attempts=2):
+    with data_models.session_scope() as session:
+        job = data_models.SummaryJob(
+            conversation_session_id=conversation_session_id, max_attempts=max_attempts
+        )
+        session.add(job)
+    return job.id
+
+
+def get_job(job_id):
+    with data_models.session_scope() as session:
+        return session.get(data_models.SummaryJob, job_id)
+
+
+def make_due(job_id, column="run_after"):
+    with data_models.session_scope() as session:
+        session.query(data_models.SummaryJob).filter(data_models.SummaryJob.id == job_id).update(
+            {column: func.now() - datetime.timedelta(hours=1)}
+        )
+
+
+def test_failed_job_is_retried_then_dead(conversation_session_id):
+    job_id = enqueue(conversation_session_id, max_attempts=2)
+
+    with data_models.session_scope() as session:
+        job = data_models.SummaryJob.claim_next(session)
+        assert (job.id, job.status, job.attempts) == (job_id, "running", 1)
+        # claimed jobs are not claimed again
+        assert data_models.SummaryJob.claim_next(session) is None
+        job.mark_as_failed("boom", session)
+    job = get_job(job_id)
+    assert (job.status, job.last_error) == ("pending", "boom")
+
+    # backing off
+    with data_models.session_scope() as session:
+        assert data_models.SummaryJob.claim_next(session) is None
+    make_due(job_id)
+    with data_models.session_scope() as session:
+        job = data_models.SummaryJob.claim_next(session)
+        assert job.attempts == 2
+        job.mark_as_failed("boom again", session)
+    assert get_job(job_id).status == "dead"
+
+
+def test_stale_job_is_reclaimed_until_max_attempts(conversation_session_id):
+    job_id = enqueue(conversation_session_id, max_attempts=2)
+
+    for attempts in [1, 2]:
+        with data_models.session_scope() as session:
+            job = data_models.SummaryJob.claim_next(session)
+            assert (job.id, job.attempts) == (job_id, attempts)
+        # the worker crashed without marking the job as done or failed
+        make_due(job_id, column="locked_at")
+
+    next_job_id = enqueue(conversation_session_id)
+    with data_models.session_scope() as session:
+        assert data_models.SummaryJob.claim_next(session).id == next_job_id
+    job = get_job(job_id)
+    assert (job.status, job.attempts) == ("dead", 2)
+    assert "did not finish" in job.last_error
+
+
+def test_skip_locked(conversation_session_id):
+    job_ids = {enqueue(conversation_session_id), enqueue(conversation_session_id)}
+    session_factory = data_models.get_session_factory()
+    with session_factory() as first, session_factory() as second:
+        # the first worker's transaction is still open while the second one claims
+        first_job = first.query(data_models.SummaryJob).with_for_update().first()
+        second_job = data_models.SummaryJob.claim_next(second)
+        assert {first_job.id, second_job.id} == job_ids
+        first.rollback()
+
+
+def test_worker_processes_jobs(monkeypatch, conversation_session_id):
+    processed = []
+
+    def summarize_conversation(conversation_session_id):
+        processed.append(conversation_session_id)
+        if len(processed) == 1:
+            raise RuntimeError("OpenAI is down")
+
+    monkeypatch.setattr(summarizer_job, "summarize_conversation", summarize_conversation)
+    job_id = enqueue(conversation_session_id)
+
+    assert summarizer_worker.process_next_job() is True
+    job = get_job(job_id)
+    assert job.status == "pending" and "OpenAI is down" in job.last_error
+    make_due(job_id)
+    assert summarizer_worker.process_next_job() is True
+    assert get_job(job_id).status == "done"
+    assert summarizer_worker.process_next_job() is False
+    assert processed == [conversation_session_id, conversation_session_id]
@@ -0,0 +1,96 @@
+import datetime
+import sqlite3
+
+from langchain_core.messages import AIMessage
+
+from reco_analysis.summarizer_app import data_type, summary_cache
+
+summary = data_type.TranscriptSummary(
+    patient_overview="Patient reports shortness of breath.",
+    current_symptoms=["Dyspnea when climbing stairs"],
+    vital_signs=data_type.VitalSigns(
+        temperature=98.0,
+        heart_rate=72,
+        respiratory_rate=18,
+        oxygen_saturation=92,
+        blood_pressure_systolic=186,
+        blood_pressure_diastolic=106,
+        weight=None,
+    ),
+    current_medications=["ACE inhibitor - Lisinopril"],
+    summary="Patient reports shortness of breath.",
+)
+
+
+def test_cache_key_normalizes_transcript():
+    transcript = ["Doctor: Hello  John.", "", "Patient:  Hi."]
+    key = summary_cache.cache_key(transcript, "gpt-3.5-turbo", 0.0, "prompt")
+    assert key == summary_cache.cache_key(
+        ["Doctor: Hello John.", "Patient: Hi."], "gpt-3.5-turbo", 0.0, "prompt"
+    )
+    assert key != summary_cache.cache_key(transcript, "gpt-4o-mini", 0.0, "prompt")
+    assert key != summary_cache.cache_key(transcript, "gpt-3.5-turbo", 0.7, "prompt")
+    assert key != summary_cache.cache_key(transcript, "gpt-3.5-turbo", 0.0, "other prompt")
+
+
+def test_summary_cache_roundtrip_and_eviction(tmp_path):
+    cache = summary_cache.SummaryCache(tmp_path / "cache.sqlite", max_entries=2)
+    response = AIMessage(content="{}", response_metadata={"model_name": "gpt-3.5-turbo"})
+
+    assert cache.get("a") is None
+    cache.put("a", summary, response)
+    cached_summary, cached_response = cache.get("a")
+    assert cached_summary == summary
+    assert cached_response.response_metadata == response.response_metadata
+
+    cache.put("b", summary, response)
+    cache.get("a")  # "b" is now the least recently used
+    cache.put("c", summary, response)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats() == {"hits": 3, "misses": 2, "entries": 2}
+
+
+def test_summary_cache_closes_connections(monkeypatch, tmp_path):
+    connections = []
+    sqlite3_connect = sqlite3.connect
+
+    def connect(*args, **kwargs):
+        connections.append(sqlite3_connect(*args, **kwargs))
+        return connections[-1]
+
+    monkeypatch.setattr(summary_cache.sqlite3, "connect", connect)
+    cache = summary_cache.SummaryCache(tmp_path / "cache.sqlite")
+    cache.put("a", summary, AIMessage(content="{}"))
+    assert cache.get("a") is not None and cache.get("b") is None
+    assert len(cache) == 1
+
+    assert len(connections) == 5
+    for connection in connections:
+        try:
+            connection.execute("SELECT 1")
+        except sqlite3.ProgrammingError:  # closed
+            continue
+        raise AssertionError("connection left open")
+
+
+def test_summary_cache_is_opt_in_and_expires_entries(monkeypatch, tmp_path):
+    monkeypatch.setattr(summary_cache, "DEFAULT_CACHE", None)
+    monkeypatch.delenv("SUMMARY_CACHE_PATH", raising=False)
+    assert summary_cache.get_default_cache() is None
+
+    cache = summary_cache.SummaryCache(
+        tmp_path / "cache.sqlite", max_age=datetime.timedelta(days=7)
+    )
+    response = AIMessage(content="{}")
+    cache.put("old", summary, response)
+    with cache._connect() as connection:
+        connection.execute("UPDATE summaries SET created = created - 8 * 24 * 60 * 60")
+    assert cache.get("old") is None
+
+    cache.put("new", summary, response)
+    assert len(cache) == 1
+    assert cache.get("new") is not None
+
+    monkeypatch.setenv("SUMMARY_CACHE_PATH", str(tmp_path / "default.sqlite"))
+    assert summary_cache.get_default_cache().path == tmp_path / "default.sqlite"
@@ -1,4 +1,5 @@
 import reco_analysis.config as config
+from pathlib import Path
 from typing import Literal
 
 DEFAULT_TIMESTAMP = ''
@@ -88,6 +89,24 @@ def compile_paths(
     # Return tuple
     return transcripts_path, transcripts_eval_path, transcripts_eval_improvements_path
 
+def summaries_path_for(transcripts_path) -> str:
+    """
+    Gets the summaries path matching a transcripts path created by `path_maker`, e.g.
+    'transcripts_short_gpt4o-m_basepat_basedoc.json' -> 'summaries_short_gpt4o-m_basepat_basedoc.json'.
+
+    Args:
+        transcripts_path (str): The path of the transcripts file (JSON or JSONL).
+
+    Returns:
+        str: The path of the matching summaries JSON file, in the summaries folder.
+    """
+    file_name = Path(transcripts_path).stem
+    if file_name.startswith('transcripts_'):
+        file_name = 'summaries_' + file_name[len('transcripts_'):]
+    else:
+        file_name = 'summaries_' + file_name
+    return f"{config.SUMMARIES_DIR}/{file_name}.json"
+
 if __name__ == '__main__':
     # Example usage of path_maker
     config_params = {